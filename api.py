@@ -0,0 +1,161 @@
+"""
+JSON API routes served next to the dashboard
+"""
+import json
+import os
+import re
+import flask
+import dash
+from config import RISK_TOP_LOCATIONS
+from report_jobs import FAILED, ReportJob
+
+REPORT_FILE_PATTERN = re.compile(r'^flood_report_[0-9_]+\.txt$')
+
+
+def stream_report_job(job: ReportJob) -> flask.Response:
+    """Server-sent events carrying a job's report chunks, then a final event with its status: 'error'
+    when the job failed, 'done' otherwise"""
+    def events():
+        for chunk in job.iter_chunks():
+            if chunk is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"data: {json.dumps(chunk)}\n\n"
+        event = 'error' if job.status == FAILED else 'done'
+        yield f"event: {event}\ndata: {json.dumps(job.to_dict())}\n\n"
+
+    return flask.Response(
+        flask.stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+def parse_bbox(value: str):
+    """Parse 'south,west,north,east' from a query parameter, aborting with 400 if malformed"""
+    try:
+        south, west, north, east = (float(part) for part in value.split(','))
+    except ValueError:
+        flask.abort(400, description="bbox must be 'south,west,north,east'")
+    return south, west, north, east
+
+
+def _float_arg(name: str) -> float:
+    value = flask.request.args.get(name, type=float)
+    if value is None:
+        flask.abort(400, description=f"missing or invalid '{name}'")
+    return value
+
+
+def scope_sensors(sensors, args, runs=None):
+    """Narrow a sensor set by the optional 'run' (comma-separated run ids, resolved through the run
+    registry), 'bbox', 'start' and 'end' (epoch seconds) query parameters"""
+    run = args.get('run')
+    if run and runs is not None:
+        sensors = runs.scope(sensors, run.split(','))
+    start, end = args.get('start', type=float), args.get('end', type=float)
+    if start is not None or end is not None:
+        sensors = sensors.window(start, end)
+    bbox = args.get('bbox')
+    if bbox:
+        sensors = sensors.take(sensors.spatial_index().bbox(*parse_bbox(bbox)))
+    return sensors
+
+
+def register_api_routes(app: dash.Dash) -> None:
+    """Register JSON endpoints that read the dashboard's current sensor set"""
+    server = app.server
+
+    @server.route('/api/sensors')
+    def sensors_in_view():
+        # The map generator, and folium with it, is imported on first use instead of at startup
+        from map_generator import sensor_point_rows
+        sensors = app.sensors_data
+        limit = flask.request.args.get('limit', type=int)
+        bbox = flask.request.args.get('bbox')
+        if bbox:
+            rows = sensors.spatial_index().bbox(*parse_bbox(bbox), limit=limit)
+        else:
+            rows = slice(0, limit)
+        points = sensor_point_rows(sensors.take(rows))
+        return flask.jsonify({'count': len(points), 'sensors': points})
+
+    @server.route('/api/sensors/near')
+    def sensors_near():
+        from map_generator import sensor_point_rows
+        sensors = app.sensors_data
+        rows, distances = sensors.spatial_index().radius(
+            _float_arg('lat'), _float_arg('lon'), _float_arg('radius_m'),
+            limit=flask.request.args.get('limit', type=int))
+        points = sensor_point_rows(sensors.take(rows))
+        for point, distance in zip(points, distances.tolist()):
+            point.append(round(distance, 1))
+        return flask.jsonify({'count': len(points), 'sensors': points})
+
+    def find_sensor(sensor_id: int):
+        """(store, row) of a sensor id, live or from a run loaded on demand; aborts with 404 if unknown"""
+        sensors = app.sensors_data
+        row = sensors.find(sensor_id)
+        if row is None:
+            # Sensors of runs loaded on demand carry ids outside the live range
+            found = app.runs.find(sensor_id)
+            if found is None:
+                flask.abort(404)
+            sensors, row = found
+        return sensors, row
+
+    @server.route('/api/sensors/<int:sensor_id>/popup')
+    def sensor_popup(sensor_id):
+        from map_generator import create_popup_html
+        sensors, row = find_sensor(sensor_id)
+        return flask.jsonify({'id': sensor_id, 'html': create_popup_html(sensors.record(row))})
+
+    @server.route('/api/sensors/<int:sensor_id>/report')
+    def sensor_report(sensor_id):
+        sensors, row = find_sensor(sensor_id)
+        report = app.pin_reports.lookup(sensors, row)
+        # Without background generation a missing report only appears once pin_reports.py is run
+        status = 'ready' if report else 'pending' if app.pin_reports.auto else 'not_generated'
+        response = flask.jsonify({'id': sensor_id, 'status': status, 'report': report})
+        response.cache_control.no_cache = True
+        return response
+
+    @server.route('/api/risk')
+    def risk_ranking():
+        from risk_analytics import camera_stability, top_risk_locations
+        sensors = scope_sensors(app.sensors_data, flask.request.args, app.runs)
+        limit = flask.request.args.get('limit', default=RISK_TOP_LOCATIONS, type=int)
+        return flask.jsonify({'frames': len(sensors), 'locations': top_risk_locations(sensors, limit),
+                              'cameras': camera_stability(sensors)})
+
+    @server.route('/api/runs')
+    def list_runs():
+        return flask.jsonify({'runs': app.runs.runs()})
+
+    @server.route('/api/reports/jobs/<job_id>')
+    def report_job_status(job_id):
+        job = app.report_jobs.get(job_id)
+        if job is None:
+            flask.abort(404)
+        return flask.jsonify(job.to_dict())
+
+    @server.route('/api/reports/jobs/<job_id>/stream')
+    def report_job_stream(job_id):
+        job = app.report_jobs.get(job_id)
+        if job is None:
+            flask.abort(404)
+        return stream_report_job(job)
+
+    @server.route('/api/reports/stream')
+    def report_stream():
+        stakeholder = flask.request.args.get('stakeholder', 'general')
+        regenerate = flask.request.args.get('regenerate') in ('1', 'true')
+        sensors = scope_sensors(app.sensors_data, flask.request.args, app.runs)
+        job_id = app.report_jobs.submit(sensors, stakeholder=stakeholder, regenerate=regenerate)
+        return stream_report_job(app.report_jobs.get(job_id))
+
+    @server.route('/reports/<filename>')
+    def download_report(filename):
+        if not REPORT_FILE_PATTERN.match(filename):
+            flask.abort(404)
+        return flask.send_from_directory(os.getcwd(), filename, as_attachment=True)
@@ -0,0 +1,30 @@
+// Streams a report job's chunks into the modal via server-sent events
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    reports: {
+        stream: function (jobId) {
+            var target = document.getElementById('report-stream');
+            if (!jobId || !target || !window.EventSource) {
+                return window.dash_clientside.no_update;
+            }
+            if (window._reportSource) {
+                window._reportSource.close();
+            }
+            target.textContent = '';
+            var source = new EventSource('/api/reports/jobs/' + jobId + '/stream');
+            window._reportSource = source;
+            source.onmessage = function (event) {
+                target.textContent += JSON.parse(event.data);
+                target.scrollTop = target.scrollHeight;
+            };
+            source.addEventListener('done', function () { source.close(); });
+            // Named 'error' events carry the failed job; connection errors carry no data
+            source.addEventListener('error', function (event) {
+                if (event.data) {
+                    target.textContent += '\n\nReport generation failed: ' + JSON.parse(event.data).error;
+                }
+                source.close();
+            });
+            return jobId;
+        }
+    }
+});
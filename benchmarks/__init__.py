@@ -0,0 +1,3 @@
+"""
+Benchmarks for the Flood Monitoring Dashboard; run from the project root with python -m benchmarks.<name>
+"""
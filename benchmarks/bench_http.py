@@ -0,0 +1,126 @@
+"""
+HTTP benchmark: throughput and latency of /map, image and popup routes under concurrent load
+
+The dashboard is built over a synthetic run and served in-process by a threaded WSGI server; the
+LLM backend is stubbed and no background work is started.
+
+Usage: python -m benchmarks.bench_http [--frames 1000] [--concurrency 1 8 32] [--requests 400]
+                                       [--output results.json]
+"""
+import argparse
+import itertools
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from werkzeug.serving import make_server
+from benchmarks.harness import StubBackend, latency_stats, write_results
+from benchmarks.synthetic import write_detection_run
+from llm_backends import set_backend
+
+RUN_DIR = "video_results_bench"
+
+
+def fetch(url: str) -> int:
+    """GET a URL accepting gzip and return the number of body bytes received"""
+    request = urllib.request.Request(url, headers={'Accept-Encoding': 'gzip'})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return len(response.read())
+
+
+def run_load(base_url: str, paths: List[str], concurrency: int, requests: int) -> Dict:
+    """Issue requests GETs cycling over paths from concurrency client threads"""
+    latencies, errors, received = [], 0, 0
+    lock = threading.Lock()
+    urls = itertools.cycle(paths)
+
+    def one(url):
+        nonlocal errors, received
+        start = time.perf_counter()
+        try:
+            size = fetch(url)
+        except OSError:
+            with lock:
+                errors += 1
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            received += size
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in executor.map(one, [base_url + next(urls) for _ in range(requests)]):
+            pass
+    wall_s = time.perf_counter() - start
+    return {
+        'requests': requests,
+        'errors': errors,
+        'wall_s': wall_s,
+        'requests_per_s': len(latencies) / wall_s,
+        'bytes_per_request': received / len(latencies) if latencies else 0,
+        **latency_stats(latencies),
+    }
+
+
+def bench_http(frames: int, concurrency_levels, requests: int, image_size=(1280, 720)):
+    """Serve the dashboard over a synthetic run and load each route at each concurrency level"""
+    from main import create_app
+
+    set_backend(StubBackend())
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        run_dir = os.path.join(tmp_dir, RUN_DIR)
+        records = write_detection_run(run_dir, frames, image_size=image_size)
+        app = create_app(single_process=True, data_root=tmp_dir, roots=[run_dir],
+                         manifest_path=os.path.join(tmp_dir, "manifest.json"),
+                         snapshot_dir=os.path.join(tmp_dir, "snapshots"),
+                         run_index_path=os.path.join(tmp_dir, "runs.json"))
+        server = make_server('127.0.0.1', 0, app.server, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, name="bench-http", daemon=True)
+        thread.start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        ids = [record['id'] for record in records[:200]]
+        targets = {
+            'map': ['/map'],
+            'thumb': [f"/img/thumb/{RUN_DIR}/{i}.png" for i in ids],
+            'original': [f"/data/{RUN_DIR}/{i}.png" for i in ids],
+            'popup': [f"/api/sensors/{i}/popup" for i in ids],
+        }
+        try:
+            for target, paths in targets.items():
+                # Warm caches (rendered map, thumbnails) so steady-state serving is measured
+                run_load(base_url, paths, 8, len(paths))
+                for concurrency in concurrency_levels:
+                    results.append({'target': target, 'frames': frames, 'concurrency': concurrency,
+                                    **run_load(base_url, paths, concurrency, requests)})
+        finally:
+            server.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = bench_http(args.frames, args.concurrency, args.requests)
+    print(f"{'target':<9} {'conc':>5} {'req/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'KB/req':>8} {'errors':>7}")
+    for row in results:
+        print(f"{row['target']:<9} {row['concurrency']:>5} {row['requests_per_s']:>8.1f} "
+              f"{row['p50_ms'] or 0:>9.1f} {row['p95_ms'] or 0:>9.1f} {row['p99_ms'] or 0:>9.1f} "
+              f"{row['bytes_per_request'] / 1024:>8.1f} {row['errors']:>7}")
+    if args.output:
+        write_results(args.output, {'http': results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Ingestion benchmark: parse time of synthetic detection runs, cold and from binary snapshots
+
+Usage: python -m benchmarks.bench_ingest [--counts 10 1000 10000] [--workers 8] [--output results.json]
+"""
+import argparse
+import os
+import tempfile
+from benchmarks.harness import best_of, write_results
+from benchmarks.synthetic import write_detection_run
+from config import LOADER_WORKERS
+from data_loader import LoadReport, load_sensor_store
+from sensor_watcher import SensorWatcher
+
+
+def bench_ingest(counts, workers: int = LOADER_WORKERS, repeat: int = 3, image_size=(64, 36)):
+    """Time a full parse and a snapshot-backed watcher start per run size
+
+    'parse' is load_sensor_store over every JSON file; 'cold_start' is the watcher's first load,
+    which also writes the manifest and snapshot; 'warm_start' is a restart that maps the snapshot.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for count in counts:
+            run_dir = os.path.join(tmp_dir, f"video_results_{count}")
+            write_detection_run(run_dir, count, image_size=image_size)
+            files_bytes = sum(entry.stat().st_size for entry in os.scandir(run_dir) if entry.name.endswith('.json'))
+
+            report = LoadReport()
+            parse_s, store = best_of(lambda: load_sensor_store([run_dir], workers=workers, report=report), repeat)
+            results.append({'phase': 'parse', 'frames': count, 'seconds': parse_s,
+                            'frames_per_s': count / parse_s, 'json_bytes': files_bytes,
+                            'failures': len(report.failures)})
+
+            state = {'roots': [run_dir], 'manifest_path': os.path.join(tmp_dir, f"manifest_{count}.json"),
+                     'snapshot_dir': os.path.join(tmp_dir, f"snapshots_{count}"), 'workers': workers}
+            cold_s, _ = best_of(lambda: SensorWatcher(on_update=lambda *_: None, **state).initial_load(), 1)
+            results.append({'phase': 'cold_start', 'frames': count, 'seconds': cold_s,
+                            'frames_per_s': count / cold_s})
+            warm_s, _ = best_of(lambda: SensorWatcher(on_update=lambda *_: None, **state).initial_load(), repeat)
+            results.append({'phase': 'warm_start', 'frames': count, 'seconds': warm_s,
+                            'frames_per_s': count / warm_s})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--workers', type=int, default=LOADER_WORKERS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = bench_ingest(args.counts, workers=args.workers, repeat=args.repeat)
+    print(f"{'phase':<11} {'frames':>8} {'seconds':>9} {'frames/s':>10}")
+    for row in results:
+        print(f"{row['phase']:<11} {row['frames']:>8} {row['seconds']:>9.3f} {row['frames_per_s']:>10.0f}")
+    if args.output:
+        write_results(args.output, {'ingest': results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Map rendering benchmark: HTML size and build time against marker count for both map modes
+
+Usage: python -m benchmarks.bench_map [--counts 25 100 1000] [--output results.json]
+"""
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.harness import write_results
+from benchmarks.synthetic import synthetic_records
+from map_generator import generate_map
+from sensor_store import SensorStore
+
+
+def bench_map(counts, modes=('markers', 'cluster'), repeat: int = 3):
+    """Time generate_map per mode and marker count, returning one result row per combination"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for count in counts:
+            sensors = SensorStore.from_records(synthetic_records(count))
+            for mode in modes:
+                output_file = os.path.join(tmp_dir, f"map_{mode}_{count}.html")
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    generate_map(sensors, output_file=output_file, mode=mode)
+                    timings.append(time.perf_counter() - start)
+                results.append({
+                    'mode': mode,
+                    'markers': count,
+                    'build_s': min(timings),
+                    'html_bytes': os.path.getsize(output_file),
+                })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--counts', type=int, nargs='+', default=[25, 100, 500, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = bench_map(args.counts, repeat=args.repeat)
+    print(f"{'mode':<8} {'markers':>8} {'build (s)':>10} {'HTML (KB)':>10}")
+    for row in results:
+        print(f"{row['mode']:<8} {row['markers']:>8} {row['build_s']:>10.3f} {row['html_bytes'] / 1024:>10.1f}")
+    if args.output:
+        write_results(args.output, {'map': results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Prompt benchmark: risk scoring, report context and prompt construction time and size, and stubbed
+report generation
+
+Usage: python -m benchmarks.bench_prompt [--counts 10 1000 10000 100000] [--output results.json]
+"""
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.harness import StubBackend, best_of, write_results
+from benchmarks.synthetic import synthetic_records
+from llm_backends import set_backend
+from llm_report import (STAKEHOLDER_PROMPTS, build_report_context, build_report_prompt, generate_report_stream,
+                        set_report_store)
+from prompt_compaction import estimate_tokens
+from risk_analytics import camera_stability, score_risk, top_risk_locations
+from report_store import ReportStore
+from sensor_store import SensorStore
+
+
+def time_report(sensors: SensorStore):
+    """(time to first chunk, total seconds) of one uncached report"""
+    start = time.perf_counter()
+    first = None
+    for _ in generate_report_stream(sensors, regenerate=True):
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def bench_prompt(counts, repeat: int = 3, chunk_delay_s: float = 0.0):
+    """Time risk scoring, context and prompt construction per sensor count, and a full report through the
+    stub backend"""
+    set_backend(StubBackend(chunk_delay_s=chunk_delay_s))
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        set_report_store(ReportStore(os.path.join(tmp_dir, "reports.sqlite3")))
+        for count in counts:
+            sensors = SensorStore.from_records(synthetic_records(count))
+            sensors.time_index()
+            risk_s, _ = best_of(lambda: score_risk(sensors), repeat)
+            ranking_s, _ = best_of(lambda: (top_risk_locations(sensors), camera_stability(sensors)), repeat)
+            context_s, context = best_of(lambda: build_report_context(sensors), repeat)
+            prompts_s, _ = best_of(lambda: [build_report_prompt(context, stakeholder)
+                                            for stakeholder in STAKEHOLDER_PROMPTS], repeat)
+            _, prompt, _ = build_report_prompt(context)
+            first_chunk_s, report_s = min(time_report(sensors) for _ in range(repeat))
+            results.append({
+                'frames': count,
+                'risk_s': risk_s,
+                'risk_ranking_s': ranking_s,
+                'context_s': context_s,
+                'all_prompts_s': prompts_s,
+                'prompt_chars': len(prompt),
+                'prompt_tokens': estimate_tokens(prompt),
+                'report_first_chunk_s': first_chunk_s,
+                'report_s': report_s,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help="Stub LLM delay per streamed chunk")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = bench_prompt(args.counts, repeat=args.repeat, chunk_delay_s=args.chunk_delay)
+    print(f"{'frames':>8} {'risk (ms)':>10} {'context (s)':>12} {'prompts (s)':>12} {'tokens':>8} {'report (s)':>11}")
+    for row in results:
+        print(f"{row['frames']:>8} {row['risk_s'] * 1000:>10.1f} {row['context_s']:>12.3f} {row['all_prompts_s']:>12.4f} "
+              f"{row['prompt_tokens']:>8} {row['report_s']:>11.3f}")
+    if args.output:
+        write_results(args.output, {'prompt': results})
+
+
+if __name__ == "__main__":
+    main()
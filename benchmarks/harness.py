@@ -0,0 +1,130 @@
+"""
+Shared benchmark helpers: timing, run metadata, a stub LLM backend and machine-readable results
+"""
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from llm_backends import LLMBackend
+
+
+def best_of(fn: Callable, repeat: int = 3) -> Tuple[float, object]:
+    """(fastest wall-clock seconds, result of the last call) over repeat calls"""
+    timings, result = [], None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def latency_stats(latencies: List[float]) -> Dict[str, Optional[float]]:
+    """Mean and p50/p95/p99 in milliseconds"""
+    if not latencies:
+        return {'mean_ms': None, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    values = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'mean_ms': float(values.mean()), 'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+
+def git_revision() -> Dict[str, Optional[object]]:
+    """Commit hash and whether the working tree has uncommitted changes"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def environment() -> Dict:
+    """Metadata recorded with every result file so runs can be compared across commits and machines"""
+    return {
+        **git_revision(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'argv': sys.argv[1:],
+    }
+
+
+def write_results(path: str, results: Dict) -> None:
+    """Write results with the environment metadata as JSON"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+
+
+class StubBackend(LLMBackend):
+    """Deterministic canned completions with a fixed per-chunk delay; no network or API key
+
+    The text depends only on the prompt, so repeated runs produce identical reports.
+    """
+
+    model = "stub"
+
+    def __init__(self, words: int = 600, chunk_words: int = 8, chunk_delay_s: float = 0.0):
+        self.words = words
+        self.chunk_words = chunk_words
+        self.chunk_delay_s = chunk_delay_s
+
+    def _words(self, prompt: str) -> List[str]:
+        digest = hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+        vocabulary = ["flood", "sensor", "humidity", "pressure", "field", "drainage", "risk", "level",
+                      "camera", "anomaly", "baseline", "recommend", "monitor", "area", digest[:8]]
+        words = [vocabulary[(i * 7 + int(digest[i % 40], 16)) % len(vocabulary)] for i in range(self.words)]
+        for i in range(0, len(words), 80):
+            words[i] = f"\n\n## Section {i // 80 + 1}\n\n{words[i]}"
+        return words
+
+    def complete(self, system_prompt: str, prompt: str, temperature: float = 0.3,
+                 max_tokens: int = 2500) -> str:
+        return "".join(self.stream(system_prompt, prompt, temperature, max_tokens))
+
+    def stream(self, system_prompt: str, prompt: str, temperature: float = 0.3,
+               max_tokens: int = 2500) -> Iterator[str]:
+        words = self._words(prompt)
+        for start in range(0, len(words), self.chunk_words):
+            if self.chunk_delay_s:
+                time.sleep(self.chunk_delay_s)
+            yield " ".join(words[start:start + self.chunk_words]) + " "
+
+
+# Fields that identify a result row rather than measure it
+LABEL_FIELDS = ('phase', 'mode', 'target', 'frames', 'markers', 'concurrency')
+
+
+def compare_results(old: Dict, new: Dict) -> List[Dict]:
+    """Pair the numeric metrics of two result files, matching rows by suite and label fields"""
+    def index(results):
+        return {(suite, tuple((k, row.get(k)) for k in LABEL_FIELDS)): row
+                for suite, rows in results['results'].items() for row in rows}
+
+    old_rows = index(old)
+    comparison = []
+    for key, row in index(new).items():
+        previous = old_rows.get(key)
+        if previous is None:
+            continue
+        for metric, value in row.items():
+            before = previous.get(metric)
+            if (metric in LABEL_FIELDS or isinstance(value, bool)
+                    or not isinstance(value, (int, float)) or not isinstance(before, (int, float))):
+                continue
+            comparison.append({
+                'suite': key[0],
+                'labels': {k: v for k, v in key[1] if v is not None},
+                'metric': metric,
+                'old': before,
+                'new': value,
+                'change': (value - before) / before if before else None,
+            })
+    return comparison
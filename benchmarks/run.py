@@ -0,0 +1,78 @@
+"""
+Benchmark suite: ingestion, map build, prompt construction and HTTP serving in one machine-readable result
+
+Usage: python -m benchmarks.run [--sizes 10 1000 10000 100000] [--suites ingest map prompt http]
+                                [--http-frames 1000] [--output results.json] [--compare baseline.json]
+
+Each result file records the commit, machine and arguments next to the numbers; --compare prints the
+relative change of every metric against an earlier file, e.g. one written on the main branch.
+"""
+import argparse
+import json
+from benchmarks.bench_http import bench_http
+from benchmarks.bench_ingest import bench_ingest
+from benchmarks.bench_map import bench_map
+from benchmarks.bench_prompt import bench_prompt
+from benchmarks.harness import compare_results, environment, write_results
+
+SUITES = ['ingest', 'map', 'prompt', 'http']
+
+# One folium marker per sensor stops being practical beyond this many frames
+MARKER_MODE_MAX_FRAMES = 1000
+
+
+def run_suites(suites, sizes, http_frames: int, concurrency, requests: int, repeat: int):
+    results = {}
+    if 'ingest' in suites:
+        results['ingest'] = bench_ingest(sizes, repeat=repeat)
+    if 'map' in suites:
+        results['map'] = (bench_map([n for n in sizes if n <= MARKER_MODE_MAX_FRAMES], modes=('markers',),
+                                    repeat=repeat)
+                          + bench_map(sizes, modes=('cluster',), repeat=repeat))
+    if 'prompt' in suites:
+        results['prompt'] = bench_prompt(sizes, repeat=repeat)
+    if 'http' in suites:
+        results['http'] = bench_http(http_frames, concurrency, requests)
+    return results
+
+
+def print_comparison(comparison, threshold: float) -> None:
+    """One line per metric; changes beyond the threshold are marked"""
+    print(f"\n{'suite':<7} {'labels':<40} {'metric':<22} {'old':>12} {'new':>12} {'change':>8}")
+    for row in comparison:
+        labels = " ".join(f"{k}={v}" for k, v in row['labels'].items())
+        change = row['change']
+        marker = " *" if change is not None and abs(change) > threshold else ""
+        change_text = f"{change:+.1%}" if change is not None else "n/a"
+        print(f"{row['suite']:<7} {labels:<40} {row['metric']:<22} {row['old']:>12.4g} {row['new']:>12.4g} "
+              f"{change_text:>8}{marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=SUITES)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000, 100000])
+    parser.add_argument('--http-frames', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default="benchmark_results.json", help="Write results as JSON to this file")
+    parser.add_argument('--compare', help="Earlier result file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Relative change marked with *")
+    args = parser.parse_args()
+
+    results = run_suites(args.suites, args.sizes, args.http_frames, args.concurrency, args.requests, args.repeat)
+    write_results(args.output, results)
+    print(f"✓ Results for {environment()['commit'] or 'unknown commit'} written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.output, 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        print(f"Compared with {baseline['environment'].get('commit') or args.compare}:")
+        print_comparison(compare_results(baseline, current), args.threshold)
+
+
+if __name__ == "__main__":
+    main()
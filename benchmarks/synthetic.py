@@ -0,0 +1,157 @@
+"""
+Synthetic sensor records shaped like data_loader output, and detection runs written to disk
+"""
+import io
+import json
+import os
+import random
+import shutil
+from typing import Dict, List, Tuple
+from config import FYN_ISLAND_CENTER
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def synthetic_records(count: int, seed: int = 0, cameras: int = 4) -> List[Dict]:
+    """Fabricate sensor records scattered around Fyn Island"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(1, count + 1):
+        prediction = rng.choices([0, 1, 2], weights=[6, 3, 1])[0]
+        image_score = rng.uniform(0.0, 0.3) + 0.3 * prediction
+        sensor_boost = rng.choice([0.0, 0.04, 0.08])
+        temperature, humidity, pressure = rng.gauss(12, 3), rng.gauss(85, 6), rng.gauss(1000, 8)
+        model_tier = rng.choice(['nano', 'nano', 'small', 'large'])
+        backend = rng.choice(['local', 'local', 'remote'])
+        cold_start = rng.random() < 0.05
+        inference = rng.uniform(0.2, 1.5) * {'nano': 1, 'small': 2, 'large': 4}[model_tier] + 2.0 * cold_start
+        records.append({
+            'id': i,
+            'location': (FYN_ISLAND_CENTER[0] + rng.uniform(-0.25, 0.25),
+                         FYN_ISLAND_CENTER[1] + rng.uniform(-0.45, 0.45)),
+            'timestamp': f"2025-12-05T17:{(i // 60) % 60:02d}:{i % 60:02d}",
+            'camera_id': f"video_camera_{i % cameras + 1:02d}",
+            'run_id': "synthetic-run",
+            'run_dir': "video_results_synthetic",
+            'capture_ts': 1764951162.0 + i * 0.5,
+            'video_timestamp_sec': i * 0.5,
+            'sensor_baseline': {'temperature_baseline': 17.0, 'humidity_baseline': 78.0,
+                                'pressure_baseline': 1016.0},
+            'sensor_data': {'temperature': temperature, 'humidity': humidity, 'pressure': pressure},
+            'sensor_anomalies': {'delta_temperature': temperature - 17.0, 'delta_humidity': humidity - 78.0,
+                                 'delta_pressure': pressure - 1016.0},
+            'prediction': prediction,
+            'scores': {'combined_score': min(1.0, image_score + sensor_boost), 'image_score': image_score,
+                       'sensor_boost': sensor_boost, 'sensor_prediction': 'wet'},
+            'state': f"S{prediction}",
+            'model_tier': model_tier,
+            'backend': backend,
+            'timing': {
+                'queue_wait_s': rng.expovariate(1 / 0.05),
+                'fsm_infer_dispatch_s': inference + 0.03,
+                'backend_inference_s': inference,
+                'backend_inference_cold_start': float(cold_start),
+                'collector_capture_to_processor_receive_s': rng.lognormvariate(0, 0.8),
+                'total_pipeline_latency_s': inference + rng.uniform(0.05, 0.3),
+            },
+            'flags': {'flapping': rng.random() < 0.03, 'drift': rng.random() < 0.01, 'conflict': rng.random() < 0.02},
+            'image_file': f"video_results_synthetic/{i}.png",
+            'source_file': f"video_results_synthetic/{i}.json",
+        })
+    return records
+
+
+def detection_document(record: Dict) -> Dict:
+    """Raw detection JSON, as written by the edge pipeline, that extract_sensor_data turns back into record"""
+    timing = dict(record['timing'])
+    # Pad the timing block with the per-stage fields real files carry, so documents are realistically sized
+    inference = timing['backend_inference_s']
+    timing.update({
+        'json_parse_s': 0.0007,
+        'validation_storage_s': 0.0027,
+        'inference_s': inference + 0.04,
+        'backend_preprocess_s': 0.03,
+        'backend_compute_s': inference + 0.03,
+        'backend_total_runtime_s': inference + 0.035,
+        'backend_mqtt_wait_response_s': inference + 0.04,
+        'fsm_baseline_lookup_s': 4.5e-06,
+        'fsm_state_transition_s': 3.5e-05,
+        'fsm_tier_selection_s': 1.5e-05,
+        'fsm_total_s': timing['fsm_infer_dispatch_s'] + 0.003,
+        'result_save_s': 0.0019,
+        'collector_capture_ts': record['capture_ts'],
+    })
+    return {
+        'sensor_data': record['sensor_data'],
+        'metadata': {
+            'timestamp': record['timestamp'],
+            'location': f"{record['location'][0]:.4f}, {record['location'][1]:.4f}",
+            'camera_id': record['camera_id'],
+            'motion': "slow",
+            'resource_constrained': False,
+            'collector_capture_ts': record['capture_ts'],
+            'video_timestamp_sec': record['video_timestamp_sec'],
+            'video_file': "synthetic.mp4",
+            'run_id': record['run_id'],
+            'sensor_baseline': record['sensor_baseline'],
+            'sensor_data': record['sensor_data'],
+            'sensor_anomalies': record['sensor_anomalies'],
+        },
+        'classification_result': {
+            'frame_index': record['id'],
+            'state': record['state'],
+            'model_tier': record['model_tier'],
+            'prediction': record['prediction'],
+            'scores': record['scores'],
+            'counters': {'high': 0, 'low': 0, 'ambiguous': 0, 'conflict': 0, 'mid': 0},
+            'llm_used': False,
+            **record['flags'],
+            'backend': record['backend'],
+            'timing': {key: value for key, value in timing.items() if key.startswith('backend_')},
+        },
+        'timing': timing,
+    }
+
+
+def synthetic_png(size: Tuple[int, int], seed: int) -> bytes:
+    """Noise PNG; noise barely compresses, so a 1280x720 frame is about as large as a real one"""
+    rng = random.Random(seed)
+    image = Image.frombytes('RGB', size, rng.randbytes(size[0] * size[1] * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def write_detection_run(directory: str, count: int, seed: int = 0, image_size: Tuple[int, int] = (1280, 720),
+                        distinct_images: int = 8) -> List[Dict]:
+    """Write count detection JSON files and PNGs into directory and return their records
+
+    Only distinct_images PNGs are encoded; the other frames are hard links to them (copies where
+    links are unsupported), so 100k-frame runs fit on disk.
+    """
+    os.makedirs(directory, exist_ok=True)
+    records = synthetic_records(count, seed=seed)
+    images = []
+    if Image is not None:
+        for n in range(min(distinct_images, count)):
+            path = os.path.join(directory, f".image_{n}.png")
+            with open(path, 'wb') as f:
+                f.write(synthetic_png(image_size, seed + n))
+            images.append(path)
+
+    for record in records:
+        with open(os.path.join(directory, f"{record['id']}.json"), 'w', encoding='utf-8') as f:
+            json.dump(detection_document(record), f, indent=1)
+        if images:
+            target = os.path.join(directory, record['image_file'])
+            source = images[record['id'] % len(images)]
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+        record['run_dir'] = os.path.basename(os.path.normpath(directory))
+        record['source_file'] = os.path.join(directory, f"{record['id']}.json")
+    return records
@@ -0,0 +1,163 @@
+"""
+Server-side state for dashboard callbacks: selections stored under short keys that the browser holds,
+and callback outputs memoized by those keys
+"""
+import functools
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Optional, Tuple
+from config import CALLBACK_CACHE_ENTRIES, VIEW_STORE_DIR, VIEW_STORE_ENTRIES, VIEW_STORE_MAX_AGE_S
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Stored views are pruned from disk every this many writes
+PRUNE_EVERY_WRITES = 100
+
+
+@dataclass(frozen=True)
+class View:
+    """What one browser is looking at: the data version, selected runs and time window (None for all)"""
+    version: str
+    runs: Tuple[str, ...] = ()
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+    @property
+    def key(self) -> str:
+        payload = json.dumps([self.version, list(self.runs), self.start, self.end])
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class ViewStore:
+    """Views by key, kept in memory and written to a directory shared by all server workers
+
+    Callbacks exchange only the key, so a callback answered by a worker other than the one that
+    stored the view reads it from disk. Views untouched for max_age_s are pruned from disk.
+    """
+
+    def __init__(self, directory: Optional[str] = VIEW_STORE_DIR, max_entries: int = VIEW_STORE_ENTRIES,
+                 max_age_s: float = VIEW_STORE_MAX_AGE_S):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_age_s = max_age_s
+        self.views: 'OrderedDict[str, View]' = OrderedDict()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _remember(self, key: str, view: View) -> None:
+        with self._lock:
+            self.views[key] = view
+            self.views.move_to_end(key)
+            while len(self.views) > self.max_entries:
+                self.views.popitem(last=False)
+
+    def put(self, view: View) -> str:
+        """Store a view and return its key"""
+        key = view.key
+        with self._lock:
+            known = key in self.views
+        self._remember(key, view)
+        if not known and self.directory:
+            self._write(key, view)
+        return key
+
+    def _write(self, key: str, view: View) -> None:
+        path = self._path(key)
+        try:
+            if os.path.exists(path):
+                os.utime(path)
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.tmp{os.getpid()}"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': view.version, 'runs': list(view.runs), 'start': view.start,
+                           'end': view.end}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not store view %s: %s", key, e)
+            return
+        self._writes += 1
+        if self._writes % PRUNE_EVERY_WRITES == 0:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        cutoff = time.time() - self.max_age_s
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def get(self, key: Optional[str]) -> Optional[View]:
+        """The view stored under a key, or None when it is unknown (or was pruned)"""
+        if not key:
+            return None
+        with self._lock:
+            view = self.views.get(key)
+            if view is not None:
+                self.views.move_to_end(key)
+                return view
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            view = View(version=stored['version'], runs=tuple(stored['runs']), start=stored['start'],
+                        end=stored['end'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        self._remember(key, view)
+        return view
+
+
+class CallbackCache:
+    """Callback outputs memoized by (callback name, key); the least recently used are evicted first
+
+    Keys identify what an output shows (a view key, which includes the data version), so entries
+    never go stale; clear() only frees memory once a data update makes them unreachable.
+    """
+
+    def __init__(self, max_entries: int = CALLBACK_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[Tuple[str, Hashable], Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, name: str, key: Hashable, compute: Callable[[], Any]) -> Any:
+        cache_key = (name, key)
+        with self._lock:
+            if cache_key in self.entries:
+                self.entries.move_to_end(cache_key)
+                REGISTRY.inc('flood_callback_cache_total', callback=name, result='hit')
+                return self.entries[cache_key]
+        REGISTRY.inc('flood_callback_cache_total', callback=name, result='miss')
+        value = compute()
+        with self._lock:
+            self.entries[cache_key] = value
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def memoize(self, name: str) -> Callable:
+        """Decorator caching a function of one hashable key under the given name"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(key):
+                return self.get_or_compute(name, key, lambda: fn(key))
+            return wrapper
+        return decorator
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
@@ -5,11 +5,157 @@ Configuration file for the Flood Monitoring Dashboard
 # Map Configuration
 FYN_ISLAND_CENTER = [55.4038, 10.4024]
 DEFAULT_ZOOM = 10
+# Above this many sensors the map switches to a single clustered layer with on-demand popups
+MAP_CLUSTER_THRESHOLD = 200
 
 # Data Configuration
 JSON_FILES_PATTERN = "{}.json"
 IMAGE_FILES_PATTERN = "{}.png"
-DATA_DIR = "data/video_results_1"
+DATA_ROOT = "data"
+# Run directories below DATA_ROOT, one per detection run
+DATA_DIR_PATTERN = "video_results_*"
+
+# Run registry Configuration
+RUN_INDEX_FILE = ".run_index.json"
+# Watch and serve only the newest N run directories live (None watches all); older runs load on demand
+WATCH_LATEST_RUNS = None
+# Runs loaded on demand kept in memory, bounded by count and by size
+RUN_CACHE_ENTRIES = 4
+RUN_CACHE_MAX_MB = 512
+
+# Rendered maps (and density layers) kept in memory, one per sensor set or time window
+MAP_CACHE_ENTRIES = 8
+# Rendered marker fragments kept in memory across all maps (full data, time windows and runs)
+MAP_FRAGMENT_ENTRIES = 20000
+# Full-data map renderings kept on disk for restarts and other server workers
+MAP_CACHE_DIR = ".map_cache"
+
+# Density layers: (minimum zoom, hexagon size in degrees) from coarsest to finest
+DENSITY_LEVELS = [(0, 0.08), (10, 0.02), (12, 0.005)]
+
+# Spatial index cell size in degrees (~1.1 km of latitude)
+SPATIAL_CELL_DEG = 0.01
+
+# Loader Configuration
+LOADER_WORKERS = 8
+
+# Server Configuration (SERVER_HOST, SERVER_PORT, SERVER_WORKERS and PUBLIC_URL in the environment override)
+# Public address behind a reverse proxy, shown at startup; the map and dashboard use root-relative URLs
+PUBLIC_URL = ""
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8050
+SERVER_WORKERS = 4
+SERVER_THREADS = 8
+SERVER_TIMEOUT_S = 120
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+# Bind first and load data and the map in the background (STARTUP_FAST in the environment overrides)
+STARTUP_FAST = False
+
+# Metrics Configuration (PROFILE_SAMPLE_RATE in the environment overrides)
+METRICS_DIR = ".metrics"
+METRICS_FLUSH_INTERVAL_S = 5.0
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_DIR = "profiles"
+
+# Image Configuration
+IMAGE_CACHE_DIR = ".image_cache"
+IMAGE_RENDITIONS = {"thumb": 320, "medium": 1024}
+IMAGE_FORMAT = "WEBP"
+IMAGE_QUALITY = 80
+IMAGE_WORKERS = 2
+IMAGE_CACHE_MAX_AGE_S = 3600
+# Source image content hashes remembered per process
+IMAGE_DIGEST_ENTRIES = 4096
+
+# Live update Configuration
+WATCH_MANIFEST_FILE = ".sensor_manifest.json"
+# Only the process holding this lock writes the manifest and snapshots; other server workers follow its
+# snapshots, and the report CLIs load read-only while a server holds it
+WATCH_LOCK_FILE = ".sensor_watcher.lock"
+SNAPSHOT_DIR = ".snapshots"
+WATCH_POLL_INTERVAL_S = 2.0
+LIVE_REFRESH_INTERVAL_MS = 5000
+
+# Time window Configuration
+TIME_SLIDER_STEPS = 100
+PLAYBACK_INTERVAL_MS = 1500
+
+# Dashboard callback Configuration
+# Memoized callback outputs (stats, tab panels) kept per worker, keyed by the selection they show
+CALLBACK_CACHE_ENTRIES = 64
+# Selections (runs and time window) the browser refers to by key, shared by workers through a directory
+VIEW_STORE_DIR = ".view_store"
+VIEW_STORE_ENTRIES = 1024
+# Stored selections untouched for this long are removed from disk
+VIEW_STORE_MAX_AGE_S = 86400
+
+
+# LLM backend Configuration ('openai', 'local', 'replay' or 'record'; LLM_BACKEND in the environment overrides)
+LLM_BACKEND = "openai"
+LLM_MODEL = "gpt-5-mini-2025-08-07"
+LLM_BASE_URL = None
+LLM_LOCAL_URL = "http://127.0.0.1:8080/v1"
+LLM_LOCAL_MODEL = "local"
+LLM_REPLAY_DIR = ".llm_replay"
+LLM_REPLAY_LATENCY_S = 0.0
+LLM_MAX_CONNECTIONS = 8
+LLM_TIMEOUT_S = 120.0
+
+# Report cache Configuration
+REPORT_CACHE_DB = ".report_cache.sqlite3"
+REPORT_CACHE_TTL_S = 24 * 3600
+REPORT_CACHE_MAX_ENTRIES = 500
+
+# Report job Configuration
+REPORT_JOB_WORKERS = 4
+REPORT_JOB_RETENTION = 100
+# Job state shared by server workers, so any of them can poll, stream or cancel a job
+REPORT_JOB_DIR = ".report_jobs"
+# Seconds between writes of a running job's text, and between reads by workers following it
+REPORT_JOB_SYNC_S = 0.25
+REPORT_POLL_INTERVAL_MS = 1000
+
+# Prompt compaction Configuration
+PROMPT_TOKEN_BUDGET = 6000
+PROMPT_TOP_K = 25
+PROMPT_CELL_DEG = 0.05
+
+# Risk scoring Configuration
+# Smallest spread (°C, %, hPa) a baseline delta is divided by, so near-constant sensors do not blow up
+RISK_SCALE_FLOORS = {"temperature": 0.5, "humidity": 2.0, "pressure": 1.0}
+# Normal frames a camera needs before their spread, rather than all its frames', scales its z-scores
+RISK_MIN_BASELINE_FRAMES = 10
+# Frames per camera in the rolling score mean and trend
+RISK_TREND_WINDOW = 10
+# RMS z-score at which the anomaly term of the risk score saturates
+RISK_Z_CAP = 4.0
+RISK_WEIGHTS = {"score": 0.4, "level": 0.3, "anomaly": 0.2, "trend": 0.1}
+RISK_HIGH_THRESHOLD = 0.6
+RISK_CELL_DEG = 0.01
+RISK_TOP_LOCATIONS = 10
+
+# Per-pin report Configuration
+PIN_REPORT_DIR = "report_cache"
+PIN_REPORT_LEVELS = (1, 2)
+PIN_NEIGHBOUR_FRAMES = 3
+PIN_REPORT_WORKERS = 4
+PIN_REPORT_LOCK_FILE = ".pin_reports.lock"
+# Each pin report is a paid LLM call, so the server generates them after data updates only when enabled
+# (PIN_REPORT_AUTO=1 in the environment overrides); `python pin_reports.py` generates them on demand
+PIN_REPORT_AUTO = False
+# Background passes generate at most this many reports (floods first, newest first), under a rate limit
+PIN_REPORT_MAX_PER_PASS = 50
+PIN_REPORT_RATE_PER_MIN = 30
+# Stored pin reports kept on disk, least recently used removed first
+PIN_REPORT_MAX_ENTRIES = 5000
+
+# Batch report Configuration
+REPORT_BATCH_CONCURRENCY = 3
+REPORT_BATCH_RATE_PER_MIN = 30
+REPORT_BATCH_RETRIES = 4
+REPORT_BATCH_BACKOFF_S = 2.0
+REPORT_BATCH_OUTPUT_DIR = "reports"
 
 
 # Classification levels
@@ -2,24 +2,297 @@
 Dash dashboard application for flood monitoring
 """
 import dash
-from dash import html, dcc
+from dash import html, dcc, Patch
 from dash.dependencies import Input, Output
+import hashlib
+import json
 import os
-from typing import List, Dict
-from config import COLORS, CLASSIFICATION
-from dash.dependencies import Input, Output, State
+from typing import Dict, List, Optional
+from datetime import datetime
+from config import (COLORS, CLASSIFICATION, LIVE_REFRESH_INTERVAL_MS, REPORT_POLL_INTERVAL_MS,
+                    RISK_HIGH_THRESHOLD, TIME_SLIDER_STEPS, PLAYBACK_INTERVAL_MS)
+from sensor_store import SensorStore
+from run_registry import RunRegistry
+from callback_cache import CallbackCache, View, ViewStore
+from dash.dependencies import Input, Output, State, ClientsideFunction
 import dash_bootstrap_components as dbc
-from llm_report import generate_report, save_report_to_file, STAKEHOLDER_PROMPTS
+from llm_report import STAKEHOLDER_PROMPTS
+from report_jobs import ReportJobManager, CANCELLED, FAILED
 import dash_bootstrap_components as dbc
 from dash import dcc
 
 
 
-def create_dashboard_app(sensors: List[Dict], map_file: str) -> dash.Dash:
-    """Create and configure the Dash application"""
+def create_dashboard_app(sensors: SensorStore, map_file: str, runs: Optional[RunRegistry] = None,
+                         views: Optional[ViewStore] = None) -> dash.Dash:
+    """Create and configure the Dash application; runs indexes the runs that can be selected
+
+    Selections live server-side: the browser holds only the key of its current view (data version,
+    runs and time window, see callback_cache.View), and callback outputs are memoized by that key.
+    """
     app = dash.Dash(__name__, suppress_callback_exceptions=True, external_stylesheets=[dbc.themes.BOOTSTRAP])
 
-    app.layout = html.Div([
+    # The layout is built per page load, so a browser opened after a data update (or after a
+    # background startup load) starts from the current sensor set
+    app.layout = lambda: create_layout(app.sensors_data, app.data_version, app.runs,
+                                       app.views.put(View(app.data_version)))
+    # Store sensors data for callbacks
+    app.sensors_data = sensors
+    app.data_version = data_version(sensors)
+    app.runs = runs if runs is not None else RunRegistry()
+    app.runs.update_live(sensors)
+    app.views = views if views is not None else ViewStore()
+    app.callback_cache = CallbackCache()
+
+    # Watcher updates change the data version and stretch the time slider to the new data; switching
+    # runs resets the slider to the span of the selected runs. Only properties that changed are sent.
+    @app.callback(
+        [Output('data-version', 'data'),
+         Output('time-window', 'min'),
+         Output('time-window', 'max'),
+         Output('time-window', 'step'),
+         Output('time-window', 'marks'),
+         Output('time-window', 'value'),
+         Output('time-window', 'disabled'),
+         Output('run-selector', 'options'),
+         Output('run-options-key', 'data')],
+        [Input('live-refresh', 'n_intervals'),
+         Input('run-selector', 'value')],
+        [State('data-version', 'data'),
+         State('time-window', 'value'),
+         State('time-window', 'min'),
+         State('time-window', 'max'),
+         State('run-options-key', 'data')],
+        prevent_initial_call=True
+    )
+    def refresh_live_data(n_intervals, runs, seen_version, window, old_min, old_max, seen_options):
+        from dash import ctx
+
+        switched = ctx.triggered_id == 'run-selector'
+        if seen_version == app.data_version and not switched:
+            return (dash.no_update,) * 9
+        props = time_slider_props(selected_sensors(app, runs))
+        value = props['value']
+        # A window that ended at the latest data keeps following it; otherwise it stays put
+        if not switched and window and window[1] < old_max:
+            value = window
+        elif not switched and window and window[0] > old_min:
+            value = [window[0], props['max']]
+        # step, marks and disabled follow from min and max
+        slider = ((props['min'], props['max'], props['step'], props['marks'], props['disabled'])
+                  if (props['min'], props['max']) != (old_min, old_max) else (dash.no_update,) * 5)
+        options = run_options(app.runs)
+        options_key = run_options_key(options)
+        if options_key == seen_options:
+            options = options_key = dash.no_update
+        version = app.data_version if app.data_version != seen_version else dash.no_update
+        return (version, *slider[:4], value if value != window else dash.no_update, slider[4],
+                options, options_key)
+
+    # Every change of runs, time window or data becomes one stored view; the browser keeps its key
+    @app.callback(
+        Output('view-key', 'data'),
+        [Input('time-window', 'value'),
+         Input('data-version', 'data'),
+         Input('run-selector', 'value')],
+        [State('time-window', 'min'),
+         State('time-window', 'max'),
+         State('view-key', 'data')],
+        prevent_initial_call=True
+    )
+    def select_view(window, version, runs, slider_min, slider_max, view_key):
+        start, end = window_bounds(window, slider_min, slider_max)
+        key = app.views.put(View(version=version if version is not None else app.data_version,
+                                 runs=tuple(sorted(set(runs or []))), start=start, end=end))
+        return dash.no_update if key == view_key else key
+
+    @app.callback_cache.memoize('overview')
+    def overview(view_key):
+        view = resolve_view(app, view_key)
+        sensors = app.runs.scope(app.sensors_data, view.runs)
+        bounds = sensors.time_index().bounds()
+        if view.start is None:
+            return len(sensors), sensors.prediction_counts(), format_time_window(bounds, bounds)
+        counts = sensors.time_index().counts(view.start, view.end)
+        return sum(counts.values()), counts, format_time_window([view.start, view.end], bounds)
+
+    # The stats cards are patched in place (only their numbers are sent); counts come from the time index
+    @app.callback(
+        [Output('stats-cards', 'children'),
+         Output('time-window-label', 'children')],
+        Input('view-key', 'data'),
+        prevent_initial_call=True
+    )
+    def update_overview(view_key):
+        total, counts, label = overview(view_key)
+        return patch_count_cards(total, counts), label
+
+    # The map iframe is pointed at a new URL only while it is shown, and only when the URL changed
+    @app.callback(
+        Output('map-iframe', 'src'),
+        [Input('view-key', 'data'),
+         Input('main-tabs', 'value')],
+        State('map-iframe', 'src'),
+        prevent_initial_call=True
+    )
+    def update_map_src(view_key, tab, current_src):
+        if tab != 'map':
+            return dash.no_update
+        src = map_src(resolve_view(app, view_key))
+        return dash.no_update if src == current_src else src
+
+    @app.callback(
+        [Output('playback-tick', 'disabled'),
+         Output('playback-btn', 'children')],
+        Input('playback-btn', 'n_clicks'),
+        State('playback-tick', 'disabled'),
+        prevent_initial_call=True
+    )
+    def toggle_playback(n_clicks, disabled):
+        return (False, '⏸ Pause') if disabled else (True, '▶ Play')
+
+    # Playback slides the window forward one step per tick and wraps around at the end
+    @app.callback(
+        Output('time-window', 'value', allow_duplicate=True),
+        Input('playback-tick', 'n_intervals'),
+        [State('time-window', 'value'),
+         State('time-window', 'min'),
+         State('time-window', 'max'),
+         State('time-window', 'step')],
+        prevent_initial_call=True
+    )
+    def advance_playback(n_intervals, window, slider_min, slider_max, step):
+        width = window[1] - window[0]
+        if width >= slider_max - slider_min:
+            width = (slider_max - slider_min) / 10
+            return [slider_min, slider_min + width]
+        start = window[0] + step
+        if start + width > slider_max:
+            start = slider_min
+        return [start, start + width]
+
+    # The latency and risk tabs are built only while open, for the selected view; run summaries come
+    # from the registry index, so comparing runs loads none of them
+    panel_builders = {
+        'latency': lambda view_key: create_latency_panel(view_sensors(app, view_key)),
+        'risk': lambda view_key: create_risk_panel(view_sensors(app, view_key)),
+        'runs': lambda view_key: create_runs_panel(app.runs.runs(), list(resolve_view(app, view_key).runs)),
+    }
+
+    # Reopening a tab whose panel already shows the current view sends nothing: panel-keys records
+    # the key each panel was built for, and is itself updated with a patch
+    @app.callback(
+        [Output('latency-panel', 'children'),
+         Output('risk-panel', 'children'),
+         Output('runs-panel', 'children'),
+         Output('panel-keys', 'data')],
+        [Input('main-tabs', 'value'),
+         Input('view-key', 'data')],
+        State('panel-keys', 'data'),
+    )
+    def update_tab_panel(tab, view_key, panel_keys):
+        if tab not in panel_builders:
+            return (dash.no_update,) * 4
+        # Run summaries also change when the index does, without a new view
+        panel_key = f"{view_key}.{app.runs.revision}" if tab == 'runs' else view_key
+        if (panel_keys or {}).get(tab) == panel_key:
+            return (dash.no_update,) * 4
+        outputs = [dash.no_update] * 3
+        outputs[list(panel_builders).index(tab)] = app.callback_cache.get_or_compute(
+            tab, panel_key, lambda: panel_builders[tab](view_key))
+        recorded = Patch()
+        recorded[tab] = panel_key
+        return (*outputs, recorded)
+
+    # Report jobs run in the background; the modal polls their status
+    app.report_jobs = ReportJobManager()
+
+    @app.callback(
+        [Output('report-modal', 'is_open'),
+         Output('report-content', 'children'),
+         Output('report-loading', 'children'),
+         Output('report-modal-title', 'children'),
+         Output('report-job', 'data'),
+         Output('report-poll', 'disabled')],
+        Input('generate-report-btn', 'n_clicks'),
+        [State('stakeholder-selector', 'value'),
+         State('regenerate-report', 'value'),
+         State('view-key', 'data')],
+        prevent_initial_call=True
+    )
+    def start_report_job(generate_clicks, stakeholder, regenerate, view_key):
+        stakeholder = stakeholder or "general"
+        label = STAKEHOLDER_PROMPTS.get(stakeholder, STAKEHOLDER_PROMPTS["general"])["label"]
+        # Reports cover the selected runs and time window
+        sensors = view_sensors(app, view_key)
+        job_id = app.report_jobs.submit(sensors, stakeholder=stakeholder,
+                                        regenerate='regenerate' in (regenerate or []))
+        pending = html.Div([
+            dbc.Spinner(color='primary'),
+            html.P(f"Generating {label} report...", style={'marginTop': '10px', 'color': '#666'})
+        ], style={'textAlign': 'center'})
+        return True, pending, "", f"🌊 AI Flood Report - {label}", job_id, False
+
+    # Chunks are streamed into 'report-stream' over server-sent events (assets/report_stream.js)
+    app.clientside_callback(
+        ClientsideFunction(namespace='reports', function_name='stream'),
+        Output('report-stream-job', 'data'),
+        Input('report-job', 'data'),
+        prevent_initial_call=True
+    )
+
+    # Polling only detects completion; the finished report then replaces the streamed text
+    @app.callback(
+        [Output('report-content', 'children', allow_duplicate=True),
+         Output('report-stream', 'children'),
+         Output('report-loading', 'children', allow_duplicate=True),
+         Output('report-poll', 'disabled', allow_duplicate=True)],
+        Input('report-poll', 'n_intervals'),
+        [State('report-job', 'data'),
+         State('report-content', 'children')],
+        prevent_initial_call=True
+    )
+    def poll_report_job(n_intervals, job_id, content):
+        job = app.report_jobs.get(job_id) if job_id else None
+        if job is None:
+            return "Report job not found.", "", "", True
+        if not job.finished:
+            # The first chunk replaces the spinner; later ticks leave the page alone
+            if job.parts and content != "":
+                return "", dash.no_update, dash.no_update, False
+            return dash.no_update, dash.no_update, dash.no_update, False
+        if job.status == FAILED:
+            return create_report_failure(job.error), "", "", True
+        if job.status == CANCELLED:
+            return "Report generation was cancelled.", "", "", True
+        return (create_report_display(job.report), "",
+                create_download_button(job.filename, job.metrics()), True)
+
+    @app.callback(
+        [Output('report-modal', 'is_open', allow_duplicate=True),
+         Output('report-poll', 'disabled', allow_duplicate=True)],
+        [Input('close-report-btn', 'n_clicks'),
+         Input('cancel-report-btn', 'n_clicks')],
+        State('report-job', 'data'),
+        prevent_initial_call=True
+    )
+    def close_report_modal(close_clicks, cancel_clicks, job_id):
+        from dash import ctx
+
+        # Closing leaves the job running so its result lands in the report cache
+        if ctx.triggered_id == 'cancel-report-btn' and job_id:
+            app.report_jobs.cancel(job_id)
+        return False, True
+
+    return app
+
+def create_layout(sensors: SensorStore, version: str, runs: RunRegistry, view_key: str) -> html.Div:
+    """Page layout for a sensor set: stats cards, run selector, time slider, report controls and tabs
+
+    view_key is the stored view of all live data at this version, the browser's starting view.
+    """
+    options = run_options(runs)
+    return html.Div([
         html.Div([
             html.H1(
                 "🌊 Flood Monitoring Dashboard - Fyn Island",
@@ -34,29 +307,48 @@ def create_dashboard_app(sensors: List[Dict], map_file: str) -> dash.Dash:
         ], style={'padding': '20px', 'background': COLORS['card']}),
 
         html.Div([
-            html.Div([
-                create_stats_card("Total Sensors", len(sensors), "📡"),
-                create_stats_card("Flood Alerts",
-                                count_by_prediction(sensors, 2), "🔴"),
-                create_stats_card("Suspicious",
-                                count_by_prediction(sensors, 1), "🟠"),
-                create_stats_card("Normal",
-                                count_by_prediction(sensors, 0), "🟢"),
-            ], style={
+            dcc.Interval(id='live-refresh', interval=LIVE_REFRESH_INTERVAL_MS, n_intervals=0),
+            dcc.Store(id='data-version', data=version),
+            # Server-side state: the browser holds only keys (see callback_cache)
+            dcc.Store(id='view-key', data=view_key),
+            dcc.Store(id='panel-keys', data={}),
+            dcc.Store(id='run-options-key', data=run_options_key(options)),
+            html.Div(create_stats_cards(sensors), id='stats-cards', style={
                 'display': 'flex',
                 'justifyContent': 'space-around',
                 'flexWrap': 'wrap',
                 'marginBottom': '20px'
             }),
+            dcc.Interval(id='playback-tick', interval=PLAYBACK_INTERVAL_MS, disabled=True),
+            html.Div([
+                dcc.Dropdown(id='run-selector', options=options, multi=True,
+                             placeholder="All live runs", style={'width': '320px'}),
+                html.Button('▶ Play', id='playback-btn', n_clicks=0, style={
+                    'padding': '8px 16px',
+                    'background': COLORS['primary'],
+                    'color': 'white',
+                    'border': 'none',
+                    'borderRadius': '5px',
+                    'cursor': 'pointer'
+                }),
+                html.Div(dcc.RangeSlider(id='time-window', updatemode='mouseup', allowCross=False,
+                                         **time_slider_props(sensors)),
+                         style={'flex': '1'}),
+                html.Span(format_time_window(time_slider_props(sensors)['value'], sensors.time_index().bounds()),
+                          id='time-window-label', style={'color': '#666', 'fontSize': '14px', 'minWidth': '260px'}),
+            ], style={
+                'display': 'flex',
+                'alignItems': 'center',
+                'gap': '15px',
+                'padding': '10px 20px',
+                'background': COLORS['card'],
+                'borderRadius': '10px',
+                'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'
+            }),
         ], style={'padding': '0 20px'}),
         html.Div([
-            dcc.Loading(
-                id="loading-report",
-                type="default",
-                children=html.Div(id="loading-output"),
-                fullscreen=True,
-                style={'background': 'rgba(0,0,0,0.3)'}
-            ),
+            dcc.Store(id='report-job'),
+            dcc.Interval(id='report-poll', interval=REPORT_POLL_INTERVAL_MS, disabled=True),
             html.Div([
                 dcc.Dropdown(
                     id='stakeholder-selector',
@@ -88,6 +380,12 @@ def create_dashboard_app(sensors: List[Dict], map_file: str) -> dash.Dash:
                         'transition': 'all 0.3s'
                     }
                 ),
+                dcc.Checklist(
+                    id='regenerate-report',
+                    options=[{'label': ' Regenerate (skip cache)', 'value': 'regenerate'}],
+                    value=[],
+                    style={'fontSize': '14px', 'color': COLORS['text']}
+                ),
             ], style={
                 'display': 'flex',
                 'alignItems': 'center',
@@ -95,7 +393,7 @@ def create_dashboard_app(sensors: List[Dict], map_file: str) -> dash.Dash:
                 'gap': '15px',
             }),
             html.P(
-                '⏱️ Report generation takes 10-15 seconds',
+                '⏱️ New reports take 10-15 seconds; repeated requests are served from the cache',
                 style={
                     'marginTop': '10px',
                     'color': '#666',
@@ -116,9 +414,32 @@ def create_dashboard_app(sensors: List[Dict], map_file: str) -> dash.Dash:
                     'background': '#f8f9fa',
                     'borderRadius': '5px'
                 }),
+                html.Pre(id='report-stream', style={
+                    'maxHeight': '500px',
+                    'overflowY': 'auto',
+                    'whiteSpace': 'pre-wrap',
+                    'fontFamily': 'Arial, sans-serif',
+                    'lineHeight': '1.6',
+                    'background': 'transparent',
+                    'border': 'none',
+                    'margin': '0'
+                }),
+                dcc.Store(id='report-stream-job'),
                 html.Div(id='report-loading')
             ]),
-            dbc.ModalFooter(
+            dbc.ModalFooter([
+                html.Button(
+                    "Cancel Report",
+                    id="cancel-report-btn",
+                    style={
+                        'padding': '10px 20px',
+                        'background': '#dc3545',
+                        'color': 'white',
+                        'border': 'none',
+                        'borderRadius': '5px',
+                        'cursor': 'pointer'
+                    }
+                ),
                 html.Button(
                     "Close",
                     id="close-report-btn",
@@ -131,23 +452,36 @@ def create_dashboard_app(sensors: List[Dict], map_file: str) -> dash.Dash:
                         'cursor': 'pointer'
                     }
                 )
-            ),
+            ]),
         ], id='report-modal', size='xl', is_open=False, scrollable=True),
 
-        html.Div([
-            html.Iframe(
-                id='map-iframe',
-                src='/map',  # Reference the map file via URL
-                style={
-                    'width': '100%',
-                    'height': '700px',
-                    'border': 'none',
-                    'borderRadius': '10px',
-                    'boxShadow': '0 4px 6px rgba(0,0,0,0.1)'
-                }
-            )
+        dcc.Tabs(id='main-tabs', value='map', children=[
+            dcc.Tab(label='🗺️ Flood Map', value='map', children=[
+                html.Div([
+                    html.Iframe(
+                        id='map-iframe',
+                        src=map_src(View(version)),  # Reference the map file via URL
+                        style={
+                            'width': '100%',
+                            'height': '700px',
+                            'border': 'none',
+                            'borderRadius': '10px',
+                            'boxShadow': '0 4px 6px rgba(0,0,0,0.1)'
+                        }
+                    )
 
-        ], style={'padding': '0 20px 20px 20px'}),
+                ], style={'padding': '0 20px 20px 20px'}),
+            ]),
+            dcc.Tab(label='⏱️ Pipeline Latency', value='latency', children=[
+                html.Div(id='latency-panel', style={'padding': '20px'})
+            ]),
+            dcc.Tab(label='⚠️ Risk', value='risk', children=[
+                html.Div(id='risk-panel', style={'padding': '20px'})
+            ]),
+            dcc.Tab(label='🗂️ Runs', value='runs', children=[
+                html.Div(id='runs-panel', style={'padding': '20px'})
+            ]),
+        ], style={'margin': '0 20px 20px 20px'}),
 
         html.Div([
             html.H3("Legend", style={'color': COLORS['primary'], 'marginBottom': '15px'}),
@@ -171,70 +505,149 @@ def create_dashboard_app(sensors: List[Dict], map_file: str) -> dash.Dash:
         'padding': '0',
         'margin': '0'
     })
-    # Store sensors data for callbacks
-    app.sensors_data = sensors
 
-    # Callback for generating report
-    @app.callback(
-        [Output('report-modal', 'is_open'),
-         Output('report-content', 'children'),
-         Output('report-loading', 'children'),
-         Output('loading-output', 'children'),
-         Output('report-modal-title', 'children')],
-        [Input('generate-report-btn', 'n_clicks'),
-         Input('close-report-btn', 'n_clicks')],
-        [State('report-modal', 'is_open'),
-         State('stakeholder-selector', 'value')],
-        prevent_initial_call=True
+def create_report_display(report_text: str) -> dcc.Markdown:
+    """Render a report with markdown formatting"""
+    return dcc.Markdown(
+        report_text,
+        style={
+            'whiteSpace': 'pre-wrap',
+            'fontFamily': 'Arial, sans-serif',
+            'lineHeight': '1.6'
+        }
     )
-    def toggle_report_modal(generate_clicks, close_clicks, is_open, stakeholder):
-        from dash import ctx
 
-        if ctx.triggered_id == 'generate-report-btn':
-            stakeholder = stakeholder or "general"
-            label = STAKEHOLDER_PROMPTS.get(stakeholder, STAKEHOLDER_PROMPTS["general"])["label"]
+def create_report_failure(error: Optional[str]) -> html.Div:
+    """Message shown in place of a report whose generation failed"""
+    return html.Div([
+        html.H5("⚠️ Report generation failed", style={'color': '#dc3545'}),
+        html.P(error or "Unknown error", style={'color': '#666'}),
+        html.P("Please check your API key and connection, then try again.", style={'color': '#666'})
+    ])
 
-            # Generate report (this takes time)
-            report_text = generate_report(app.sensors_data, stakeholder=stakeholder)
 
-            # Save to file for download
-            filename = save_report_to_file(report_text)
+def create_download_button(filename: str, metrics: Dict) -> html.Div:
+    """Create the download link shown under a finished report"""
+    return html.Div([
+        html.Hr(),
+        html.A(
+            '📥 Download Report (.txt)',
+            href=f'/reports/{filename}',
+            download=filename,
+            style={
+                'display': 'inline-block',
+                'padding': '12px 24px',
+                'background': COLORS['primary'],
+                'color': 'white',
+                'borderRadius': '5px',
+                'textDecoration': 'none',
+                'fontWeight': 'bold',
+                'textAlign': 'center'
+            }
+        ),
+        html.P(f"Generated in {metrics['total_s']:.1f}s (queued {metrics['queue_wait_s']:.1f}s, "
+               f"first text after {metrics['time_to_first_chunk_s'] or 0:.1f}s)",
+               style={'marginTop': '10px', 'color': '#666', 'fontSize': '12px'})
+    ], style={'textAlign': 'center', 'marginTop': '20px'})
 
-            # Display in modal with markdown formatting
-            report_display = dcc.Markdown(
-                report_text,
-                style={
-                    'whiteSpace': 'pre-wrap',
-                    'fontFamily': 'Arial, sans-serif',
-                    'lineHeight': '1.6'
-                }
-            )
+def data_version(sensors: SensorStore) -> str:
+    """Version of a live sensor set: its content hash, so every server worker holding the same data
+    agrees on it and a browser whose requests alternate between workers sees no change"""
+    return sensors.fingerprint()[:16]
 
-            download_button = html.Div([
-                html.Hr(),
-                html.A(
-                    '📥 Download Report (.txt)',
-                    href=f'/{filename}',
-                    download=filename,
-                    style={
-                        'display': 'inline-block',
-                        'padding': '12px 24px',
-                        'background': COLORS['primary'],
-                        'color': 'white',
-                        'borderRadius': '5px',
-                        'textDecoration': 'none',
-                        'fontWeight': 'bold',
-                        'textAlign': 'center'
-                    }
-                )
-            ], style={'textAlign': 'center', 'marginTop': '20px'})
+def update_dashboard_data(app: dash.Dash, sensors: SensorStore) -> None:
+    """Swap in a new sensor set; connected browsers pick it up on their next refresh tick"""
+    app.sensors_data = sensors
+    app.runs.update_live(sensors)
+    app.data_version = data_version(sensors)
+    # Memoized outputs are keyed by views of older versions from now on
+    app.callback_cache.clear()
 
-            title = f"🌊 AI Flood Report - {label}"
-            return True, report_display, download_button, "", title
+def selected_sensors(app: dash.Dash, runs: Optional[List[str]]) -> SensorStore:
+    """The live sensor set, or the selected runs"""
+    return app.runs.scope(app.sensors_data, runs or [])
 
-        return False, "", "", "", "🌊 AI-Generated Flood Monitoring Report"
+def resolve_view(app: dash.Dash, view_key: Optional[str]) -> View:
+    """The view stored under a key; all live data at the current version when the key is unknown"""
+    view = app.views.get(view_key)
+    return view if view is not None else View(app.data_version)
 
-    return app
+def view_sensors(app: dash.Dash, view_key: Optional[str]) -> SensorStore:
+    """The sensors a view shows: its runs (or the live set), narrowed to its time window"""
+    view = resolve_view(app, view_key)
+    sensors = app.runs.scope(app.sensors_data, view.runs)
+    return sensors if view.start is None else sensors.window(view.start, view.end)
+
+def map_src(view: View) -> str:
+    """URL of the map iframe for a view"""
+    src = f'/map?v={view.version}' + (f"&run={','.join(view.runs)}" if view.runs else '')
+    return src if view.start is None else f'{src}&start={view.start}&end={view.end}'
+
+def run_options(runs: RunRegistry) -> List[Dict]:
+    """Run selector entries, newest first"""
+    options = []
+    for run in runs.runs():
+        started = datetime.fromtimestamp(run['start']).strftime('%Y-%m-%d %H:%M') if run.get('start') else "untimed"
+        label = f"{run['run_id']} · {started} · {run['frames']} frames" + (" · live" if run['live'] else "")
+        options.append({'label': label, 'value': run['run_id']})
+    return options
+
+def run_options_key(options: List[Dict]) -> str:
+    """Fingerprint of the run selector entries, so a refresh sends them only when they changed"""
+    return hashlib.sha1(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def create_stats_cards(sensors: SensorStore) -> List[html.Div]:
+    """Create the row of statistics cards for a sensor set"""
+    return create_count_cards(len(sensors), sensors.prediction_counts())
+
+# (title, icon, prediction level) of the stats cards in display order; level None is the total
+COUNT_CARDS = [
+    ("Total Sensors", "📡", None),
+    ("Flood Alerts", "🔴", 2),
+    ("Suspicious", "🟠", 1),
+    ("Normal", "🟢", 0),
+]
+
+def create_count_cards(total: int, counts: Dict[int, int]) -> List[html.Div]:
+    """Create the row of statistics cards from a total and per-level counts"""
+    return [create_stats_card(title, total if level is None else counts.get(level, 0), icon)
+            for title, icon, level in COUNT_CARDS]
+
+def patch_count_cards(total: int, counts: Dict[int, int]) -> Patch:
+    """Partial update of the statistics cards that replaces only the number in each card"""
+    patch = Patch()
+    for i, (_, _, level) in enumerate(COUNT_CARDS):
+        # The number is the card's second child (see create_stats_card)
+        patch[i]['props']['children'][1]['props']['children'] = str(total if level is None else counts.get(level, 0))
+    return patch
+
+def time_slider_props(sensors: SensorStore) -> Dict:
+    """min/max/step/marks/value of the time slider spanning a sensor set's capture times"""
+    bounds = sensors.time_index().bounds()
+    if bounds is None:
+        return {'min': 0, 'max': 1, 'step': 1, 'marks': {}, 'value': [0, 1], 'disabled': True}
+    start, end = bounds
+    end = max(end, start + 1)
+    marks = {
+        tick: datetime.fromtimestamp(tick).strftime('%H:%M')
+        for tick in (start + (end - start) * i / 4 for i in range(5))
+    }
+    return {'min': start, 'max': end, 'step': (end - start) / TIME_SLIDER_STEPS, 'marks': marks,
+            'value': [start, end], 'disabled': False}
+
+def window_bounds(window, slider_min: float, slider_max: float):
+    """(start, end) of a slider window, or (None, None) when it spans all data"""
+    if not window or (window[0] <= slider_min and window[1] >= slider_max):
+        return None, None
+    return window[0], window[1]
+
+def format_time_window(window, bounds) -> str:
+    """Human-readable label for the selected window"""
+    if not window or bounds is None:
+        return "No timestamps available"
+    fmt = '%Y-%m-%d %H:%M:%S'
+    return (f"{datetime.fromtimestamp(window[0]).strftime(fmt)} → "
+            f"{datetime.fromtimestamp(window[1]).strftime(fmt)}")
 
 def create_stats_card(title: str, value: int, icon: str) -> html.Div:
     """Create a statistics card component"""
@@ -252,6 +665,144 @@ def create_stats_card(title: str, value: int, icon: str) -> html.Div:
         'margin': '10px'
     })
 
+def create_latency_panel(sensors: SensorStore) -> html.Div:
+    """Latency percentiles, cold-start rates, per-tier/backend breakdowns and the lag histogram"""
+    # plotly's figure classes are slow to import and only needed once the tab is opened
+    import plotly.graph_objects as go
+    from latency_analytics import cold_start_rate, lag_histogram, latency_breakdown, latency_summary
+
+    cold = cold_start_rate(sensors['inference_cold_start'])
+    histogram = lag_histogram(sensors)
+    edges = histogram['edges']
+    figure = go.Figure(
+        go.Bar(x=[(a * b) ** 0.5 if a > 0 else (a + b) / 2 for a, b in zip(edges, edges[1:])],
+               y=histogram['counts'],
+               width=[b - a for a, b in zip(edges, edges[1:])],
+               marker_color=COLORS['primary']),
+        layout=go.Layout(title="Capture-to-processor lag", xaxis_title="seconds", yaxis_title="frames",
+                         margin={'t': 40, 'l': 50, 'r': 20, 'b': 40}, height=320, bargap=0),
+    )
+    if edges and edges[0] > 0 and edges[-1] / edges[0] > 100:
+        figure.update_xaxes(type='log')
+
+    return html.Div([
+        html.Div([
+            create_stats_card("Frames", len(sensors), "🎞️"),
+            create_stats_card("Cold Starts", f"{cold:.1%}" if cold is not None else "n/a", "🧊"),
+        ], style={'display': 'flex', 'flexWrap': 'wrap', 'justifyContent': 'center'}),
+        html.H4("Latency percentiles", style={'color': COLORS['primary']}),
+        create_latency_table(latency_summary(sensors), "Stage"),
+        html.Div([
+            html.Div([
+                html.H4("Total latency by model tier", style={'color': COLORS['primary']}),
+                create_latency_table(latency_breakdown(sensors, 'model_tier'), "Model tier"),
+            ], style={'flex': '1', 'minWidth': '320px'}),
+            html.Div([
+                html.H4("Total latency by backend", style={'color': COLORS['primary']}),
+                create_latency_table(latency_breakdown(sensors, 'backend'), "Backend"),
+            ], style={'flex': '1', 'minWidth': '320px'}),
+        ], style={'display': 'flex', 'gap': '20px', 'flexWrap': 'wrap', 'marginTop': '20px'}),
+        dcc.Graph(figure=figure, config={'displayModeBar': False}),
+    ], style={'background': COLORS['card'], 'padding': '20px', 'borderRadius': '10px'})
+
+def create_latency_table(rows: List[Dict], name_header: str) -> html.Table:
+    """Table of count, p50/p95/p99 and, when present, cold-start rate per row"""
+    def seconds(value):
+        return f"{value:.3f}s" if value is not None else "n/a"
+
+    has_cold = any('cold_start_rate' in row for row in rows)
+    headers = [name_header, "Frames", "p50", "p95", "p99"] + (["Cold starts"] if has_cold else [])
+    cell = {'padding': '6px 12px', 'borderBottom': f"1px solid {COLORS['border']}", 'textAlign': 'right'}
+    body = []
+    for row in rows:
+        values = [row['name'], row['count'], seconds(row['p50']), seconds(row['p95']), seconds(row['p99'])]
+        if has_cold:
+            rate = row.get('cold_start_rate')
+            values.append(f"{rate:.1%}" if rate is not None else "n/a")
+        body.append(html.Tr([html.Td(value, style=cell) for value in values]))
+    return html.Table([
+        html.Thead(html.Tr([html.Th(header, style=cell) for header in headers])),
+        html.Tbody(body),
+    ], style={'borderCollapse': 'collapse', 'width': '100%', 'fontSize': '14px'})
+
+def create_risk_panel(sensors: SensorStore) -> html.Div:
+    """High-risk frame count, the ranked top-risk locations and per-camera stability"""
+    from risk_analytics import camera_stability, high_risk_count, top_risk_locations
+
+    def number(value, digits=2, signed=False):
+        return "n/a" if value is None else f"{value:{'+' if signed else ''}.{digits}f}"
+
+    locations = [
+        [f"{row['lat']:.4f}, {row['lon']:.4f}", number(row['max_risk']), number(row['mean_risk']),
+         row['frames'], row['floods'], row['camera'],
+         f"{row['signal']} {number(row['zscore'], 1, signed=True)}σ" if row['signal'] else "n/a",
+         number(row['trend'], 3, signed=True)]
+        for row in top_risk_locations(sensors)
+    ]
+    cameras = [
+        [row['camera'], row['frames'], row['changes'], row['flapping'], row['drift'], row['conflict'],
+         f"{number(row['mean_anomaly'], 1)}σ", number(row['max_risk']), number(row['rolling_score'], 3),
+         number(row['trend'], 3, signed=True)]
+        for row in camera_stability(sensors)
+    ]
+    return html.Div([
+        html.Div([
+            create_stats_card("Frames", len(sensors), "🎞️"),
+            create_stats_card("High Risk", high_risk_count(sensors, RISK_HIGH_THRESHOLD), "⚠️"),
+        ], style={'display': 'flex', 'flexWrap': 'wrap', 'justifyContent': 'center'}),
+        html.H4("Top-risk locations", style={'color': COLORS['primary']}),
+        create_table(["Location", "Max risk", "Mean risk", "Frames", "Floods", "Peak camera",
+                      "Strongest anomaly", "Score trend"], locations),
+        html.H4("Camera stability", style={'color': COLORS['primary'], 'marginTop': '20px'}),
+        create_table(["Camera", "Frames", "Level changes", "Flapping", "Drift", "Conflict", "Mean anomaly",
+                      "Max risk", "Rolling score", "Trend"], cameras),
+    ], style={'background': COLORS['card'], 'padding': '20px', 'borderRadius': '10px'})
+
+def create_runs_panel(runs: List[Dict], selected: List[str]) -> html.Div:
+    """Indexed runs side by side (only the selected ones when two or more are selected)"""
+    # plotly's figure classes are slow to import and only needed once the tab is opened
+    import plotly.graph_objects as go
+
+    if len(selected) >= 2:
+        runs = [run for run in runs if run['run_id'] in selected]
+    fmt = '%Y-%m-%d %H:%M'
+
+    def when(ts):
+        return datetime.fromtimestamp(ts).strftime(fmt) if ts else "n/a"
+
+    rows = []
+    for run in runs:
+        levels = run['levels']
+        flood_rate = levels.get('2', 0) / run['frames'] if run['frames'] else 0
+        rows.append([
+            run['run_id'] + (" (live)" if run['live'] else ""), when(run.get('start')), when(run.get('end')),
+            run['frames'], run['cameras'], levels.get('2', 0), levels.get('1', 0), levels.get('0', 0),
+            f"{flood_rate:.1%}",
+            f"{run['mean_score']:.3f}" if run.get('mean_score') is not None else "n/a",
+            f"{run['max_risk']:.2f}", run['high_risk'],
+        ])
+    figure = go.Figure(
+        [go.Bar(name=CLASSIFICATION[level]['label'], x=[run['run_id'] for run in runs],
+                y=[run['levels'].get(str(level), 0) for run in runs], marker_color=CLASSIFICATION[level]['color'])
+         for level in sorted(CLASSIFICATION, reverse=True)],
+        layout=go.Layout(title="Frames per level and run", barmode='stack', yaxis_title="frames",
+                         margin={'t': 40, 'l': 50, 'r': 20, 'b': 80}, height=340),
+    )
+    return html.Div([
+        html.P("Select two or more runs above to compare just those.", style={'color': '#666'}),
+        create_table(["Run", "Start", "End", "Frames", "Cameras", "Flood", "Suspicious", "Normal", "Flood rate",
+                      "Mean score", "Max risk", "High-risk frames"], rows),
+        dcc.Graph(figure=figure, config={'displayModeBar': False}),
+    ], style={'background': COLORS['card'], 'padding': '20px', 'borderRadius': '10px'})
+
+def create_table(headers: List[str], rows: List[List]) -> html.Table:
+    """Plain table in the latency panel's style"""
+    cell = {'padding': '6px 12px', 'borderBottom': f"1px solid {COLORS['border']}", 'textAlign': 'right'}
+    return html.Table([
+        html.Thead(html.Tr([html.Th(header, style=cell) for header in headers])),
+        html.Tbody([html.Tr([html.Td(value, style=cell) for value in row]) for row in rows]),
+    ], style={'borderCollapse': 'collapse', 'width': '100%', 'fontSize': '14px'})
+
 def create_legend_item(symbol: str, description: str) -> html.Div:
     """Create a legend item"""
     return html.Div([
@@ -259,6 +810,6 @@ def create_legend_item(symbol: str, description: str) -> html.Div:
         html.Span(description, style={'color': COLORS['text']})
     ], style={'display': 'flex', 'alignItems': 'center'})
 
-def count_by_prediction(sensors: List[Dict], prediction_level: int) -> int:
+def count_by_prediction(sensors: SensorStore, prediction_level: int) -> int:
     """Count sensors with specific prediction level"""
-    return sum(1 for s in sensors if s.get('prediction') == prediction_level)
+    return sensors.count_by_prediction(prediction_level)
@@ -1,22 +1,80 @@
 """
 Data loader module for reading JSON files and extracting sensor data
 """
+import glob
+import hashlib
 import json
+import logging
 import os
-from typing import Dict, List, Optional
-from config import DATA_DIR
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from config import DATA_ROOT, DATA_DIR_PATTERN, LOADER_WORKERS
+from metrics import REGISTRY, timed
+from sensor_store import SensorStore
 
-def load_json_file(filename: str) -> Optional[Dict]:
-    """Load a JSON file and return its contents"""
-    filepath = os.path.join(DATA_DIR, filename)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LoadReport:
+    """Per-file parse timings and failures collected during a load"""
+    parse_times: Dict[str, float] = field(default_factory=dict)
+    failures: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def files_loaded(self) -> int:
+        return len(self.parse_times)
+
+    @property
+    def total_parse_s(self) -> float:
+        return sum(self.parse_times.values())
+
+    def slowest(self, n: int = 5) -> List[Tuple[str, float]]:
+        """Return the n files that took longest to parse"""
+        return sorted(self.parse_times.items(), key=lambda item: item[1], reverse=True)[:n]
+
+
+def parse_json_bytes(raw: bytes) -> Dict:
+    """Decode JSON with orjson when installed, falling back to the stdlib"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+@timed('flood_json_parse_seconds')
+def read_json_file(path: str) -> Dict:
+    """Read and decode one JSON file, raising OSError or ValueError"""
+    with open(path, 'rb') as f:
+        return parse_json_bytes(f.read())
+
+
+def load_json_file(filename: str, data_dir: Optional[str] = None) -> Optional[Dict]:
+    """Load a JSON file and return its contents, or None if it is missing or invalid
+
+    filename is a path; a bare file name is looked up in data_dir, by default the first run
+    directory under DATA_ROOT (where all detection files lived before runs were discovered).
+    """
+    filepath = filename
+    if not os.path.dirname(filename):
+        filepath = os.path.join(data_dir or default_data_roots()[0], filename)
     try:
-        with open(filepath, 'r') as f:
-            return json.load(f)
+        return read_json_file(filepath)
     except FileNotFoundError:
-        print(f"Warning: {filepath} not found")
+        logger.warning("%s not found", filepath)
         return None
-    except json.JSONDecodeError:
-        print(f"Error: {filepath} is not valid JSON")
+    except ValueError:
+        logger.error("%s is not valid JSON", filepath)
         return None
 
 def extract_location(data: Dict) -> Optional[tuple]:
@@ -34,6 +92,21 @@ def extract_location(data: Dict) -> Optional[tuple]:
     except (ValueError, AttributeError):
         return None
 
+# Keys of the per-frame 'timing' block kept for latency analytics
+TIMING_FIELDS = [
+    'queue_wait_s',
+    'fsm_infer_dispatch_s',
+    'backend_inference_s',
+    'backend_inference_cold_start',
+    'collector_capture_to_processor_receive_s',
+    'total_pipeline_latency_s',
+]
+
+# Boolean stability flags the edge classifier sets per frame
+FLAG_FIELDS = ['flapping', 'drift', 'conflict']
+
+
+@timed('flood_extract_seconds')
 def extract_sensor_data(data: Dict) -> Dict:
     """Extract all relevant sensor and classification data"""
     if not data:
@@ -41,39 +114,160 @@ def extract_sensor_data(data: Dict) -> Dict:
 
     metadata = data.get('metadata', {})
     classification = data.get('classification_result', {})
+    timing = data.get('timing', {})
 
     return {
         'location': extract_location(data),
         'timestamp': metadata.get('timestamp', 'N/A'),
         'camera_id': metadata.get('camera_id', 'Unknown'),
+        'run_id': metadata.get('run_id', 'Unknown'),
+        'capture_ts': metadata.get('collector_capture_ts'),
+        'video_timestamp_sec': metadata.get('video_timestamp_sec'),
         'sensor_baseline': metadata.get('sensor_baseline', {}),
         'sensor_data': metadata.get('sensor_data', {}),
         'sensor_anomalies': metadata.get('sensor_anomalies', {}),
         'prediction': classification.get('prediction', 0),
         'scores': classification.get('scores', {}),
-        'state': classification.get('state', 'Unknown')
+        'state': classification.get('state', 'Unknown'),
+        'model_tier': classification.get('model_tier', 'Unknown'),
+        'backend': classification.get('backend', 'Unknown'),
+        'timing': {key: timing.get(key) for key in TIMING_FIELDS},
+        'flags': {key: classification.get(key) for key in FLAG_FIELDS}
     }
 
-def load_all_sensors(max_sensors: int = 25) -> List[Dict]:
-    """Load all available sensor JSON files (1.json, 2.json, ...)"""
-    sensors = []
-
-    if not os.path.exists(DATA_DIR):
-        print(f"Error: Data directory '{DATA_DIR}' does not exist!")
-        return sensors
-
-    for i in range(1, max_sensors + 1):
-        filename = f"{i}.json"
-        data = load_json_file(filename)
-
-        if data:
-            sensor_info = extract_sensor_data(data)
-            sensor_info['id'] = i
-            sensor_info['image_file'] = f"{i}.png"
-            sensors.append(sensor_info)
-        else:
-            if i == 1:
-                break
+def _natural_key(path: str) -> list:
+    """Sort key that orders 2.json before 10.json"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', path)]
+
+
+def default_data_roots(latest: Optional[int] = None) -> List[str]:
+    """Run directories under DATA_ROOT matching DATA_DIR_PATTERN, oldest first; only the newest
+    `latest` when given. DATA_ROOT itself when no run directory matches."""
+    roots = sorted(glob.glob(os.path.join(DATA_ROOT, DATA_DIR_PATTERN)), key=_natural_key)
+    if latest:
+        roots = roots[-latest:]
+    return roots or [DATA_ROOT]
+
+
+def discover_sensor_files(roots: Optional[Sequence[str]] = None) -> List[str]:
+    """Find every detection JSON file below the given data roots"""
+    roots = roots or default_data_roots()
+    files, seen = [], set()
+    for root in roots:
+        if not os.path.isdir(root):
+            logger.error("Data directory '%s' does not exist", root)
             continue
+        found = glob.glob(os.path.join(root, '**', '*.json'), recursive=True)
+        for path in sorted(found, key=_natural_key):
+            if path not in seen:
+                seen.add(path)
+                files.append(path)
+    return files
+
+
+def run_directory(path: str) -> Optional[str]:
+    """The run directory (matching DATA_DIR_PATTERN) a detection file lies in, at any depth, or None"""
+    directory = os.path.dirname(path)
+    while directory:
+        if fnmatch(os.path.basename(directory), DATA_DIR_PATTERN):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+    return None
+
+
+# Ids of files named <n>.json directly in run directory <pattern><r> (video_results_1/5.json is id 5)
+FILE_ID_STRIDE = 10 ** 6
+MAX_RUN_NUMBER = 999
+# Other files get ids hashed from their path, above the numbered ids and the run registry's on-demand ids
+HASHED_ID_BASE = 1 << 40
+
+
+def sensor_id(path: str) -> int:
+    """Stable id of a detection file, independent of which files were discovered or parsed first
+
+    n.json in run directory number r gets (r - 1) * FILE_ID_STRIDE + n, so the first run keeps the
+    file numbers as ids; files with other names or locations get HASHED_ID_BASE plus a path hash.
+    """
+    run_root = run_directory(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    run_number = re.search(r'(\d+)$', os.path.basename(run_root)) if run_root else None
+    if (run_number and stem.isdigit() and os.path.dirname(path) == run_root
+            and 1 <= int(run_number.group(1)) <= MAX_RUN_NUMBER and 0 < int(stem) < FILE_ID_STRIDE):
+        return (int(run_number.group(1)) - 1) * FILE_ID_STRIDE + int(stem)
+    digest = hashlib.sha1(record_location(path)[1].encode('utf-8')).hexdigest()
+    return HASHED_ID_BASE + int(digest[:10], 16)
+
+
+def record_location(path: str) -> Tuple[str, str]:
+    """(run directory name, image path relative to the served data root) of a detection file
+
+    The data root served under /data and /img is the parent of the run directories, or DATA_ROOT
+    for files outside any run directory; nested files keep their subdirectories in the image path.
+    """
+    image = f"{os.path.splitext(path)[0]}.png"
+    run_root = run_directory(path)
+    if run_root is not None:
+        return os.path.basename(run_root), os.path.relpath(image, os.path.dirname(run_root)).replace(os.sep, '/')
+    data_root = os.path.abspath(DATA_ROOT)
+    if os.path.commonpath([os.path.abspath(image), data_root]) == data_root:
+        image_path = os.path.relpath(image, DATA_ROOT)
+    else:
+        image_path = os.path.basename(image)
+    return os.path.basename(os.path.dirname(path)), image_path.replace(os.sep, '/')
+
+
+def parse_sensor_file(path: str) -> Tuple[str, Optional[Dict], float, Optional[str]]:
+    """Read and extract one detection file, returning (path, record, seconds, error)"""
+    start = time.perf_counter()
+    try:
+        record = extract_sensor_data(read_json_file(path))
+        error = None if record else "empty document"
+    except (OSError, ValueError) as e:
+        record, error = None, str(e)
+    REGISTRY.inc('flood_files_total', result='failed' if error else 'ok')
+    return path, record, time.perf_counter() - start, error
+
+
+def iter_sensors(roots: Optional[Sequence[str]] = None, workers: int = LOADER_WORKERS,
+                 use_processes: bool = False, report: Optional[LoadReport] = None,
+                 files: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+    """Parse detection files in a worker pool and yield records in file order as they complete"""
+    files = list(files) if files is not None else discover_sensor_files(roots)
+    report = report if report is not None else LoadReport()
+    executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    window = max(1, workers) * 4
+
+    with executor_cls(max_workers=max(1, workers)) as executor:
+        pending = deque(executor.submit(parse_sensor_file, path) for path in files[:window])
+        queued = len(pending)
+        while pending:
+            path, record, elapsed, error = pending.popleft().result()
+            if queued < len(files):
+                pending.append(executor.submit(parse_sensor_file, files[queued]))
+                queued += 1
+
+            report.parse_times[path] = elapsed
+            if error:
+                report.failures[path] = error
+                logger.warning("Failed to load %s: %s", path, error)
+                continue
+
+            record['id'] = sensor_id(path)
+            record['source_file'] = path
+            record['run_dir'], record['image_file'] = record_location(path)
+            yield record
+
+
+def load_all_sensors(roots: Optional[Sequence[str]] = None, max_sensors: Optional[int] = None,
+                     workers: int = LOADER_WORKERS, report: Optional[LoadReport] = None) -> List[Dict]:
+    """Load every discovered sensor JSON file, optionally capped at max_sensors"""
+    return list(islice(iter_sensors(roots, workers=workers, report=report), max_sensors))
+
 
-    return sensors
+def load_sensor_store(roots: Optional[Sequence[str]] = None, max_sensors: Optional[int] = None,
+                      workers: int = LOADER_WORKERS, report: Optional[LoadReport] = None) -> SensorStore:
+    """Load all available sensor JSON files into a columnar SensorStore"""
+    return SensorStore.from_records(load_all_sensors(roots, max_sensors, workers, report))
@@ -0,0 +1,133 @@
+"""
+Hex-bin flood density layers precomputed per zoom level and served as cached GeoJSON
+"""
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+import flask
+import numpy as np
+from config import CLASSIFICATION, DENSITY_LEVELS, FYN_ISLAND_CENTER, MAP_CACHE_ENTRIES
+from map_cache import RenderedMap, precompressed_response
+from sensor_store import SensorStore
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SQRT3 = np.sqrt(3.0)
+
+# Longitude is scaled by cos(reference latitude) so hexagons are roughly regular on the ground
+LON_SCALE = float(np.cos(np.radians(FYN_ISLAND_CENTER[0])))
+
+
+def hex_bin(lat: np.ndarray, lon: np.ndarray, size_deg: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Axial (q, r) coordinates of the pointy-top hexagon of circumradius size_deg containing each point"""
+    x, y = lon * LON_SCALE, lat
+    q = (SQRT3 / 3 * x - y / 3) / size_deg
+    r = (2 / 3 * y) / size_deg
+
+    # Cube rounding: round all three coordinates, then fix the one with the largest error
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def hex_polygons(q: np.ndarray, r: np.ndarray, size_deg: float) -> np.ndarray:
+    """Closed [lon, lat] rings of shape (cells, 7, 2) for axial hex coordinates"""
+    cx = size_deg * (SQRT3 * q + SQRT3 / 2 * r)
+    cy = size_deg * 1.5 * r
+    angles = np.radians(30 + 60 * np.arange(7))
+    ring_x = (cx[:, None] + size_deg * np.cos(angles)[None, :]) / LON_SCALE
+    ring_y = cy[:, None] + size_deg * np.sin(angles)[None, :]
+    return np.stack([ring_x, ring_y], axis=2)
+
+
+def density_geojson(sensors: SensorStore, size_deg: float) -> Dict:
+    """FeatureCollection with one hexagon per occupied cell and its per-level counts and scores"""
+    located = sensors.has_location()
+    lat, lon = sensors['lat'][located], sensors['lon'][located]
+    if not len(lat):
+        return {'type': 'FeatureCollection', 'features': []}
+    prediction = sensors['prediction'][located].astype(np.intp)
+    score = np.nan_to_num(sensors['combined_score'][located])
+
+    q, r = hex_bin(lat, lon, size_deg)
+    cells, inverse = np.unique(np.stack([q, r], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    groups, levels = len(cells), len(CLASSIFICATION)
+
+    by_level = np.bincount(inverse * levels + prediction, minlength=groups * levels).reshape(groups, levels)
+    count = by_level.sum(axis=1)
+    mean_score = np.bincount(inverse, weights=score, minlength=groups) / count
+    max_score = np.full(groups, -np.inf)
+    np.maximum.at(max_score, inverse, score)
+    flood_share = by_level[:, levels - 1] / count
+    # The worst level present sets the colour; the flood share and density set the opacity
+    worst = levels - 1 - np.argmax(by_level[:, ::-1] > 0, axis=1)
+    opacity = np.clip(0.25 + 0.5 * flood_share + 0.1 * np.log10(count), 0.25, 0.85)
+
+    rings = np.round(hex_polygons(cells[:, 0], cells[:, 1], size_deg), 5).tolist()
+    features = []
+    for c in range(groups):
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': [rings[c]]},
+            'properties': {
+                'count': int(count[c]),
+                'levels': by_level[c].tolist(),
+                'flood_share': round(float(flood_share[c]), 3),
+                'mean_score': round(float(mean_score[c]), 3),
+                'max_score': round(float(max_score[c]), 3),
+                'color': CLASSIFICATION[int(worst[c])]['color'],
+                'opacity': round(float(opacity[c]), 2),
+            },
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+class DensityCache:
+    """GeoJSON for every density level, computed once per sensor-set fingerprint
+
+    Like the map cache, the most recent sensor sets (e.g. time windows) are kept.
+    """
+
+    def __init__(self, levels: List[Tuple[int, float]] = DENSITY_LEVELS, max_entries: int = MAP_CACHE_ENTRIES):
+        self.levels = levels
+        self.max_entries = max_entries
+        self.rendered: 'OrderedDict[str, Dict[int, RenderedMap]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, sensors: SensorStore) -> Dict[int, RenderedMap]:
+        """Precompute and compress all levels for a sensor set"""
+        fingerprint = sensors.fingerprint()
+        with self._lock:
+            rendered = self.rendered.get(fingerprint)
+            if rendered is None:
+                rendered = {}
+                for level, (_, size_deg) in enumerate(self.levels):
+                    body = json.dumps(density_geojson(sensors, size_deg), separators=(',', ':')).encode('utf-8')
+                    rendered[level] = RenderedMap(
+                        fingerprint=f"{fingerprint}-{level}",
+                        html=body,
+                        gzip=gzip.compress(body, compresslevel=6),
+                        brotli=brotli.compress(body) if brotli is not None else None,
+                    )
+                self.rendered[fingerprint] = rendered
+                while len(self.rendered) > self.max_entries:
+                    self.rendered.popitem(last=False)
+            self.rendered.move_to_end(fingerprint)
+            return rendered
+
+    def response(self, sensors: SensorStore, level: int) -> flask.Response:
+        rendered = self.render(sensors).get(level)
+        if rendered is None:
+            flask.abort(404)
+        return precompressed_response(rendered, 'application/geo+json')
@@ -0,0 +1,19 @@
+"""
+Gunicorn settings for wsgi:application; the app is built once in the master and forked into workers
+"""
+import os
+from config import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_THREADS, SERVER_TIMEOUT_S
+
+bind = f"{os.getenv('SERVER_HOST', SERVER_HOST)}:{os.getenv('SERVER_PORT', SERVER_PORT)}"
+workers = int(os.getenv('SERVER_WORKERS', SERVER_WORKERS))
+threads = SERVER_THREADS
+worker_class = 'gthread'
+timeout = SERVER_TIMEOUT_S
+preload_app = True
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    import wsgi
+    from serving import start_background
+    start_background(wsgi.app)
@@ -0,0 +1,111 @@
+"""
+Thumbnail and rendition service for detection images
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import flask
+from werkzeug.security import safe_join
+from config import (DATA_ROOT, IMAGE_CACHE_DIR, IMAGE_RENDITIONS, IMAGE_FORMAT, IMAGE_QUALITY,
+                    IMAGE_WORKERS, IMAGE_CACHE_MAX_AGE_S, IMAGE_DIGEST_ENTRIES)
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+MIMETYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image-render")
+_in_flight: Dict[str, Future] = {}
+_digests: 'OrderedDict[Tuple[str, float, int], str]' = OrderedDict()
+_lock = threading.Lock()
+
+
+def source_digest(path: str) -> str:
+    """Content hash of a source image, memoized on path/mtime/size for the most recent IMAGE_DIGEST_ENTRIES"""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    with _lock:
+        digest = _digests.get(key)
+        if digest is not None:
+            _digests.move_to_end(key)
+            return digest
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    with _lock:
+        _digests[key] = digest
+        while len(_digests) > IMAGE_DIGEST_ENTRIES:
+            _digests.popitem(last=False)
+    return digest
+
+
+def _render(source_path: str, target_path: str, max_size: int) -> str:
+    """Downscale an image and write it atomically to the cache"""
+    with Image.open(source_path) as image:
+        image.thumbnail((max_size, max_size))
+        if IMAGE_FORMAT == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        # Per-process temporary name: several server workers may render the same image at once
+        tmp_path = f"{target_path}.tmp{os.getpid()}"
+        image.save(tmp_path, format=IMAGE_FORMAT, quality=IMAGE_QUALITY)
+    os.replace(tmp_path, target_path)
+    return target_path
+
+
+def get_rendition(source_path: str, rendition: str) -> Tuple[str, str, str]:
+    """Return (path, mimetype, etag) for a rendition, rendering it in the worker pool on a cache miss"""
+    digest = source_digest(source_path)
+    if Image is None or rendition not in IMAGE_RENDITIONS:
+        return source_path, 'image/png', digest
+
+    etag = f"{digest}-{rendition}"
+    target_path = os.path.join(IMAGE_CACHE_DIR, f"{etag}.{EXTENSIONS[IMAGE_FORMAT]}")
+    if os.path.exists(target_path):
+        return target_path, MIMETYPES[IMAGE_FORMAT], etag
+
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    with _lock:
+        future = _in_flight.get(etag)
+        if future is None:
+            future = _executor.submit(_render, source_path, target_path, IMAGE_RENDITIONS[rendition])
+            _in_flight[etag] = future
+    try:
+        future.result()
+    finally:
+        with _lock:
+            _in_flight.pop(etag, None)
+    return target_path, MIMETYPES[IMAGE_FORMAT], etag
+
+
+def image_url(image_file: str, rendition: Optional[str] = None) -> str:
+    """Path of an image (relative to the data root) or one of its renditions on the dashboard server"""
+    if rendition:
+        return f"/img/{rendition}/{image_file}"
+    return f"/data/{image_file}"
+
+
+def register_image_routes(server: flask.Flask, data_root: str = DATA_ROOT) -> None:
+    """Serve cached renditions with ETag, Cache-Control and Range support"""
+    data_path = os.path.abspath(data_root)
+
+    @server.route('/img/<rendition>/<path:filename>')
+    def serve_rendition(rendition, filename):
+        if rendition not in IMAGE_RENDITIONS:
+            flask.abort(404)
+        source_path = safe_join(data_path, filename)
+        if source_path is None or not os.path.isfile(source_path):
+            flask.abort(404)
+
+        path, mimetype, etag = get_rendition(source_path, rendition)
+        response = flask.send_file(path, mimetype=mimetype, etag=etag, conditional=True,
+                                   max_age=IMAGE_CACHE_MAX_AGE_S)
+        response.cache_control.public = True
+        return response
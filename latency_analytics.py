@@ -0,0 +1,67 @@
+"""
+Edge-pipeline latency statistics computed from the per-frame timing columns
+"""
+from typing import Dict, List, Optional
+import numpy as np
+from sensor_store import SensorStore
+
+# Timing columns summarized in the latency panel, with display labels
+LATENCY_COLUMNS = {
+    'pipeline_latency_s': "Total pipeline",
+    'queue_wait_s': "Queue wait",
+    'infer_dispatch_s': "FSM inference dispatch",
+    'backend_inference_s': "Backend inference",
+}
+
+PERCENTILES = (50, 95, 99)
+
+
+def latency_percentiles(values: np.ndarray) -> Dict[str, Optional[float]]:
+    """Frame count and p50/p95/p99 of a timing column, ignoring missing values"""
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {'count': 0, **{f'p{p}': None for p in PERCENTILES}}
+    quantiles = np.percentile(values, PERCENTILES)
+    return {'count': int(len(values)), **{f'p{p}': float(q) for p, q in zip(PERCENTILES, quantiles)}}
+
+
+def cold_start_rate(flags: np.ndarray) -> Optional[float]:
+    """Share of frames whose inference hit a cold backend"""
+    flags = flags[~np.isnan(flags)]
+    return float((flags > 0).mean()) if len(flags) else None
+
+
+def latency_summary(sensors: SensorStore) -> List[Dict]:
+    """One row per timing column with its percentiles"""
+    return [{'name': label, **latency_percentiles(sensors[column])}
+            for column, label in LATENCY_COLUMNS.items()]
+
+
+def latency_breakdown(sensors: SensorStore, group: str, column: str = 'pipeline_latency_s') -> List[Dict]:
+    """Percentiles of one timing column and the cold-start rate per value of an interned column"""
+    codes = sensors[f'{group}_code']
+    values, cold = sensors[column], sensors['inference_cold_start']
+    rows = []
+    for code in np.flatnonzero(np.bincount(codes, minlength=len(sensors.tables[group]))):
+        mask = codes == code
+        rows.append({
+            'name': sensors.tables[group][code],
+            **latency_percentiles(values[mask]),
+            'cold_start_rate': cold_start_rate(cold[mask]),
+        })
+    return sorted(rows, key=lambda row: -row['count'])
+
+
+def lag_histogram(sensors: SensorStore, column: str = 'capture_to_processor_s', bins: int = 30) -> Dict:
+    """Histogram of capture-to-processor lag on a log scale when it spans orders of magnitude"""
+    values = sensors[column]
+    values = values[~np.isnan(values) & (values >= 0)]
+    if not len(values):
+        return {'edges': [], 'counts': []}
+    low, high = values.min(), values.max()
+    if low > 0 and high / low > 100:
+        edges = np.geomspace(low, high, bins + 1)
+    else:
+        edges = np.linspace(low, high if high > low else low + 1, bins + 1)
+    counts, edges = np.histogram(values, bins=edges)
+    return {'edges': edges.tolist(), 'counts': counts.tolist()}
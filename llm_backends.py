@@ -0,0 +1,234 @@
+"""
+Pluggable LLM backends: OpenAI, a local OpenAI-compatible server, and record/replay by prompt hash
+"""
+import abc
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Iterator, Optional
+from config import (LLM_BACKEND, LLM_MODEL, LLM_BASE_URL, LLM_LOCAL_URL, LLM_LOCAL_MODEL, LLM_REPLAY_DIR,
+                    LLM_REPLAY_LATENCY_S, LLM_MAX_CONNECTIONS, LLM_TIMEOUT_S)
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayMiss(KeyError):
+    """No recorded completion exists for a prompt"""
+
+
+class RateLimiter:
+    """Token bucket allowing `rate_per_min` acquisitions per minute with bursts up to `burst`"""
+
+    def __init__(self, rate_per_min: float, burst: int = 1):
+        self.interval = 60.0 / rate_per_min if rate_per_min > 0 else 0.0
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request may be sent"""
+        if not self.interval:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) / self.interval)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) * self.interval
+            time.sleep(wait)
+
+
+class LLMBackend(abc.ABC):
+    """Chat completion interface used by the report generators"""
+
+    model: str = ""
+
+    @abc.abstractmethod
+    def complete(self, system_prompt: str, prompt: str, temperature: float = 0.3,
+                 max_tokens: int = 2500) -> str:
+        """Return the whole completion for a prompt"""
+
+    def stream(self, system_prompt: str, prompt: str, temperature: float = 0.3,
+               max_tokens: int = 2500) -> Iterator[str]:
+        """Yield the completion in chunks; backends without streaming yield it whole"""
+        yield self.complete(system_prompt, prompt, temperature, max_tokens)
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI chat completions through one lazily built client with a pooled HTTP connection"""
+
+    def __init__(self, model: str = LLM_MODEL, api_key: Optional[str] = None,
+                 base_url: Optional[str] = LLM_BASE_URL, max_connections: int = LLM_MAX_CONNECTIONS,
+                 timeout_s: float = LLM_TIMEOUT_S):
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.timeout_s = timeout_s
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    from openai import OpenAI
+                    http_client = httpx.Client(
+                        limits=httpx.Limits(max_connections=self.max_connections,
+                                            max_keepalive_connections=self.max_connections),
+                        timeout=self.timeout_s,
+                    )
+                    self._client = OpenAI(api_key=self.api_key or os.getenv('OPENAI_API_KEY'),
+                                          base_url=self.base_url, http_client=http_client)
+        return self._client
+
+    def _messages(self, system_prompt: str, prompt: str):
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+
+    def complete(self, system_prompt: str, prompt: str, temperature: float = 0.3,
+                 max_tokens: int = 2500) -> str:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(system_prompt, prompt),
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content or ""
+
+    def stream(self, system_prompt: str, prompt: str, temperature: float = 0.3,
+               max_tokens: int = 2500) -> Iterator[str]:
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(system_prompt, prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        try:
+            for event in stream:
+                if event.choices and event.choices[0].delta.content:
+                    yield event.choices[0].delta.content
+        finally:
+            stream.close()
+
+
+class LocalHTTPBackend(OpenAIBackend):
+    """A local OpenAI-compatible server such as llama.cpp's llama-server or vLLM"""
+
+    def __init__(self, base_url: str = LLM_LOCAL_URL, model: str = LLM_LOCAL_MODEL, **kwargs):
+        super().__init__(model=model, api_key="local", base_url=base_url, **kwargs)
+
+
+def prompt_hash(model: str, system_prompt: str, prompt: str) -> str:
+    """Key of a recorded completion"""
+    payload = json.dumps([model, system_prompt, prompt])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ReplayBackend(LLMBackend):
+    """Serve completions recorded on disk by prompt hash, optionally recording misses from another backend
+
+    Replayed streams are split into fixed-size chunks with a fixed delay each, so latency is
+    deterministic.
+    """
+
+    def __init__(self, directory: str = LLM_REPLAY_DIR, record_from: Optional[LLMBackend] = None,
+                 latency_s: float = LLM_REPLAY_LATENCY_S, chunk_size: int = 64, model: str = LLM_MODEL):
+        self.directory = directory
+        self.record_from = record_from
+        self.latency_s = latency_s
+        self.chunk_size = chunk_size
+        self.model = record_from.model if record_from is not None else model
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self, system_prompt: str, prompt: str) -> Optional[str]:
+        try:
+            with open(self.path(prompt_hash(self.model, system_prompt, prompt)), 'r', encoding='utf-8') as f:
+                return json.load(f)['completion']
+        except OSError:
+            return None
+
+    def record(self, system_prompt: str, prompt: str, completion: str) -> None:
+        """Store a completion for later replay"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(prompt_hash(self.model, system_prompt, prompt))
+        tmp_path = f"{path}.tmp{threading.get_ident()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'model': self.model, 'system_prompt': system_prompt, 'prompt': prompt,
+                       'completion': completion}, f)
+        os.replace(tmp_path, path)
+
+    def complete(self, system_prompt: str, prompt: str, temperature: float = 0.3,
+                 max_tokens: int = 2500) -> str:
+        completion = self._load(system_prompt, prompt)
+        if completion is None:
+            if self.record_from is None:
+                raise ReplayMiss(f"No recorded completion for prompt {prompt_hash(self.model, system_prompt, prompt)[:12]}")
+            completion = self.record_from.complete(system_prompt, prompt, temperature, max_tokens)
+            self.record(system_prompt, prompt, completion)
+        elif self.latency_s:
+            time.sleep(self.latency_s)
+        return completion
+
+    def stream(self, system_prompt: str, prompt: str, temperature: float = 0.3,
+               max_tokens: int = 2500) -> Iterator[str]:
+        completion = self._load(system_prompt, prompt)
+        if completion is None:
+            yield self.complete(system_prompt, prompt, temperature, max_tokens)
+            return
+        for start in range(0, len(completion), self.chunk_size):
+            if self.latency_s:
+                time.sleep(self.latency_s)
+            yield completion[start:start + self.chunk_size]
+
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name: Optional[str] = None) -> LLMBackend:
+    """Build a backend by name: 'openai', 'local', 'replay' or 'record' (replay, recording misses from OpenAI)"""
+    # .env is read here, on first use, rather than when the module is imported
+    from dotenv import load_dotenv
+    load_dotenv()
+    name = name or os.getenv('LLM_BACKEND', LLM_BACKEND)
+    if name == 'openai':
+        return OpenAIBackend()
+    if name == 'local':
+        return LocalHTTPBackend()
+    if name == 'replay':
+        return ReplayBackend()
+    if name == 'record':
+        return ReplayBackend(record_from=OpenAIBackend())
+    raise ValueError(f"Unknown LLM backend: {name}")
+
+
+def get_backend() -> LLMBackend:
+    """The process-wide backend, created on first use"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+                logger.info("Using %s LLM backend (%s)", type(_backend).__name__, _backend.model)
+    return _backend
+
+
+def set_backend(backend: LLMBackend) -> None:
+    """Replace the process-wide backend, e.g. with a ReplayBackend in benchmarks"""
+    global _backend
+    _backend = backend
@@ -1,15 +1,41 @@
 """
-LLM Report Generator using OpenAI GPT-5
+LLM Report Generator with stakeholder-specific prompts
 """
+import hashlib
+import json
 import os
-from openai import OpenAI
-from typing import List, Dict
+import re
+import time
+from dataclasses import dataclass
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from config import PROMPT_TOKEN_BUDGET, PROMPT_TOP_K, PROMPT_CELL_DEG, RISK_CELL_DEG, RISK_TOP_LOCATIONS
+from prompt_compaction import (camera_delta_lines, camera_stability_lines, cell_summary_lines, class_summary_lines,
+                               estimate_tokens, fit_lines, risk_location_lines, top_score_index)
+from sensor_store import SensorStore
+from report_store import ReportStore
 from datetime import datetime
-from dotenv import load_dotenv
+from llm_backends import get_backend
+from metrics import REGISTRY
 
-load_dotenv()
+# Bump whenever the prompt text or STAKEHOLDER_PROMPTS change so cached reports are not reused
+PROMPT_TEMPLATE_VERSION = 3
 
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+_report_store: Optional[ReportStore] = None
+
+
+def get_report_store() -> ReportStore:
+    """Open the persistent report cache on first use"""
+    global _report_store
+    if _report_store is None:
+        _report_store = ReportStore()
+    return _report_store
+
+
+def set_report_store(store: ReportStore) -> None:
+    """Replace the report cache, e.g. with a throwaway database in benchmarks"""
+    global _report_store
+    _report_store = store
 
 STAKEHOLDER_PROMPTS = {
     "general": {
@@ -118,32 +144,133 @@ STAKEHOLDER_PROMPTS = {
 }
 
 
-def generate_report(sensors: List[Dict], stakeholder: str = "general") -> str:
-    """Generate a comprehensive flood monitoring report using GPT-5"""
-    config = STAKEHOLDER_PROMPTS.get(stakeholder, STAKEHOLDER_PROMPTS["general"])
+def _optional(value: float):
+    """Convert a NaN column value back to None for prompt formatting"""
+    return None if np.isnan(value) else float(value)
 
+
+def build_sensor_details(sensors: SensorStore) -> List[Dict]:
+    """Build the per-camera detail rows used in the prompt from store columns"""
+    camera_ids = sensors.labels('camera_id')
+    has_location = sensors.has_location()
+    combined = np.nan_to_num(sensors['combined_score'])
+    lat, lon = sensors['lat'], sensors['lon']
+
+    sensor_details = []
+    for i in range(len(sensors)):
+        sensor_details.append({
+            'camera_id': camera_ids[i],
+            'location': (float(lat[i]), float(lon[i])) if has_location[i] else None,
+            'classification': int(sensors['prediction'][i]),
+            'combined_score': float(combined[i]),
+            'temperature': _optional(sensors['temperature'][i]),
+            'humidity': _optional(sensors['humidity'][i]),
+            'pressure': _optional(sensors['pressure'][i]),
+            'delta_temp': _optional(sensors['delta_temperature'][i]),
+            'delta_humidity': _optional(sensors['delta_humidity'][i]),
+            'delta_pressure': _optional(sensors['delta_pressure'][i]),
+        })
+    return sensor_details
+
+
+def report_cache_key(sensor_data: str, stakeholder: str, model: Optional[str] = None) -> str:
+    """Hash of the prompt's sensor data section, stakeholder, prompt template version and model"""
+    model = model or get_backend().model
+    payload = json.dumps({
+        'sensors': sensor_data,
+        'stakeholder': stakeholder,
+        'prompt_version': PROMPT_TEMPLATE_VERSION,
+        'model': model,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def compact_sensor_data(sensors: SensorStore, token_budget: int = PROMPT_TOKEN_BUDGET,
+                        top_k: int = PROMPT_TOP_K, cell_deg: float = PROMPT_CELL_DEG) -> str:
+    """Sensor data section of the prompt, kept under a token budget
+
+    Up to top_k frames are listed one by one as before. Larger sets are summarized per
+    classification level, spatial grid cell and camera, with only the top_k highest-scoring
+    frames kept verbatim. Both end with the highest-risk locations and per-camera stability
+    from risk_analytics, so the model is handed ranked risks rather than raw readings to compare.
+    """
+    if len(sensors) <= top_k:
+        details = format_sensor_data_for_prompt(build_sensor_details(sensors))
+        return "\n\n".join([details] + risk_sections(sensors, token_budget - estimate_tokens(details)))
+
+    top_details = build_sensor_details(sensors.take(top_score_index(sensors, top_k)))
+    headers = [
+        f"Compacted from {len(sensors)} frames.",
+        "By classification level:",
+        f"Highest flooding scores (top {len(top_details)} frames, verbatim):",
+        f"By area (~{cell_deg}° grid cells, most flooded first):",
+        "By camera (baseline deltas, mean [min, max]):",
+    ]
+    summary = class_summary_lines(sensors)
+    remaining = token_budget - estimate_tokens("\n\n".join(headers + summary))
+
+    risks = risk_sections(sensors, remaining // 3)
+    remaining -= estimate_tokens("\n\n".join(risks))
+    frames, used = fit_lines([format_sensor_data_for_prompt([detail]) for detail in top_details],
+                             remaining // 2)
+    remaining -= used
+    cells, used = fit_lines(cell_summary_lines(sensors, cell_deg), remaining // 2)
+    remaining -= used
+    cameras, _ = fit_lines(camera_delta_lines(sensors), remaining)
+
+    sections = [[headers[0]], [headers[1]] + summary, [headers[2]] + frames,
+                [headers[3]] + cells, [headers[4]] + cameras]
+    return "\n\n".join(["\n".join(section) for section in sections] + risks)
+
+
+def risk_sections(sensors: SensorStore, token_budget: int) -> List[str]:
+    """Highest-risk locations and camera stability sections, splitting the budget between them"""
+    locations, used = fit_lines(risk_location_lines(sensors, RISK_TOP_LOCATIONS, RISK_CELL_DEG), token_budget // 2)
+    cameras, _ = fit_lines(camera_stability_lines(sensors), token_budget - used)
+    return [
+        "\n".join(["Highest-risk locations (risk 0-1 from score, level, baseline z-scores and trend):"] + locations),
+        "\n".join(["Camera stability (level changes between consecutive frames, edge flags, score trend):"]
+                  + cameras),
+    ]
+
+
+@dataclass
+class ReportContext:
+    """Stakeholder-independent prompt inputs, built once per sensor set and shared by every report"""
+    sensor_data: str
+    data_block: str
+
+
+def build_report_context(sensors: SensorStore) -> ReportContext:
+    """Build the data summary and detailed sensor block shared by all stakeholder prompts"""
     # Prepare data summary for the LLM
     total_sensors = len(sensors)
-    flood_count = sum(1 for s in sensors if s.get('prediction') == 2)
-    suspicious_count = sum(1 for s in sensors if s.get('prediction') == 1)
-    normal_count = sum(1 for s in sensors if s.get('prediction') == 0)
+    counts = sensors.prediction_counts()
+    flood_count = counts.get(2, 0)
+    suspicious_count = counts.get(1, 0)
+    normal_count = counts.get(0, 0)
 
-    # Prepare detailed sensor information
-    sensor_details = []
-    for sensor in sensors:
-        detail = {
-            'camera_id': sensor.get('camera_id'),
-            'location': sensor.get('location'),
-            'classification': sensor.get('prediction'),
-            'combined_score': sensor.get('scores', {}).get('combined_score', 0),
-            'temperature': sensor.get('sensor_data', {}).get('temperature'),
-            'humidity': sensor.get('sensor_data', {}).get('humidity'),
-            'pressure': sensor.get('sensor_data', {}).get('pressure'),
-            'delta_temp': sensor.get('sensor_anomalies', {}).get('delta_temperature'),
-            'delta_humidity': sensor.get('sensor_anomalies', {}).get('delta_humidity'),
-            'delta_pressure': sensor.get('sensor_anomalies', {}).get('delta_pressure'),
-        }
-        sensor_details.append(detail)
+    # Prepare detailed sensor information, compacted to the prompt token budget
+    sensor_data = compact_sensor_data(sensors)
+
+    data_block = f"""**DATA SUMMARY:**
+- Total Monitoring Stations: {total_sensors}
+- Critical Flood Alerts (Level 2): {flood_count}
+- Suspicious Areas (Level 1): {suspicious_count}
+- Normal Conditions (Level 0): {normal_count}
+- Report Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+**DETAILED SENSOR DATA:**
+{sensor_data}"""
+
+    return ReportContext(sensor_data=sensor_data, data_block=data_block)
+
+
+def build_report_prompt(context: ReportContext, stakeholder: str = "general") -> Tuple[Dict, str, str]:
+    """Build (stakeholder config, user prompt, cache key) for a report from a shared context"""
+    stakeholder = stakeholder if stakeholder in STAKEHOLDER_PROMPTS else "general"
+    config = STAKEHOLDER_PROMPTS[stakeholder]
+    cache_key = report_cache_key(context.sensor_data, stakeholder)
 
     # Build numbered sections list from config
     sections_text = "\n".join(
@@ -163,15 +290,7 @@ Based on the following real-time sensor data from Fyn Island, Denmark.
 - Maintain professional tone
 - Format in markdown for readability
 
-**DATA SUMMARY:**
-- Total Monitoring Stations: {total_sensors}
-- Critical Flood Alerts (Level 2): {flood_count}
-- Suspicious Areas (Level 1): {suspicious_count}
-- Normal Conditions (Level 0): {normal_count}
-- Report Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-**DETAILED SENSOR DATA:**
-{format_sensor_data_for_prompt(sensor_details)}
+{context.data_block}
 
 **GENERATE A REPORT WITH THE FOLLOWING SECTIONS:**
 
@@ -179,20 +298,69 @@ Based on the following real-time sensor data from Fyn Island, Denmark.
 
 Be specific, data-driven, and actionable. Include actual sensor readings and coordinates in your analysis."""
 
+    return config, prompt, cache_key
+
+
+def record_token_usage(system_prompt: str, prompt: str, completion: str) -> None:
+    """Count estimated prompt and completion tokens of one LLM call"""
+    REGISTRY.inc('flood_report_prompt_tokens_total', estimate_tokens(system_prompt) + estimate_tokens(prompt))
+    REGISTRY.inc('flood_report_completion_tokens_total', estimate_tokens(completion))
+
+
+def request_completion(config: Dict, prompt: str) -> str:
+    """Request a complete (non-streamed) report, raising on API errors"""
+    # Lower temperature for more focused, factual output
+    completion = get_backend().complete(config["system_prompt"], prompt, temperature=0.3, max_tokens=2500)
+    record_token_usage(config["system_prompt"], prompt, completion)
+    return completion
+
+
+def generate_report_stream(sensors: SensorStore, stakeholder: str = "general",
+                           regenerate: bool = False, context: Optional[ReportContext] = None) -> Iterator[str]:
+    """Generate a report as a stream of text chunks from the configured LLM backend
+
+    Cached reports are yielded as a single chunk. A streamed completion is stored in the cache once
+    it has been fully received; closing the generator early aborts the API call. Backend errors are
+    raised to the caller, so a failed or interrupted completion is never cached or saved as a report.
+    """
+    start = time.perf_counter()
+    stakeholder = stakeholder if stakeholder in STAKEHOLDER_PROMPTS else "general"
+    context = context or build_report_context(sensors)
+    config, prompt, cache_key = build_report_prompt(context, stakeholder)
+    if not regenerate:
+        cached = get_report_store().get(cache_key)
+        REGISTRY.inc('flood_report_cache_total', result='hit' if cached is not None else 'miss')
+        if cached is not None:
+            REGISTRY.observe('flood_report_seconds', time.perf_counter() - start,
+                             stakeholder=stakeholder, cache='hit')
+            yield cached
+            return
+
+    backend = get_backend()
+    parts = []
+    stream = backend.stream(config["system_prompt"], prompt, temperature=0.3, max_tokens=2500)
     try:
-        response = client.chat.completions.create(
-            model="gpt-5-mini-2025-08-07",
-            messages=[
-                {"role": "system", "content": config["system_prompt"]},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,  # Lower temperature for more focused, factual output
-            max_tokens=2500
-        )
-
-        report = response.choices[0].message.content
-        return report
+        for chunk in stream:
+            parts.append(chunk)
+            yield chunk
+    finally:
+        stream.close()
+        REGISTRY.observe('flood_report_seconds', time.perf_counter() - start,
+                         stakeholder=stakeholder, cache='regenerate' if regenerate else 'miss')
+        record_token_usage(config["system_prompt"], prompt, "".join(parts))
+
+    if parts:
+        get_report_store().put(cache_key, "".join(parts), stakeholder, backend.model)
+
 
+def generate_report(sensors: SensorStore, stakeholder: str = "general", regenerate: bool = False) -> str:
+    """Generate a comprehensive flood monitoring report
+
+    Reports are served from the persistent cache when the same sensors, stakeholder, prompt version
+    and model were seen before; regenerate=True forces a fresh completion.
+    """
+    try:
+        return "".join(generate_report_stream(sensors, stakeholder, regenerate))
     except Exception as e:
         return f"**Error Generating Report**\n\nAn error occurred: {str(e)}\n\nPlease check your API key and connection."
 
@@ -216,22 +384,92 @@ Camera {sensor['camera_id']} (Location: {sensor['location']}):
     return "\n".join(formatted)
 
 
-def format_report_for_download(report: str) -> str:
-    """Convert markdown report to clean readable text"""
-    import re
+# Line-level markdown cleanup applied to downloaded reports, in order
+REPORT_LINE_RULES = [
+    (re.compile(r'^#{1,6}\s+(.+)$'), r'\n\n\1\n' + '=' * 60),  # headers -> section titles
+    (re.compile(r'\*\*(.+?)\*\*'), r'\1'),                      # bold
+    (re.compile(r'\*(.+?)\*'), r'\1'),                            # italic
+    (re.compile(r'^[\*\-]\s+'), '  • '),                           # bullet points
+]
+
+
+def format_report_line(line: str) -> str:
+    """Convert one markdown line to clean readable text"""
+    for pattern, replacement in REPORT_LINE_RULES:
+        line = pattern.sub(replacement, line)
+    return line
+
+
+class ReportFileWriter:
+    """Write a report to a downloadable text file incrementally, one completed line at a time"""
+
+    def __init__(self, directory: str = ".", prefix: str = "flood_report"):
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        base = f"{prefix}_{timestamp}"
+        self.filename = os.path.join(directory, f"{base}.txt")
+        suffix = 1
+        while True:
+            try:
+                self._file = open(self.filename, 'x', encoding='utf-8')
+                break
+            except FileExistsError:
+                suffix += 1
+                self.filename = os.path.join(directory, f"{base}_{suffix}.txt")
+
+        self._partial = ""
+        self._pending_newlines = 0
+        self._started = False
+        self._file.write(f"""
+{'=' * 70}
+FLOOD MONITORING REPORT - FYN ISLAND, DENMARK
+Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+{'=' * 70}
 
-    # Remove markdown formatting
-    clean_report = report
+""")
 
-    # Convert headers (### -> section titles)
-    clean_report = re.sub(r'^#{1,6}\s+(.+)$', r'\n\n\1\n' + '=' * 60, clean_report, flags=re.MULTILINE)
+    def _emit(self, text: str) -> None:
+        """Write converted text, collapsing runs of blank lines and dropping leading/trailing ones"""
+        for i, segment in enumerate(text.split('\n')):
+            if i:
+                self._pending_newlines += 1
+            if segment:
+                if self._started:
+                    self._file.write('\n' * min(self._pending_newlines, 2))
+                self._file.write(segment)
+                self._started = True
+                self._pending_newlines = 0
+
+    def write(self, chunk: str) -> None:
+        """Append a chunk of markdown; complete lines are converted and written immediately"""
+        lines = (self._partial + chunk).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._emit(format_report_line(line) + '\n')
+
+    def close(self) -> str:
+        """Flush the last line and return the file name"""
+        if self._partial:
+            self._emit(format_report_line(self._partial))
+            self._partial = ""
+        self._file.close()
+        return self.filename
+
+    def abort(self) -> None:
+        """Close and delete an unfinished report file"""
+        self._file.close()
+        os.remove(self.filename)
+
+
+def tee_report_to_file(chunks: Iterable[str], writer: ReportFileWriter) -> Iterator[str]:
+    """Yield report chunks while writing them to a report file"""
+    for chunk in chunks:
+        writer.write(chunk)
+        yield chunk
 
-    # Remove bold/italic markers
-    clean_report = re.sub(r'\*\*(.+?)\*\*', r'\1', clean_report)
-    clean_report = re.sub(r'\*(.+?)\*', r'\1', clean_report)
 
-    # Convert bullet points
-    clean_report = re.sub(r'^[\*\-]\s+', '  • ', clean_report, flags=re.MULTILINE)
+def format_report_for_download(report: str) -> str:
+    """Convert markdown report to clean readable text"""
+    clean_report = "\n".join(format_report_line(line) for line in report.split('\n'))
 
     # Clean up multiple newlines
     clean_report = re.sub(r'\n{3,}', '\n\n', clean_report)
@@ -241,22 +479,6 @@ def format_report_for_download(report: str) -> str:
 
 def save_report_to_file(report: str, filename: str = "flood_report.txt") -> str:
     """Save the report to a downloadable file"""
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename_with_timestamp = f"flood_report_{timestamp}.txt"
-
-    # Convert markdown to clean text
-    clean_report = format_report_for_download(report)
-
-    # Add header
-    header = f"""
-{'=' * 70}
-FLOOD MONITORING REPORT - FYN ISLAND, DENMARK
-Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-{'=' * 70}
-
-"""
-
-    with open(filename_with_timestamp, 'w', encoding='utf-8') as f:
-        f.write(header + clean_report)
-
-    return filename_with_timestamp
+    writer = ReportFileWriter()
+    writer.write(report)
+    return writer.close()
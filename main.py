@@ -1,55 +1,197 @@
 """
 Main entry point for the Flood Monitoring Dashboard
 Run this file to start the dashboard
+
+Usage: python main.py [--host 0.0.0.0] [--port 8050] [--workers 4] [--fast-start] [--dev]
 """
-from data_loader import load_all_sensors
-from map_generator import generate_map
-from dashboard import create_dashboard_app
-import flask
+import time
+
+STARTED_AT = time.perf_counter()
+
+import argparse
+import logging
 import os
-from config import DATA_DIR
+from typing import TYPE_CHECKING, Optional
+from config import (DATA_ROOT, DATA_DIR_PATTERN, IMAGE_CACHE_MAX_AGE_S, MAP_CACHE_DIR, PIN_REPORT_LOCK_FILE,
+                    PUBLIC_URL, RUN_INDEX_FILE, SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SNAPSHOT_DIR,
+                    STARTUP_FAST, WATCH_LOCK_FILE)
 
+if TYPE_CHECKING:
+    import dash
 
-def main():
-    """Main function to run the dashboard"""
-    print("🌊 Starting Flood Monitoring Dashboard...")
 
-    # Load sensor data from JSON files
-    print("📂 Loading sensor data...")
-    sensors = load_all_sensors(max_sensors=25)
+def create_app(single_process: bool = False, data_root: str = DATA_ROOT, fast_start: bool = False,
+               run_index_path: str = RUN_INDEX_FILE, **watcher_options) -> Optional['dash.Dash']:
+    """Load sensor data, render the map and build the dashboard; None when there is no data
 
-    if not sensors:
-        print("❌ Error: No sensor data found. Make sure JSON files (1.json, 2.json, ...) are in the same directory.")
-        return
+    Nothing is started in the background here, so the app can be built once and forked into
+    server workers; call serving.start_background in the process that serves it. With fast_start
+    the app is built around an empty sensor set and serves a skeleton layout; start_background then
+    loads the data and map in a thread and swaps them in. watcher_options (roots, manifest_path,
+    snapshot_dir, ...) are passed to the SensorWatcher; the run registry indexes the same roots.
 
-    print(f"✓ Loaded {len(sensors)} sensors")
+    The server stack is imported here rather than when main is imported, and the watcher and data
+    pipeline by the loader, so with fast_start they are imported after the server binds.
+    """
+    import flask
+    from api import register_api_routes, scope_sensors
+    from dashboard import create_dashboard_app, update_dashboard_data
+    from density_layers import DensityCache
+    from image_service import register_image_routes
+    from map_cache import MapCache
+    from metrics import MetricsSharing, instrument_server
+    from pin_reports import PinReportEngine
+    from run_registry import RunRegistry
+    from sensor_store import SensorStore
+    from serving import enable_gzip
+    from startup import StartupPhases, loading_response, register_health_routes
 
-    # Generate map
-    print("🗺️  Generating map...")
-    map_file = generate_map(sensors, output_file='flood_map.html')
-    print(f"✓ Map generated: {map_file}")
+    startup = StartupPhases(STARTED_AT)
+    startup.record('imports', time.perf_counter() - STARTED_AT)
+    app = None
+    map_cache = MapCache(directory=MAP_CACHE_DIR)
+    density_cache = DensityCache()
+    # With several workers only the one holding the lock file generates pin reports
+    pin_reports = PinReportEngine(lock_path=None if single_process else PIN_REPORT_LOCK_FILE)
 
-    # Create and run dashboard
-    print("🚀 Starting dashboard server...")
-    app = create_dashboard_app(sensors, map_file)
+    def on_sensor_update(sensors, delta):
+        map_cache.render(sensors, persist=True)
+        density_cache.render(sensors)
+        pin_reports.schedule(sensors)
+        if app is not None:
+            update_dashboard_data(app, sensors)
+        print(f"✓ Added {len(delta)} new detections ({len(sensors)} total)")
+
+    # Likewise only one process parses files and writes the manifest and snapshots; the lock is taken
+    # in single-process mode too, so the report CLIs running next to the server stay readers
+    watcher_options.setdefault('lock_path', WATCH_LOCK_FILE)
+    watcher = None
+    runs = RunRegistry(run_index_path, roots=watcher_options.get('roots'),
+                       snapshot_dir=watcher_options.get('snapshot_dir', SNAPSHOT_DIR))
+
+    def load_data() -> Optional[SensorStore]:
+        # Load sensor data from JSON files, re-parsing only files changed since the last run
+        nonlocal watcher
+        print("📂 Loading sensor data...")
+        with startup.phase('data'):
+            from sensor_watcher import SensorWatcher
+            watcher = SensorWatcher(on_update=on_sensor_update, **watcher_options)
+            if app is not None:
+                app.watcher = watcher
+            sensors = watcher.initial_load()
+        load_report = watcher.report
+
+        if not sensors:
+            print(f"❌ Error: No sensor data found. Make sure detection JSON files are in {data_root}/{DATA_DIR_PATTERN}.")
+            startup.fail("no sensor data found")
+            return None
+
+        print(f"✓ Loaded {len(sensors)} sensors, parsed {load_report.files_loaded} new or changed files "
+              f"({load_report.total_parse_s:.2f}s parse time, {len(load_report.failures)} failures)")
+
+        # Render map into memory (and onto disk, for restarts and other workers); /map serves it
+        # until the sensor set changes
+        print("🗺️  Generating map...")
+        with startup.phase('map'):
+            rendered = map_cache.render(sensors, persist=True)
+        print(f"✓ Map rendered: {len(rendered.html) / 1024:.0f} KB ({len(rendered.gzip) / 1024:.0f} KB gzipped)")
+        with startup.phase('density'):
+            layers = density_cache.render(sensors)
+        print(f"✓ Density layers precomputed: {', '.join(f'{len(layer.gzip) / 1024:.0f} KB' for layer in layers.values())} gzipped")
+        return sensors
+
+    if fast_start:
+        sensors = SensorStore.empty()
+    else:
+        sensors = load_data()
+        if sensors is None:
+            return None
+
+    with startup.phase('app'):
+        app = create_dashboard_app(sensors, '/map', runs)
+    app.pin_reports = pin_reports
+    # None until the deferred load has built it with fast_start
+    app.watcher = watcher
+    app.startup = startup
+
+    def deferred_load() -> Optional[SensorStore]:
+        loaded = load_data()
+        if loaded is not None:
+            update_dashboard_data(app, loaded)
+            startup.ready()
+        return loaded
 
-    @app.server.route('/data/video_results_1/<path:filename>')
+    # start_background runs the deferred load before starting the watcher
+    app.deferred_load = deferred_load if fast_start else None
+
+    @app.server.route('/data/<path:filename>')
     def serve_images(filename):
-        import os
         current_dir = os.path.dirname(os.path.abspath(__file__))
-        data_path = os.path.join(current_dir, 'data', 'video_results_1')
-        return flask.send_from_directory(data_path, filename)
+        data_path = os.path.join(current_dir, data_root)
+        return flask.send_from_directory(data_path, filename, max_age=IMAGE_CACHE_MAX_AGE_S)
+
+    register_image_routes(app.server, data_root)
+    register_api_routes(app)
+    register_health_routes(app.server, startup)
+    enable_gzip(app.server)
+    # Workers flush their metrics to a shared directory so /metrics reports all of them
+    app.metrics_sharing = None if single_process else MetricsSharing()
+    instrument_server(app.server, app.metrics_sharing)
 
     @app.server.route('/map')
     def serve_map():
-        return flask.send_file('flood_map.html')
+        if not startup.is_ready:
+            return loading_response()
+        return map_cache.response(scope_sensors(app.sensors_data, flask.request.args, app.runs))
+
+    @app.server.route('/api/density/<int:level>.geojson')
+    def serve_density(level):
+        return density_cache.response(scope_sensors(app.sensors_data, flask.request.args, app.runs), level)
+
+    if not fast_start:
+        startup.ready()
+    return app
 
+
+def fast_start_enabled() -> bool:
+    """STARTUP_FAST from the environment, falling back to the config default"""
+    return os.getenv('STARTUP_FAST', str(STARTUP_FAST)).lower() in ('1', 'true', 'yes')
+
+
+def main():
+    """Main function to run the dashboard"""
+    parser = argparse.ArgumentParser(description="Flood Monitoring Dashboard")
+    parser.add_argument('--host', default=os.getenv('SERVER_HOST', SERVER_HOST))
+    parser.add_argument('--port', type=int, default=int(os.getenv('SERVER_PORT', SERVER_PORT)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('SERVER_WORKERS', SERVER_WORKERS)))
+    parser.add_argument('--fast-start', action=argparse.BooleanOptionalAction, default=fast_start_enabled(),
+                        help="bind immediately with a skeleton layout and load data and the map in the background")
+    parser.add_argument('--dev', action='store_true', help="single-process dev server with debug reloader")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(name)s: %(message)s')
+    from serving import run_production, start_background
+    print("🌊 Starting Flood Monitoring Dashboard...")
+
+    app = create_app(single_process=args.dev, fast_start=args.fast_start)
+    if app is None:
+        return
+
+    print("🚀 Starting dashboard server...")
     print("\n" + "=" * 60)
     print("✓ Dashboard is running!")
-    print("📍 Open your browser and go to: http://127.0.0.1:8050")
+    public_url = os.getenv('PUBLIC_URL', PUBLIC_URL) or f"http://{args.host}:{args.port}"
+    print(f"📍 Open your browser and go to: {public_url}")
     print("=" * 60 + "\n")
 
-    app.run_server(debug=True, host='127.0.0.1', port=8050)
+    if args.dev:
+        # With the debug reloader, only the serving child process should watch the data directory
+        # and generate pin reports for pins whose inputs have no stored report yet
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_background(app)
+        app.run_server(debug=True, host=args.host, port=args.port)
+    else:
+        run_production(app, args.host, args.port, args.workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,229 @@
+"""
+In-memory, precompressed cache of the rendered flood map
+"""
+import glob
+import gzip
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+import flask
+from config import MAP_CACHE_ENTRIES, MAP_FRAGMENT_ENTRIES
+from sensor_store import SensorStore
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever map_generator's output changes so maps persisted on disk are re-rendered
+MAP_RENDER_VERSION = 4
+
+
+@dataclass
+class RenderedMap:
+    """One rendering of the map (or a map layer) with its precompressed bodies"""
+    fingerprint: str
+    html: bytes
+    gzip: bytes
+    brotli: Optional[bytes]
+
+    @property
+    def etag(self) -> str:
+        # A deploy that changes the rendering must not answer 304 for a map rendered before it
+        return f"{self.fingerprint}-v{MAP_RENDER_VERSION}"
+
+
+class FragmentCache:
+    """Rendered marker fragments by sensor content key; the least recently used are evicted first
+
+    One cache serves every rendering, so a time-window or run map reuses the full map's markers
+    instead of replacing them.
+    """
+
+    def __init__(self, max_entries: int = MAP_FRAGMENT_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key: str, render: Callable[[], str]) -> str:
+        with self._lock:
+            fragment = self.entries.get(key)
+            if fragment is not None:
+                self.entries.move_to_end(key)
+                return fragment
+        fragment = render()
+        with self._lock:
+            self.entries[key] = fragment
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return fragment
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+class MapCache:
+    """Render the map once per sensor-set fingerprint and serve it with ETags and precompression
+
+    The most recent renderings are kept, so stepping back and forth between time windows does not
+    re-render maps that were already built. With a directory, renderings requested with persist=True
+    are also kept on disk: a restart, or another server worker, loads them instead of re-rendering,
+    and a lock file makes concurrent workers render a given map only once. Renders run outside the
+    cache lock, so a slow render does not hold up cached maps; concurrent requests for a map being
+    rendered wait for that render.
+    """
+
+    def __init__(self, mode: Optional[str] = None, max_entries: int = MAP_CACHE_ENTRIES,
+                 directory: Optional[str] = None):
+        self.mode = mode
+        self.max_entries = max_entries
+        self.directory = directory
+        self.rendered: 'OrderedDict[str, RenderedMap]' = OrderedDict()
+        self.fragment_cache = FragmentCache()
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _render(self, sensors: SensorStore, fingerprint: str) -> RenderedMap:
+        # folium is imported with the map generator on the first render, not at startup
+        from map_generator import render_map_html
+        html = render_map_html(sensors, self.mode, self.fragment_cache).encode('utf-8')
+        return RenderedMap(
+            fingerprint=fingerprint,
+            html=html,
+            gzip=gzip.compress(html, compresslevel=6),
+            brotli=brotli.compress(html) if brotli is not None else None,
+        )
+
+    def _path(self, fingerprint: str) -> str:
+        return os.path.join(self.directory, f"{fingerprint}-{self.mode or 'auto'}-v{MAP_RENDER_VERSION}")
+
+    @contextmanager
+    def _file_lock(self, path: str):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self, path: str, fingerprint: str) -> Optional[RenderedMap]:
+        try:
+            with open(f"{path}.html.gz", 'rb') as f:
+                compressed = f.read()
+            html = gzip.decompress(compressed)
+        except (OSError, EOFError):
+            return None
+        body_br = None
+        if brotli is not None:
+            try:
+                with open(f"{path}.html.br", 'rb') as f:
+                    body_br = f.read()
+            except OSError:
+                body_br = brotli.compress(html)
+        return RenderedMap(fingerprint=fingerprint, html=html, gzip=compressed, brotli=body_br)
+
+    def _load_or_render(self, sensors: SensorStore, fingerprint: str) -> RenderedMap:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(fingerprint)
+        with self._file_lock(path):
+            rendered = self._load(path, fingerprint)
+            if rendered is not None:
+                return rendered
+            rendered = self._render(sensors, fingerprint)
+            for suffix, body in (('gz', rendered.gzip), ('br', rendered.brotli)):
+                if body is not None:
+                    with open(f"{path}.html.{suffix}.tmp{os.getpid()}", 'wb') as f:
+                        f.write(body)
+                    os.replace(f"{path}.html.{suffix}.tmp{os.getpid()}", f"{path}.html.{suffix}")
+        self._prune_disk()
+        return rendered
+
+    def _prune_disk(self) -> None:
+        """Keep the max_entries most recently written maps on disk"""
+        paths = sorted(glob.glob(os.path.join(self.directory, '*.html.gz')), key=_mtime, reverse=True)
+        for path in paths[self.max_entries:]:
+            base = path[:-len('.html.gz')]
+            for stale in (path, f"{base}.html.br", f"{base}.lock"):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def render(self, sensors: SensorStore, persist: bool = False) -> RenderedMap:
+        """Return the rendered map for a sensor set, rebuilding only changed markers"""
+        fingerprint = sensors.fingerprint()
+        with self._lock:
+            rendered = self.rendered.get(fingerprint)
+            if rendered is not None:
+                self.rendered.move_to_end(fingerprint)
+                return rendered
+            future = self._in_flight.get(fingerprint)
+            if future is None:
+                future = self._in_flight[fingerprint] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return future.result()
+
+        try:
+            if persist and self.directory:
+                rendered = self._load_or_render(sensors, fingerprint)
+            else:
+                rendered = self._render(sensors, fingerprint)
+        except Exception as e:
+            with self._lock:
+                del self._in_flight[fingerprint]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self.rendered[fingerprint] = rendered
+            while len(self.rendered) > self.max_entries:
+                self.rendered.popitem(last=False)
+            del self._in_flight[fingerprint]
+        future.set_result(rendered)
+        return rendered
+
+    def response(self, sensors: SensorStore) -> flask.Response:
+        """Build a response for the current request: 304, or the best precompressed body"""
+        return precompressed_response(self.render(sensors), 'text/html')
+
+
+def precompressed_response(rendered: RenderedMap, mimetype: str) -> flask.Response:
+    """304 when the client's ETag matches, otherwise the best body the client accepts"""
+    if rendered.etag in flask.request.if_none_match:
+        response = flask.Response(status=304)
+    else:
+        accepted = flask.request.accept_encodings
+        if rendered.brotli is not None and accepted['br']:
+            body, encoding = rendered.brotli, 'br'
+        elif accepted['gzip']:
+            body, encoding = rendered.gzip, 'gzip'
+        else:
+            body, encoding = rendered.html, None
+        response = flask.Response(body, mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(rendered.etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.no_cache = True
+    return response
@@ -1,11 +1,20 @@
 """
 Map generation module using Folium
 """
+import json
+from html import escape
 import folium
-from folium import IFrame
-import os
-from typing import List, Dict
-from config import FYN_ISLAND_CENTER, DEFAULT_ZOOM, CLASSIFICATION, DATA_DIR
+from branca.element import MacroElement
+from folium.plugins import FastMarkerCluster
+from jinja2 import Template
+import numpy as np
+from typing import Dict, List, Optional
+from config import (FYN_ISLAND_CENTER, DEFAULT_ZOOM, CLASSIFICATION, MAP_CLUSTER_THRESHOLD, PIN_REPORT_LEVELS,
+                    DENSITY_LEVELS)
+from image_service import image_url
+from map_cache import FragmentCache
+from metrics import timed
+from sensor_store import SensorStore
 
 def create_base_map() -> folium.Map:
     """Create the base map centered on Fyn Island"""
@@ -21,6 +30,7 @@ def get_marker_color(prediction: int) -> str:
     """Get marker color based on prediction level"""
     return CLASSIFICATION.get(prediction, CLASSIFICATION[0])['color']
 
+@timed('flood_popup_render_seconds')
 def create_popup_html(sensor: Dict) -> str:
     """Create HTML content for popup card"""
     prediction = sensor.get('prediction', 0)
@@ -36,9 +46,13 @@ def create_popup_html(sensor: Dict) -> str:
     image_file = sensor.get('image_file', '')
 
     if image_file:
-        # Use ABSOLUTE URL for iframe compatibility
-        image_url = f'http://127.0.0.1:8050/data/video_results_1/{image_file}'
-        image_html = f'<img src="{image_url}" style="width:100%; max-width:300px; border-radius:8px; margin-bottom:10px;">'
+        # Root-relative URLs resolve against the map's origin, also inside srcdoc popup iframes;
+        # show the thumbnail and fetch the original on click
+        thumb_url = image_url(image_file, 'thumb')
+        original_url = image_url(image_file)
+        image_html = (f'<img src="{thumb_url}" loading="lazy" title="Click for full resolution" '
+                      f'onclick="this.onclick=null; this.style.cursor=\'default\'; this.src=\'{original_url}\';" '
+                      f'style="width:100%; max-width:300px; border-radius:8px; margin-bottom:10px; cursor:zoom-in;">')
     else:
         image_html = '<p style="color:#999; font-style:italic;">Image not available</p>'
 
@@ -75,6 +89,7 @@ Classification: {classification_info["label"]} ({prediction})
 <div>Δ Pressure: <strong>{sensor_anomalies.get('delta_pressure', 0):.1f} hPa</strong></div>
 </div>
 </div>
+{create_pin_report_html(sensor)}
 <div style="margin-top:10px; font-size:11px; color:#666;">
 Timestamp: {sensor.get('timestamp', 'N/A')}
 </div>
@@ -82,34 +97,209 @@ Timestamp: {sensor.get('timestamp', 'N/A')}
 
     return html
 
-def add_sensor_markers(flood_map: folium.Map, sensors: List[Dict]) -> folium.Map:
-    """Add markers for all sensors to the map"""
-    for sensor in sensors:
-        location = sensor.get('location')
-        if not location:
-            continue
+def create_pin_report_html(sensor: Dict) -> str:
+    """Collapsed pin report section, fetched from the stored reports when first opened"""
+    if sensor.get('prediction', 0) not in PIN_REPORT_LEVELS or sensor.get('id') is None:
+        return ''
+    report_url = f"/api/sensors/{sensor['id']}/report"
+    on_toggle = (
+        "if (!this.open || this.dataset.loaded) return; var out = this.querySelector('div');"
+        f"fetch('{report_url}').then(function (r) {{ return r.json(); }}).then(function (d) {{"
+        " if (d.report) { this.dataset.loaded = 1; out.textContent = d.report; }"
+        " else if (d.status === 'pending') { out.textContent = 'Report is being generated, check back shortly.'; }"
+        " else { out.textContent = 'No report has been generated for this pin yet.'; }"
+        "}.bind(this)).catch(function () { out.textContent = 'Report unavailable.'; });"
+    )
+    return f'''<details ontoggle="{on_toggle}" style="margin-top:12px;">
+<summary style="color:#0066cc; font-weight:bold; cursor:pointer;">📝 Pin Report</summary>
+<div style="background:#f8f9fa; padding:8px; border-radius:5px; margin-top:5px; white-space:pre-wrap; font-size:12px;">Loading...</div>
+</details>'''
+
+
+class SensorMarkerLayer(MacroElement):
+    """Feature group whose markers are emitted from pre-rendered JavaScript fragments"""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.featureGroup().addTo({{ this._parent.get_name() }});
+            (function (layer) {
+            {{ this.fragments|join('\n') }}
+            })({{ this.get_name() }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, fragments: List[str]):
+        super().__init__()
+        self._name = 'SensorMarkerLayer'
+        self.fragments = fragments
+
+
+def _js_string(value: str) -> str:
+    """JSON-encode a string so it is safe inside an inline <script>"""
+    return json.dumps(value).replace('</', '<\\/')
+
+
+def create_marker_fragment(sensor: Dict) -> str:
+    """Render one sensor as a Leaflet marker with an iframe popup, added to `layer`"""
+    lat, lon = sensor['location']
+    color = get_marker_color(sensor.get('prediction', 0))
+    # A srcdoc iframe shares the map's origin and base URL, unlike a data: URL
+    popup = escape(create_popup_html(sensor), quote=True)
+    iframe = (f'<iframe srcdoc="{popup}" '
+              f'width="350" height="550" style="border:none !important;"></iframe>')
+    tooltip = f"Camera {sensor.get('camera_id', 'Unknown')} - Click for details"
+    return (
+        f"L.marker([{lat}, {lon}], {{icon: L.AwesomeMarkers.icon("
+        f"{{icon: 'tint', prefix: 'fa', markerColor: {_js_string(color)}, iconColor: 'white'}})}})"
+        f".bindPopup({_js_string(iframe)}, {{maxWidth: 350}})"
+        f".bindTooltip({_js_string(tooltip)}, {{sticky: true}})"
+        f".addTo(layer);"
+    )
+
+
+def add_sensor_markers(flood_map: folium.Map, sensors: SensorStore,
+                       fragment_cache: Optional[FragmentCache] = None) -> folium.Map:
+    """Add markers for all sensors to the map
+
+    fragment_cache holds rendered markers by sensor content key; sensors whose key is already
+    cached are not re-rendered.
+    """
+    fragments = []
+    for i in np.flatnonzero(sensors.has_location()):
+        if fragment_cache is None:
+            fragments.append(create_marker_fragment(sensors.record(i)))
+        else:
+            fragments.append(fragment_cache.get_or_render(
+                sensors.row_key(i), lambda: create_marker_fragment(sensors.record(i))))
+
+    SensorMarkerLayer(fragments).add_to(flood_map)
+    return flood_map
+
+
+# Leaflet callback for FastMarkerCluster rows of [lat, lon, prediction, id]; popups are fetched on click.
+# FastMarkerCluster assigns the function expression to its own `var callback`.
+CLUSTER_MARKER_CALLBACK = """
+function (row) {
+    var colors = %(colors)s;
+    var cameras = %(cameras)s;
+    var icon = L.AwesomeMarkers.icon({
+        icon: 'tint', prefix: 'fa', markerColor: colors[row[2]] || colors[0]
+    });
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindTooltip('Camera ' + cameras[row[4]] + ' - Click for details');
+    marker.bindPopup('Loading...', {maxWidth: 350, minWidth: 330});
+    marker.on('click', function () {
+        if (marker._popupLoaded) { return; }
+        fetch('/api/sensors/' + row[3] + '/popup')
+            .then(function (response) { return response.json(); })
+            .then(function (payload) {
+                marker._popupLoaded = true;
+                marker.setPopupContent(payload.html);
+            })
+            .catch(function () { marker.setPopupContent('Sensor details unavailable'); });
+    });
+    return marker;
+}
+"""
 
-        prediction = sensor.get('prediction', 0)
-        color = get_marker_color(prediction)
 
-        popup_html = create_popup_html(sensor)
-        iframe = IFrame(html=popup_html, width=350, height=550)
-        popup = folium.Popup(iframe, max_width=350)
+def sensor_point_rows(sensors: SensorStore) -> List[list]:
+    """Compact [lat, lon, prediction, id] rows for every sensor with a location"""
+    mask = sensors.has_location()
+    return [list(row) for row in zip(
+        np.round(sensors['lat'][mask], 6).tolist(),
+        np.round(sensors['lon'][mask], 6).tolist(),
+        sensors['prediction'][mask].tolist(),
+        sensors['id'][mask].tolist(),
+    )]
 
-        folium.Marker(
-            location=location,
-            popup=popup,
-            icon=folium.Icon(color=color, icon='tint', prefix='fa'),
-            tooltip=f"Camera {sensor.get('camera_id', 'Unknown')} - Click for details"
-        ).add_to(flood_map)
 
+def add_clustered_markers(flood_map: folium.Map, sensors: SensorStore) -> folium.Map:
+    """Add all sensors as one client-side clustered layer built from a compact coordinate array"""
+    rows = sensor_point_rows(sensors)
+    # Tooltips name the camera like the popups do; rows carry an index into the camera table
+    for row, code in zip(rows, sensors['camera_id_code'][sensors.has_location()].tolist()):
+        row.append(code)
+    colors = {level: info['color'] for level, info in CLASSIFICATION.items()}
+    callback = CLUSTER_MARKER_CALLBACK % {
+        'colors': json.dumps(colors),
+        'cameras': json.dumps(sensors.tables['camera_id']),
+    }
+    FastMarkerCluster(rows, callback=callback, name='Sensors').add_to(flood_map)
     return flood_map
 
 
-def generate_map(sensors: List[Dict], output_file: str = 'flood_map.html') -> str:
-    """Generate complete map with all sensors"""
+class DensityLayer(folium.map.Layer):
+    """Toggleable hex density overlay that loads the GeoJSON level matching the current zoom
+
+    The map page's query string (e.g. a time window) is forwarded to the GeoJSON request.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.geoJSON(null, {
+                style: function (feature) {
+                    return {color: feature.properties.color, weight: 1,
+                            fillColor: feature.properties.color, fillOpacity: feature.properties.opacity};
+                },
+                onEachFeature: function (feature, layer) {
+                    var p = feature.properties;
+                    layer.bindTooltip(p.count + ' detections: ' + p.levels[2] + ' flood, ' + p.levels[1]
+                        + ' suspicious<br>Mean score ' + p.mean_score + ', max ' + p.max_score);
+                }
+            });
+            (function (layer, map) {
+                var minZooms = {{ this.min_zooms|tojson }};
+                var loaded = null;
+                function levelFor(zoom) {
+                    var level = 0;
+                    minZooms.forEach(function (minZoom, i) { if (zoom >= minZoom) { level = i; } });
+                    return level;
+                }
+                function refresh() {
+                    if (!map.hasLayer(layer)) { return; }
+                    var level = levelFor(map.getZoom());
+                    if (level === loaded) { return; }
+                    loaded = level;
+                    fetch('{{ this.url }}/' + level + '.geojson' + window.location.search)
+                        .then(function (response) { return response.json(); })
+                        .then(function (data) {
+                            if (loaded !== level) { return; }
+                            layer.clearLayers();
+                            layer.addData(data);
+                        })
+                        .catch(function () { loaded = null; });
+                }
+                layer.on('add', refresh);
+                map.on('zoomend', refresh);
+            })({{ this.get_name() }}, {{ this._parent.get_name() }});
+            {% if this.show %}{{ this.get_name() }}.addTo({{ this._parent.get_name() }});{% endif %}
+        {% endmacro %}
+    """)
+
+    def __init__(self, url: str, levels=DENSITY_LEVELS,
+                 name: str = 'Flood density', show: bool = False):
+        super().__init__(name=name, overlay=True, control=True, show=show)
+        self._name = 'DensityLayer'
+        self.url = url
+        self.min_zooms = [min_zoom for min_zoom, _ in levels]
+
+
+def build_map(sensors: SensorStore, mode: Optional[str] = None,
+              fragment_cache: Optional[FragmentCache] = None) -> folium.Map:
+    """Build the complete Folium map with all sensors
+
+    mode is 'markers' (one inlined popup per sensor) or 'cluster' (one clustered layer with popups
+    fetched on demand); by default it is picked from MAP_CLUSTER_THRESHOLD.
+    """
+    if mode is None:
+        mode = 'cluster' if len(sensors) > MAP_CLUSTER_THRESHOLD else 'markers'
+
     flood_map = create_base_map()
-    flood_map = add_sensor_markers(flood_map, sensors)
+    if mode == 'cluster':
+        flood_map = add_clustered_markers(flood_map, sensors)
+    else:
+        flood_map = add_sensor_markers(flood_map, sensors, fragment_cache)
 
     # Add user location marker (Odense, Denmark)
     user_location = [55.4038, 10.4024]  # Odense coordinates
@@ -120,5 +310,22 @@ def generate_map(sensors: List[Dict], output_file: str = 'flood_map.html') -> st
         tooltip="Your Location"
     ).add_to(flood_map)
 
-    flood_map.save(output_file)
+    DensityLayer("/api/density").add_to(flood_map)
+    folium.LayerControl(collapsed=True).add_to(flood_map)
+
+    return flood_map
+
+
+@timed('flood_map_render_seconds')
+def render_map_html(sensors: SensorStore, mode: Optional[str] = None,
+                    fragment_cache: Optional[FragmentCache] = None) -> str:
+    """Render the complete map to an HTML string without touching the disk"""
+    return build_map(sensors, mode, fragment_cache).get_root().render()
+
+
+@timed('flood_map_render_seconds')
+def generate_map(sensors: SensorStore, output_file: str = 'flood_map.html',
+                 mode: Optional[str] = None) -> str:
+    """Generate complete map with all sensors and save it to output_file"""
+    build_map(sensors, mode).save(output_file)
     return output_file
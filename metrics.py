@@ -0,0 +1,294 @@
+"""
+Hot-path instrumentation: counters and latency histograms, a Prometheus /metrics endpoint and
+opt-in per-request profiling
+"""
+import cProfile
+import functools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+import flask
+from config import METRICS_DIR, METRICS_FLUSH_INTERVAL_S, PROFILE_SAMPLE_RATE, PROFILE_DIR
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:
+    SamplingProfiler = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Registry:
+    """Thread-safe counters and histograms keyed by metric name and label set"""
+
+    def __init__(self):
+        self.help: Dict[str, Tuple[str, str]] = {}
+        self.counters: Dict[str, Dict[LabelKey, float]] = defaultdict(lambda: defaultdict(float))
+        self.histograms: Dict[str, Dict[LabelKey, list]] = defaultdict(dict)
+        self.buckets: Dict[str, Tuple[float, ...]] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.help[name] = (kind, text)
+        if kind == 'histogram':
+            self.buckets[name] = buckets
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self.counters[name][key] += value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        buckets = self.buckets.get(name, DEFAULT_BUCKETS)
+        with self._lock:
+            series = self.histograms[name].get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                series = self.histograms[name][key] = [0] * len(buckets) + [0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self) -> Dict:
+        """JSON-serializable copy of every series"""
+        with self._lock:
+            return {
+                'counters': {name: [[list(map(list, key)), value] for key, value in series.items()]
+                             for name, series in self.counters.items()},
+                'histograms': {name: [[list(map(list, key)), list(values)] for key, values in series.items()]
+                               for name, series in self.histograms.items()},
+            }
+
+
+REGISTRY = Registry()
+
+REGISTRY.describe('flood_json_parse_seconds', 'histogram', "Time to read and decode one detection JSON file")
+REGISTRY.describe('flood_extract_seconds', 'histogram', "Time to extract one sensor record from decoded JSON")
+REGISTRY.describe('flood_files_total', 'counter', "Detection files parsed, by result")
+REGISTRY.describe('flood_map_render_seconds', 'histogram', "Time to render the map HTML")
+REGISTRY.describe('flood_popup_render_seconds', 'histogram', "Time to render one popup")
+REGISTRY.describe('flood_report_seconds', 'histogram', "Report generation latency, by stakeholder and cache result")
+REGISTRY.describe('flood_report_cache_total', 'counter', "Report cache lookups, by result")
+REGISTRY.describe('flood_report_prompt_tokens_total', 'counter', "Estimated prompt tokens sent to the LLM")
+REGISTRY.describe('flood_report_completion_tokens_total', 'counter', "Estimated completion tokens received")
+REGISTRY.describe('flood_callback_cache_total', 'counter', "Memoized dashboard callback lookups, by callback and result")
+REGISTRY.describe('flood_http_request_seconds', 'histogram', "HTTP request latency, by route, method and status")
+REGISTRY.describe('flood_http_requests_total', 'counter', "HTTP requests, by route, method and status")
+
+
+def timed(metric: str, **labels) -> Callable:
+    """Decorator recording each call's duration in a histogram"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                REGISTRY.observe(metric, time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+def _escape_label(value: str) -> str:
+    """Escape a label value as the Prometheus text format requires"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(key: Iterable) -> str:
+    return ",".join(f'{k}="{_escape_label(v)}"' for k, v in key)
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def merge_snapshots(snapshots: Iterable[Dict]) -> Dict:
+    """Sum the series of several process snapshots"""
+    counters: Dict[str, Dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+    histograms: Dict[str, Dict[tuple, list]] = defaultdict(dict)
+    for snapshot in snapshots:
+        for name, series in snapshot.get('counters', {}).items():
+            for key, value in series:
+                counters[name][tuple(map(tuple, key))] += value
+        for name, series in snapshot.get('histograms', {}).items():
+            for key, values in series:
+                key = tuple(map(tuple, key))
+                total = histograms[name].get(key)
+                histograms[name][key] = values if total is None else [a + b for a, b in zip(total, values)]
+    return {'counters': counters, 'histograms': histograms}
+
+
+def render_prometheus(merged: Dict, registry: Registry = REGISTRY) -> str:
+    """Prometheus text exposition format"""
+    lines = []
+    for name, series in sorted(merged['counters'].items()):
+        _, text = registry.help.get(name, ('counter', name))
+        lines += [f"# HELP {name} {text}", f"# TYPE {name} counter"]
+        for key, value in sorted(series.items()):
+            lines.append(f"{name}{{{_label_text(key)}}} {_format_value(value)}" if key
+                         else f"{name} {_format_value(value)}")
+    for name, series in sorted(merged['histograms'].items()):
+        _, text = registry.help.get(name, ('histogram', name))
+        buckets = registry.buckets.get(name, DEFAULT_BUCKETS)
+        lines += [f"# HELP {name} {text}", f"# TYPE {name} histogram"]
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(buckets, values):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{_label_text(key + (("le", repr(bound)),))}}} {cumulative}')
+            lines.append(f'{name}_bucket{{{_label_text(key + (("le", "+Inf"),))}}} {values[-1]}')
+            labels = f"{{{_label_text(key)}}}" if key else ""
+            lines.append(f"{name}_sum{labels} {_format_value(values[-2])}")
+            lines.append(f"{name}_count{labels} {values[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsSharing:
+    """Let one worker's /metrics report every worker: each flushes its snapshot to a shared directory
+
+    Files of processes that no longer exist are ignored and removed on read.
+    """
+
+    def __init__(self, directory: str = METRICS_DIR, interval_s: float = METRICS_FLUSH_INTERVAL_S):
+        self.directory = directory
+        self.interval_s = interval_s
+        self._thread: Optional[threading.Thread] = None
+
+    def path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def flush(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(os.getpid())
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(REGISTRY.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def start(self) -> None:
+        """Flush periodically from a daemon thread in the current process"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def run():
+            while True:
+                time.sleep(self.interval_s)
+                try:
+                    self.flush()
+                except OSError as e:
+                    logger.warning("Metrics flush failed: %s", e)
+
+        self._thread = threading.Thread(target=run, name="metrics-flush", daemon=True)
+        self._thread.start()
+
+    def collect(self) -> list:
+        """This process's live snapshot plus the last flushed snapshot of every other live process"""
+        snapshots = [REGISTRY.snapshot()]
+        if not os.path.isdir(self.directory):
+            return snapshots
+        for name in os.listdir(self.directory):
+            match = re.fullmatch(r'(\d+)\.json', name)
+            if not match or int(match.group(1)) == os.getpid():
+                continue
+            pid, path = int(match.group(1)), os.path.join(self.directory, name)
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                # Another worker may have removed the same stale file first
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            except PermissionError:
+                pass
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+
+def _profile_path(extension: str) -> str:
+    endpoint = re.sub(r'[^A-Za-z0-9_.-]+', '_', flask.request.path).strip('_') or 'root'
+    return os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{endpoint}.{extension}")
+
+
+def instrument_server(server: flask.Flask, sharing: Optional[MetricsSharing] = None,
+                      profile_rate: Optional[float] = None) -> None:
+    """Time every request, serve /metrics and profile a sample of requests
+
+    profile_rate is the fraction of requests profiled (PROFILE_SAMPLE_RATE in the environment
+    overrides the config default; 0 disables). Profiles go to PROFILE_DIR: pyinstrument HTML when
+    pyinstrument is installed, cProfile .prof files (for snakeviz or pstats) otherwise. Only one
+    request per process is profiled at a time; a sampled request that overlaps it is not profiled.
+    """
+    if profile_rate is None:
+        profile_rate = float(os.getenv('PROFILE_SAMPLE_RATE', PROFILE_SAMPLE_RATE))
+    # cProfile (and pyinstrument's default mode) refuse to start while another profiler is active
+    profiling = threading.Lock()
+
+    @server.before_request
+    def start_request_timer():
+        flask.g.request_start = time.perf_counter()
+        if profile_rate > 0 and random.random() < profile_rate and profiling.acquire(blocking=False):
+            try:
+                if SamplingProfiler is not None:
+                    profiler = SamplingProfiler()
+                    profiler.start()
+                else:
+                    profiler = cProfile.Profile()
+                    profiler.enable()
+            except (RuntimeError, ValueError) as e:
+                # A profiler started outside this hook (a debugger, a tracing tool) is still active
+                logger.debug("Request not profiled: %s", e)
+                profiling.release()
+                return
+            flask.g.profiler = profiler
+
+    @server.after_request
+    def record_request(response: flask.Response) -> flask.Response:
+        start = flask.g.pop('request_start', None)
+        if start is not None:
+            # The URL rule keeps label cardinality bounded (/api/sensors/<int:sensor_id>/popup)
+            rule = flask.request.url_rule.rule if flask.request.url_rule else 'unmatched'
+            labels = {'route': rule, 'method': flask.request.method, 'status': response.status_code}
+            REGISTRY.observe('flood_http_request_seconds', time.perf_counter() - start, **labels)
+            REGISTRY.inc('flood_http_requests_total', **labels)
+
+        profiler = flask.g.pop('profiler', None)
+        if profiler is not None:
+            try:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                if isinstance(profiler, cProfile.Profile):
+                    profiler.disable()
+                    profiler.dump_stats(_profile_path('prof'))
+                else:
+                    profiler.stop()
+                    with open(_profile_path('html'), 'w', encoding='utf-8') as f:
+                        f.write(profiler.output_html())
+            finally:
+                profiling.release()
+        return response
+
+    @server.route('/metrics')
+    def serve_metrics():
+        snapshots = sharing.collect() if sharing is not None else [REGISTRY.snapshot()]
+        return flask.Response(render_prometheus(merge_snapshots(snapshots)),
+                              content_type='text/plain; version=0.0.4; charset=utf-8')
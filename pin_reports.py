@@ -0,0 +1,328 @@
+"""
+Per-pin narrative reports for flood and suspicious detections, stored by content hash
+
+Usage: python pin_reports.py [--workers 4] [--limit 100] [--rate 30]
+"""
+import argparse
+import glob
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import numpy as np
+from config import (PIN_REPORT_AUTO, PIN_REPORT_DIR, PIN_REPORT_LEVELS, PIN_REPORT_MAX_ENTRIES,
+                    PIN_REPORT_MAX_PER_PASS, PIN_REPORT_RATE_PER_MIN, PIN_NEIGHBOUR_FRAMES, PIN_REPORT_WORKERS,
+                    WATCH_LOCK_FILE)
+from llm_backends import RateLimiter, get_backend
+from llm_report import request_completion
+from sensor_store import SensorStore
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the pin prompt changes so stored narratives are regenerated
+PIN_PROMPT_VERSION = 1
+
+PIN_SYSTEM_PROMPT = (
+    "You are a flood monitoring analyst writing a short report for a single detection point. "
+    "Use only the data provided, cite the actual readings and keep each section to a few sentences."
+)
+
+PIN_SECTIONS = ["Hazard Severity", "Environmental Context", "Temporal Trends", "Mitigation Suggestions"]
+
+LEVEL_LABELS = {0: "No Flood", 1: "Suspicious", 2: "Flood"}
+
+# Stored reports are named by their sha256 content key
+PIN_REPORT_FILE_PATTERN = re.compile(r'^[0-9a-f]{64}\.md$')
+
+
+def _frame_times(sensors: SensorStore) -> np.ndarray:
+    """Capture time of each frame, falling back to the video offset and then the row id"""
+    times = np.array(sensors['capture_ts'], dtype=float)
+    missing = np.isnan(times)
+    times[missing] = sensors['video_timestamp_sec'][missing]
+    missing = np.isnan(times)
+    times[missing] = sensors['id'][missing]
+    return times
+
+
+def temporal_order(sensors: SensorStore,
+                   times: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Rows sorted by (run, camera, time), each row's position in that order, and the sorted group ids"""
+    run = sensors['run_id_code'].astype(np.int64)
+    camera = sensors['camera_id_code'].astype(np.int64)
+    order = np.lexsort((_frame_times(sensors) if times is None else times, camera, run))
+    position = np.empty_like(order)
+    position[order] = np.arange(len(order))
+    groups = (run * (camera.max(initial=0) + 1) + camera)[order]
+    return order, position, groups
+
+
+@dataclass
+class PinFrames:
+    """Whole-store inputs shared by every pin, computed once per sensor set"""
+    ordering: Tuple[np.ndarray, np.ndarray, np.ndarray]
+    times: np.ndarray
+    located: np.ndarray
+    cameras: np.ndarray
+    runs: np.ndarray
+
+
+def pin_frames(sensors: SensorStore) -> PinFrames:
+    times = _frame_times(sensors)
+    return PinFrames(ordering=temporal_order(sensors, times), times=times, located=sensors.has_location(),
+                     cameras=sensors.labels('camera_id'), runs=sensors.labels('run_id'))
+
+
+def temporal_neighbours(ordering: Tuple[np.ndarray, np.ndarray, np.ndarray], row: int,
+                        frames: int = PIN_NEIGHBOUR_FRAMES) -> np.ndarray:
+    """Rows of up to `frames` earlier and later frames from the same run and camera, including `row`"""
+    order, position, groups = ordering
+    pos = position[row]
+    lo, hi = max(0, pos - frames), min(len(order), pos + frames + 1)
+    window = np.arange(lo, hi)
+    return order[window[groups[window] == groups[pos]]]
+
+
+def pin_input(sensors: SensorStore, row: int, neighbours: np.ndarray,
+              frames: Optional[PinFrames] = None) -> str:
+    """Data section of a pin's prompt: the frame itself and its temporal neighbours
+
+    Pass the store's PinFrames when building many pins; computing them is linear in the store size.
+    """
+    frames = frames or pin_frames(sensors)
+    c = sensors.columns
+    prediction = int(c['prediction'][row])
+    location = (f"({c['lat'][row]:.5f}, {c['lon'][row]:.5f})" if frames.located[row]
+                else "unknown")
+    times = frames.times
+    lines = [
+        f"Camera: {frames.cameras[row]} (run {frames.runs[row]})",
+        f"Location: {location}",
+        f"Timestamp: {c['timestamp'][row]}",
+        f"Classification: {LEVEL_LABELS.get(prediction, 'Unknown')} (Level {prediction}), FSM state {c['state'][row]}",
+        f"Scores: combined {c['combined_score'][row]:.3f}, image {c['image_score'][row]:.3f}, "
+        f"sensor boost {c['sensor_boost'][row]:.3f}",
+        f"Temperature: {c['temperature'][row]:.1f}°C (Δ {c['delta_temperature'][row]:+.1f}°C)",
+        f"Humidity: {c['humidity'][row]:.1f}% (Δ {c['delta_humidity'][row]:+.1f}%)",
+        f"Pressure: {c['pressure'][row]:.1f} hPa (Δ {c['delta_pressure'][row]:+.1f} hPa)",
+        "",
+        "Nearby frames from the same camera, oldest first:",
+    ]
+    for i, other in enumerate(neighbours, 1):
+        marker = " (this frame)" if other == row else ""
+        lines.append(
+            f"- Frame {i}{marker}: {times[other] - times[row]:+.1f} s, "
+            f"{LEVEL_LABELS.get(int(c['prediction'][other]), 'Unknown')}, "
+            f"score {c['combined_score'][other]:.3f}, FSM state {c['state'][other]}"
+        )
+    return "\n".join(lines)
+
+
+def pin_report_key(data: str, model: Optional[str] = None) -> str:
+    """Content address of a pin report: its input data, prompt version and model"""
+    model = model or get_backend().model
+    payload = f"v{PIN_PROMPT_VERSION}\0{model}\0{data}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def build_pin_prompt(data: str) -> str:
+    sections_text = "\n".join(f"{i}. **{section}**" for i, section in enumerate(PIN_SECTIONS, 1))
+    return f"""Write a DETECTION POINT REPORT for the monitoring point below.
+
+{data}
+
+Use the following sections:
+
+{sections_text}
+
+Base the Temporal Trends section on the nearby frames."""
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+class PinReportEngine:
+    """Generate, store and look up per-pin reports keyed by the content hash of their inputs
+
+    Every report is an LLM call: background passes run only when auto is enabled, generate at most
+    max_per_pass reports each, and all calls share a rate limit. The directory keeps the max_entries
+    most recently used reports.
+    """
+
+    def __init__(self, directory: str = PIN_REPORT_DIR, workers: int = PIN_REPORT_WORKERS,
+                 levels=PIN_REPORT_LEVELS, lock_path: Optional[str] = None, auto: Optional[bool] = None,
+                 max_per_pass: Optional[int] = PIN_REPORT_MAX_PER_PASS,
+                 rate_per_min: float = PIN_REPORT_RATE_PER_MIN, max_entries: int = PIN_REPORT_MAX_ENTRIES):
+        self.directory = directory
+        self.workers = workers
+        self.levels = list(levels)
+        if auto is None:
+            auto = os.getenv('PIN_REPORT_AUTO', str(int(PIN_REPORT_AUTO))).lower() in ('1', 'true')
+        self.auto = auto
+        self.max_per_pass = max_per_pass
+        self.max_entries = max_entries
+        self._limiter = RateLimiter(rate_per_min, burst=workers)
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._frames: Optional[Tuple[str, PinFrames]] = None
+        self._pending: Optional[SensorStore] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.md")
+
+    def _frames_for(self, sensors: SensorStore) -> PinFrames:
+        fingerprint = sensors.fingerprint()
+        cached = self._frames
+        if cached is None or cached[0] != fingerprint:
+            cached = self._frames = (fingerprint, pin_frames(sensors))
+        return cached[1]
+
+    def pin_key(self, sensors: SensorStore, row: int) -> Tuple[str, str]:
+        """(content key, input data) of one pin"""
+        frames = self._frames_for(sensors)
+        neighbours = temporal_neighbours(frames.ordering, row)
+        data = pin_input(sensors, row, neighbours, frames)
+        return pin_report_key(data), data
+
+    def lookup(self, sensors: SensorStore, row: int) -> Optional[str]:
+        """Stored report for a pin, or None if it has not been generated yet; never calls the LLM"""
+        key, _ = self.pin_key(sensors, row)
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _generate_one(self, key: str, data: str) -> None:
+        self._limiter.acquire()
+        report = request_completion({"system_prompt": PIN_SYSTEM_PROMPT}, build_pin_prompt(data))
+        tmp_path = f"{self.path(key)}.tmp{threading.get_ident()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(report)
+        os.replace(tmp_path, self.path(key))
+
+    def generate(self, sensors: SensorStore, limit: Optional[int] = None) -> Dict[str, int]:
+        """Generate reports for pins at the configured levels whose inputs have no stored report
+
+        With a limit only that many are generated, floods before suspicious pins and newest first;
+        the rest are 'deferred' to a later pass.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        rows = np.flatnonzero(np.isin(sensors['prediction'], self.levels))
+        rows = rows[np.lexsort((-sensors['id'][rows], -sensors['prediction'][rows]))]
+        missing = {}
+        for row in rows:
+            key, data = self.pin_key(sensors, int(row))
+            if key in missing:
+                continue
+            try:
+                # Marks the stored report as in use, so pruning keeps it
+                os.utime(self.path(key))
+            except FileNotFoundError:
+                missing[key] = data
+
+        selected = list(missing.items())[:limit] if limit is not None else list(missing.items())
+        stats = {'pins': len(rows), 'generated': 0, 'failed': 0, 'deferred': len(missing) - len(selected)}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pin-report") as executor:
+            futures = {key: executor.submit(self._generate_one, key, data) for key, data in selected}
+            for key, future in futures.items():
+                try:
+                    future.result()
+                    stats['generated'] += 1
+                except Exception as e:
+                    logger.warning("Pin report %s failed: %s", key[:12], e)
+                    stats['failed'] += 1
+        self._prune()
+        logger.info("Pin reports: %s", stats)
+        return stats
+
+    def _prune(self) -> None:
+        """Keep the max_entries most recently used reports on disk"""
+        paths = [path for path in glob.glob(os.path.join(self.directory, '*.md'))
+                 if PIN_REPORT_FILE_PATTERN.match(os.path.basename(path))]
+        if len(paths) <= self.max_entries:
+            return
+        paths.sort(key=_mtime, reverse=True)
+        for path in paths[self.max_entries:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def holds_lock(self) -> bool:
+        """Whether this process may generate; with a lock file only the process holding it does
+
+        Server workers share the report directory, so one generator is enough. The lock is retried
+        on every schedule and is released when its holder exits.
+        """
+        if self.lock_path is None or fcntl is None:
+            return True
+        if self._lock_file is None:
+            lock_file = open(self.lock_path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+        return True
+
+    def schedule(self, sensors: SensorStore) -> None:
+        """Generate in the background when auto is enabled; updates arriving during a run are coalesced
+        into one more run, and each run generates at most max_per_pass reports"""
+        if not self.auto or not self.holds_lock():
+            return
+        with self._lock:
+            self._pending = sensors
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._drain, name="pin-reports", daemon=True)
+                self._thread.start()
+
+    def _drain(self) -> None:
+        while True:
+            with self._lock:
+                sensors, self._pending = self._pending, None
+                if sensors is None:
+                    self._thread = None
+                    return
+            try:
+                self.generate(sensors, limit=self.max_per_pass)
+            except Exception:
+                logger.exception("Pin report generation failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=PIN_REPORT_WORKERS)
+    parser.add_argument('--output-dir', default=PIN_REPORT_DIR)
+    parser.add_argument('--limit', type=int, default=None, help="Generate at most this many reports")
+    parser.add_argument('--rate', type=float, default=PIN_REPORT_RATE_PER_MIN, help="Maximum LLM requests per minute")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    from sensor_watcher import SensorWatcher
+    # With the server's lock a running server stays the only manifest and snapshot writer
+    sensors = SensorWatcher(on_update=lambda *_: None, lock_path=WATCH_LOCK_FILE).initial_load()
+    engine = PinReportEngine(args.output_dir, args.workers, rate_per_min=args.rate)
+    stats = engine.generate(sensors, limit=args.limit)
+    print(f"{stats['pins']} pins, {stats['generated']} generated, {stats['failed']} failed, "
+          f"{stats['deferred']} deferred")
+
+
+if __name__ == "__main__":
+    main()
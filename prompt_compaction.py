@@ -0,0 +1,186 @@
+"""
+Vectorized summaries and token budgeting used to keep report prompts a bounded size
+"""
+import logging
+from typing import List, Tuple
+import numpy as np
+from config import CLASSIFICATION
+from sensor_store import SensorStore
+
+logger = logging.getLogger(__name__)
+
+LEVEL_LABELS = {0: "Normal", 1: "Suspicious", 2: "FLOOD"}
+
+_encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count of a prompt fragment: tiktoken when available, otherwise ~4 characters per token"""
+    global _encoding
+    if _encoding is None:
+        # Imported on first use; tiktoken and its encoding tables are slow to load
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except ImportError:
+            _encoding = False
+        except Exception as e:
+            logger.warning("tiktoken unavailable, estimating tokens from length: %s", e)
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def fit_lines(lines: List[str], budget: int) -> Tuple[List[str], int]:
+    """Longest prefix of lines that fits the token budget, plus a note on what was left out"""
+    kept, used = [], 0
+    for i, line in enumerate(lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            kept.append(f"- ... {len(lines) - i} more omitted")
+            return kept, used + estimate_tokens(kept[-1]) + 1
+        kept.append(line)
+        used += cost
+    return kept, used
+
+
+def _group_stats(codes: np.ndarray, values: np.ndarray, groups: int):
+    """Per-group count, mean, min and max of values, ignoring NaN"""
+    valid = ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+    count = np.bincount(codes, minlength=groups)
+    total = np.bincount(codes, weights=values, minlength=groups)
+    low = np.full(groups, np.inf)
+    high = np.full(groups, -np.inf)
+    np.minimum.at(low, codes, values)
+    np.maximum.at(high, codes, values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    return count, mean, np.where(count, low, np.nan), np.where(count, high, np.nan)
+
+
+def _fmt(value: float, digits: int = 2) -> str:
+    return "n/a" if np.isnan(value) else f"{value:.{digits}f}"
+
+
+def top_score_index(sensors: SensorStore, k: int) -> np.ndarray:
+    """Row indices of the k highest combined scores, highest first"""
+    scores = np.nan_to_num(sensors['combined_score'], nan=-np.inf)
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    index = np.argpartition(-scores, k - 1)[:k]
+    return index[np.argsort(-scores[index], kind='stable')]
+
+
+def class_summary_lines(sensors: SensorStore) -> List[str]:
+    """One line per classification level with frame count and mean readings"""
+    levels = len(CLASSIFICATION)
+    codes = sensors['prediction'].astype(np.intp)
+    count, score_mean, _, score_max = _group_stats(codes, sensors['combined_score'], levels)
+    frames = np.bincount(codes, minlength=levels)
+    means = {name: _group_stats(codes, sensors[name], levels)[1]
+             for name in ('temperature', 'humidity', 'pressure')}
+
+    lines = []
+    for level in range(levels):
+        if not frames[level]:
+            continue
+        lines.append(
+            f"- {LEVEL_LABELS[level]} (Level {level}): {frames[level]} frames, "
+            f"flooding score mean {_fmt(score_mean[level], 3)} / max {_fmt(score_max[level], 3)}, "
+            f"mean {_fmt(means['temperature'][level], 1)}°C, {_fmt(means['humidity'][level], 1)}%, "
+            f"{_fmt(means['pressure'][level], 1)} hPa"
+        )
+    return lines
+
+
+def cell_summary_lines(sensors: SensorStore, cell_deg: float) -> List[str]:
+    """One line per spatial grid cell, most flooded cells first"""
+    located = sensors.has_location()
+    if not located.any():
+        return []
+    lat, lon = sensors['lat'][located], sensors['lon'][located]
+    prediction = sensors['prediction'][located].astype(np.intp)
+    score = sensors['combined_score'][located]
+
+    cells = np.stack([np.floor(lat / cell_deg), np.floor(lon / cell_deg)], axis=1)
+    _, inverse = np.unique(cells, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    groups = int(inverse.max()) + 1
+    levels = len(CLASSIFICATION)
+
+    by_level = np.bincount(inverse * levels + prediction, minlength=groups * levels).reshape(groups, levels)
+    frames = by_level.sum(axis=1)
+    center_lat = np.bincount(inverse, weights=lat, minlength=groups) / frames
+    center_lon = np.bincount(inverse, weights=lon, minlength=groups) / frames
+    _, _, _, score_max = _group_stats(inverse, score, groups)
+
+    order = np.lexsort((-np.nan_to_num(score_max), -by_level[:, 1], -by_level[:, levels - 1]))
+    return [
+        f"- Cell around ({center_lat[c]:.4f}, {center_lon[c]:.4f}): {frames[c]} frames "
+        f"({by_level[c, 2]} flood, {by_level[c, 1]} suspicious, {by_level[c, 0]} normal), "
+        f"max score {_fmt(score_max[c], 3)}"
+        for c in order
+    ]
+
+
+def camera_delta_lines(sensors: SensorStore) -> List[str]:
+    """Per-camera mean [min, max] of the baseline deltas, cameras with most floods first"""
+    codes = sensors['camera_id_code'].astype(np.intp)
+    cameras = sensors.tables['camera_id'] or ['Unknown']
+    groups = len(cameras)
+    frames = np.bincount(codes, minlength=groups)
+    floods = np.bincount(codes, weights=sensors['prediction'] == 2, minlength=groups).astype(int)
+    deltas = {name: _group_stats(codes, sensors[name], groups)
+              for name in ('delta_temperature', 'delta_humidity', 'delta_pressure')}
+
+    def describe(name: str, c: int, unit: str) -> str:
+        _, mean, low, high = deltas[name]
+        return f"{_fmt(mean[c])}{unit} [{_fmt(low[c])}, {_fmt(high[c])}]"
+
+    order = np.lexsort((-frames, -floods))
+    return [
+        f"- Camera {cameras[c]}: {frames[c]} frames ({floods[c]} flood); "
+        f"Δ temperature {describe('delta_temperature', c, '°C')}, "
+        f"Δ humidity {describe('delta_humidity', c, '%')}, "
+        f"Δ pressure {describe('delta_pressure', c, ' hPa')}"
+        for c in order if frames[c]
+    ]
+
+
+def _signed(value, digits: int = 2) -> str:
+    return "n/a" if value is None else f"{value:+.{digits}f}"
+
+
+def _per_frame(trend) -> str:
+    return "n/a" if trend is None else f"{trend:+.3f}/frame"
+
+
+def risk_location_lines(sensors: SensorStore, k: int, cell_deg: float) -> List[str]:
+    """One line per highest-risk grid cell with its peak frame's strongest baseline anomaly"""
+    from risk_analytics import top_risk_locations
+    lines = []
+    for row in top_risk_locations(sensors, k, cell_deg):
+        anomaly = (f"{row['signal']} {_signed(row['zscore'], 1)}σ from baseline" if row['signal']
+                   else "no sensor readings")
+        lines.append(
+            f"- Around ({row['lat']:.4f}, {row['lon']:.4f}): risk max {row['max_risk']:.2f} / mean "
+            f"{row['mean_risk']:.2f} over {row['frames']} frames ({row['floods']} flood); peak frame "
+            f"{row['peak_id']} on {row['camera']}, {anomaly}, score trend {_per_frame(row['trend'])}"
+        )
+    return lines
+
+
+def camera_stability_lines(sensors: SensorStore) -> List[str]:
+    """Per-camera classification stability and latest score trend, least stable cameras first"""
+    from risk_analytics import camera_stability
+    return [
+        f"- Camera {row['camera']}: {row['changes']} level changes in {row['frames']} frames, "
+        f"{row['flapping']} flapping / {row['drift']} drift / {row['conflict']} conflict flags, "
+        f"mean anomaly {_fmt(row['mean_anomaly'] if row['mean_anomaly'] is not None else np.nan, 1)}σ, "
+        f"latest rolling score {_fmt(row['rolling_score'] if row['rolling_score'] is not None else np.nan, 3)} "
+        f"(trend {_per_frame(row['trend'])})"
+        for row in camera_stability(sensors)
+    ]
@@ -0,0 +1,189 @@
+"""
+Batch generation of stakeholder reports from one shared data block
+
+Usage: python report_batch.py [--stakeholders farmer insurance] [--concurrency 3] [--rate 30]
+                              [--output-dir reports] [--regenerate] [--compare-sequential]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+import openai
+from config import (REPORT_BATCH_CONCURRENCY, REPORT_BATCH_RATE_PER_MIN, REPORT_BATCH_RETRIES,
+                    REPORT_BATCH_BACKOFF_S, REPORT_BATCH_OUTPUT_DIR, WATCH_LOCK_FILE)
+from llm_backends import RateLimiter, get_backend
+from llm_report import (STAKEHOLDER_PROMPTS, ReportContext, ReportFileWriter,
+                        build_report_context, build_report_prompt, get_report_store, request_completion)
+from sensor_store import SensorStore
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError,
+                    openai.InternalServerError)
+
+
+@dataclass
+class BatchReport:
+    """Outcome of one stakeholder report in a batch"""
+    stakeholder: str
+    filename: Optional[str] = None
+    cached: bool = False
+    attempts: int = 0
+    latency_s: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchResult:
+    """All reports of a batch with wall-clock and throughput figures"""
+    reports: List[BatchReport] = field(default_factory=list)
+    context_s: float = 0.0
+    wall_clock_s: float = 0.0
+
+    @property
+    def sequential_s(self) -> float:
+        """Time the same calls would take one after another"""
+        return self.context_s + sum(report.latency_s for report in self.reports)
+
+    @property
+    def throughput_per_min(self) -> float:
+        done = sum(1 for report in self.reports if report.error is None)
+        return done * 60.0 / self.wall_clock_s if self.wall_clock_s else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'reports': [report.__dict__ for report in self.reports],
+            'context_s': self.context_s,
+            'wall_clock_s': self.wall_clock_s,
+            'sequential_s': self.sequential_s,
+            'speedup': self.sequential_s / self.wall_clock_s if self.wall_clock_s else None,
+            'throughput_per_min': self.throughput_per_min,
+        }
+
+
+def _complete_with_retry(config: Dict, prompt: str, limiter: RateLimiter, retries: int,
+                         backoff_s: float, result: BatchReport) -> str:
+    """Call the API, retrying transient errors with exponential backoff and jitter"""
+    while True:
+        limiter.acquire()
+        result.attempts += 1
+        try:
+            return request_completion(config, prompt)
+        except RETRYABLE_ERRORS as e:
+            if result.attempts > retries:
+                raise
+            delay = backoff_s * 2 ** (result.attempts - 1) * random.uniform(0.5, 1.5)
+            logger.warning("Report for %s failed (%s), retrying in %.1fs", result.stakeholder, e, delay)
+            time.sleep(delay)
+
+
+def _generate_one(context: ReportContext, stakeholder: str, limiter: RateLimiter, retries: int,
+                  backoff_s: float, regenerate: bool, output_dir: str) -> BatchReport:
+    result = BatchReport(stakeholder=stakeholder)
+    start = time.perf_counter()
+    config, prompt, cache_key = build_report_prompt(context, stakeholder)
+    try:
+        report = None if regenerate else get_report_store().get(cache_key)
+        result.cached = report is not None
+        if report is None:
+            report = _complete_with_retry(config, prompt, limiter, retries, backoff_s, result)
+            get_report_store().put(cache_key, report, stakeholder, get_backend().model)
+        writer = ReportFileWriter(directory=output_dir, prefix=f"flood_report_{stakeholder}")
+        writer.write(report)
+        result.filename = writer.close()
+    except Exception as e:
+        logger.exception("Report for %s failed", stakeholder)
+        result.error = str(e)
+    result.latency_s = time.perf_counter() - start
+    return result
+
+
+def generate_all_reports(sensors: SensorStore, stakeholders: Optional[Sequence[str]] = None,
+                         max_concurrency: int = REPORT_BATCH_CONCURRENCY,
+                         rate_per_min: float = REPORT_BATCH_RATE_PER_MIN,
+                         retries: int = REPORT_BATCH_RETRIES, backoff_s: float = REPORT_BATCH_BACKOFF_S,
+                         regenerate: bool = False, output_dir: str = REPORT_BATCH_OUTPUT_DIR) -> BatchResult:
+    """Generate one report per stakeholder concurrently and write each to its own file
+
+    The data summary and sensor block are built once and shared by every prompt. Cached reports
+    are reused unless regenerate=True; API calls are rate limited and retried on transient errors.
+    """
+    stakeholders = list(stakeholders or STAKEHOLDER_PROMPTS)
+    os.makedirs(output_dir, exist_ok=True)
+    result = BatchResult()
+
+    wall_start = time.perf_counter()
+    context = build_report_context(sensors)
+    result.context_s = time.perf_counter() - wall_start
+
+    limiter = RateLimiter(rate_per_min, burst=max_concurrency)
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="report-batch") as executor:
+        futures = [
+            executor.submit(_generate_one, context, stakeholder, limiter, retries, backoff_s,
+                            regenerate, output_dir)
+            for stakeholder in stakeholders
+        ]
+        result.reports = [future.result() for future in futures]
+    result.wall_clock_s = time.perf_counter() - wall_start
+    return result
+
+
+def _print_result(label: str, result: BatchResult) -> None:
+    print(f"\n{label}")
+    print(f"{'stakeholder':<16} {'status':<8} {'attempts':>8} {'latency (s)':>12}  file")
+    for report in result.reports:
+        status = 'error' if report.error else 'cached' if report.cached else 'ok'
+        print(f"{report.stakeholder:<16} {status:<8} {report.attempts:>8} {report.latency_s:>12.2f}  "
+              f"{report.filename or report.error}")
+    print(f"wall-clock {result.wall_clock_s:.2f}s, sequential-equivalent {result.sequential_s:.2f}s, "
+          f"throughput {result.throughput_per_min:.1f} reports/min")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--stakeholders', nargs='+', choices=list(STAKEHOLDER_PROMPTS))
+    parser.add_argument('--concurrency', type=int, default=REPORT_BATCH_CONCURRENCY)
+    parser.add_argument('--rate', type=float, default=REPORT_BATCH_RATE_PER_MIN,
+                        help="Maximum API requests per minute")
+    parser.add_argument('--retries', type=int, default=REPORT_BATCH_RETRIES)
+    parser.add_argument('--output-dir', default=REPORT_BATCH_OUTPUT_DIR)
+    parser.add_argument('--regenerate', action='store_true', help="Ignore cached reports")
+    parser.add_argument('--compare-sequential', action='store_true',
+                        help="Also run the same batch with concurrency 1 and compare wall-clock time "
+                             "(both runs bypass the report cache)")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    from sensor_watcher import SensorWatcher
+    # With the server's lock a running server stays the only manifest and snapshot writer
+    sensors = SensorWatcher(on_update=lambda *_: None, lock_path=WATCH_LOCK_FILE).initial_load()
+
+    # Cache hits would make either run look instant, so a comparison regenerates every report
+    regenerate = args.regenerate or args.compare_sequential
+    results = {}
+    results['concurrent'] = generate_all_reports(
+        sensors, args.stakeholders, max_concurrency=args.concurrency, rate_per_min=args.rate,
+        retries=args.retries, regenerate=regenerate, output_dir=args.output_dir)
+    _print_result(f"Concurrent (max {args.concurrency})", results['concurrent'])
+
+    if args.compare_sequential:
+        results['sequential'] = generate_all_reports(
+            sensors, args.stakeholders, max_concurrency=1, rate_per_min=args.rate,
+            retries=args.retries, regenerate=True, output_dir=args.output_dir)
+        _print_result("Sequential", results['sequential'])
+        speedup = results['sequential'].wall_clock_s / results['concurrent'].wall_clock_s
+        print(f"\nspeedup {speedup:.2f}x")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({name: result.to_dict() for name, result in results.items()}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
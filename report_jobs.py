@@ -0,0 +1,298 @@
+"""
+Background report generation jobs with de-duplication, cancellation and timing metrics
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+from config import REPORT_JOB_DIR, REPORT_JOB_RETENTION, REPORT_JOB_SYNC_S, REPORT_JOB_WORKERS
+from llm_report import ReportFileWriter, generate_report_stream, tee_report_to_file
+from sensor_store import SensorStore
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# Fields written to the shared job directory
+SHARED_FIELDS = ('job_id', 'stakeholder', 'status', 'report', 'filename', 'error', 'submitted_at',
+                 'started_at', 'finished_at', 'first_chunk_at')
+
+
+@dataclass
+class ReportJob:
+    """State of one report generation request"""
+    job_id: str
+    key: tuple
+    stakeholder: str
+    status: str = QUEUED
+    report: Optional[str] = None
+    filename: Optional[str] = None
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    future: Optional[Future] = None
+    parts: List[str] = field(default_factory=list)
+    first_chunk_at: Optional[float] = None
+    changed: threading.Condition = field(default_factory=threading.Condition)
+    synced_at: float = 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def partial_report(self) -> str:
+        """Text received so far"""
+        return "".join(self.parts)
+
+    def append(self, chunk: str) -> None:
+        with self.changed:
+            if self.first_chunk_at is None:
+                self.first_chunk_at = time.time()
+            self.parts.append(chunk)
+            self.changed.notify_all()
+
+    def finish(self, status: str) -> None:
+        with self.changed:
+            self.status = status
+            self.finished_at = self.finished_at or time.time()
+            self.changed.notify_all()
+
+    def iter_chunks(self, keepalive_s: float = 15.0) -> Iterator[Optional[str]]:
+        """Yield chunks as they arrive until the job finishes; yields None as a keep-alive while idle"""
+        sent = 0
+        while True:
+            with self.changed:
+                if sent == len(self.parts) and not self.finished:
+                    self.changed.wait(keepalive_s)
+                new_parts = self.parts[sent:]
+                finished = self.finished
+            sent += len(new_parts)
+            if new_parts:
+                yield "".join(new_parts)
+            elif not finished:
+                yield None
+            if finished and sent == len(self.parts):
+                return
+
+    def metrics(self) -> Dict[str, Optional[float]]:
+        """Queue wait, run time and total latency in seconds"""
+        end = self.finished_at or time.time()
+        return {
+            'queue_wait_s': (self.started_at or end) - self.submitted_at,
+            'time_to_first_chunk_s': self.first_chunk_at - self.submitted_at if self.first_chunk_at else None,
+            'run_s': end - self.started_at if self.started_at else None,
+            'total_s': end - self.submitted_at,
+        }
+
+    def shared_state(self) -> Dict:
+        """State written for other server workers; a running job carries its text so far as the report"""
+        state = {name: getattr(self, name) for name in SHARED_FIELDS}
+        state['report'] = self.report if self.report is not None else self.partial_report
+        return state
+
+    def to_dict(self) -> Dict:
+        return {
+            'job_id': self.job_id,
+            'stakeholder': self.stakeholder,
+            'status': self.status,
+            'filename': self.filename,
+            'error': self.error,
+            **self.metrics(),
+        }
+
+
+class SharedReportJob(ReportJob):
+    """A job running in another server worker, read from the shared job directory"""
+
+    def __init__(self, path: str, sync_s: float, state: Dict):
+        super().__init__(job_id=state['job_id'], key=(), stakeholder=state['stakeholder'])
+        self.path = path
+        self.sync_s = sync_s
+        self._apply(state)
+
+    def _apply(self, state: Dict) -> None:
+        for name in SHARED_FIELDS:
+            setattr(self, name, state.get(name))
+        self.parts = [self.report] if self.report else []
+        if not self.finished:
+            self.report = None
+
+    def refresh(self) -> None:
+        state = _read_state(self.path)
+        if state is not None:
+            self._apply(state)
+
+    def iter_chunks(self, keepalive_s: float = 15.0) -> Iterator[Optional[str]]:
+        """Follow the owning worker's writes until the job finishes; yields None as a keep-alive while idle"""
+        sent, idle_since = 0, time.time()
+        while True:
+            text, finished = self.partial_report, self.finished
+            if len(text) > sent:
+                yield text[sent:]
+                sent, idle_since = len(text), time.time()
+            elif finished:
+                return
+            elif time.time() - idle_since >= keepalive_s:
+                yield None
+                idle_since = time.time()
+            time.sleep(self.sync_s)
+            self.refresh()
+
+
+def _read_state(path: str) -> Optional[Dict]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class ReportJobManager:
+    """Run report generation on a bounded thread pool, sharing one job between identical requests
+
+    With a directory, each job's state (status, text so far, result) is written there at most every
+    sync_s, so any server worker can poll, stream or cancel a job that another worker runs.
+    """
+
+    def __init__(self, max_workers: int = REPORT_JOB_WORKERS, retention: int = REPORT_JOB_RETENTION,
+                 directory: Optional[str] = REPORT_JOB_DIR, sync_s: float = REPORT_JOB_SYNC_S):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-job")
+        self._jobs: 'OrderedDict[str, ReportJob]' = OrderedDict()
+        self._in_flight: Dict[tuple, str] = {}
+        self._retention = retention
+        self.directory = directory
+        self.sync_s = sync_s
+        self._lock = threading.Lock()
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _cancel_requested(self, job: ReportJob) -> bool:
+        return bool(self.directory) and os.path.exists(f"{self._path(job.job_id)}.cancel")
+
+    def _sync(self, job: ReportJob, force: bool = True) -> None:
+        """Write the job's state for other workers and pick up a cancel one of them requested"""
+        if not self.directory or (not force and time.time() - job.synced_at < self.sync_s):
+            return
+        job.synced_at = time.time()
+        if not job.finished and self._cancel_requested(job):
+            # cancel() shares the cancelled state
+            self.cancel(job.job_id)
+            return
+        path = self._path(job.job_id)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # A local cancel writes from the cancelling thread while the job's own thread may be writing
+            tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(job.shared_state(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not share report job %s: %s", job.job_id, e)
+
+    def submit(self, sensors: SensorStore, stakeholder: str = "general", regenerate: bool = False) -> str:
+        """Queue a report and return its job id; an identical in-flight request returns the existing id"""
+        key = (sensors.fingerprint(), stakeholder, regenerate)
+        with self._lock:
+            existing = self._in_flight.get(key)
+            if existing is not None:
+                return existing
+
+            job = ReportJob(job_id=uuid.uuid4().hex, key=key, stakeholder=stakeholder)
+            self._jobs[job.job_id] = job
+            self._in_flight[key] = job.job_id
+            self._prune()
+            # Shared before it starts, so other workers know the job from the moment its id is returned
+            self._sync(job)
+            job.future = self._executor.submit(self._run, job, sensors, regenerate)
+            return job.job_id
+
+    def _run(self, job: ReportJob, sensors: SensorStore, regenerate: bool) -> None:
+        # Another worker may have cancelled the job while it was queued
+        if job.status != CANCELLED and self._cancel_requested(job):
+            self.cancel(job.job_id)
+        if job.status == CANCELLED:
+            self._sync(job)
+            return
+        job.started_at = time.time()
+        job.status = RUNNING
+        self._sync(job)
+        writer = ReportFileWriter()
+        chunks = generate_report_stream(sensors, stakeholder=job.stakeholder, regenerate=regenerate)
+        try:
+            for chunk in tee_report_to_file(chunks, writer):
+                if job.status == CANCELLED:
+                    break
+                job.append(chunk)
+                self._sync(job, force=False)
+        except Exception as e:
+            logger.exception("Report job %s failed", job.job_id)
+            job.error = str(e)
+        finally:
+            chunks.close()
+            if job.status == CANCELLED or job.error:
+                writer.abort()
+                job.finish(job.status if job.status == CANCELLED else FAILED)
+            else:
+                job.filename = writer.close()
+                job.report = job.partial_report
+                job.finish(DONE)
+            self._release(job)
+            self._sync(job)
+            logger.info("Report job %s (%s) %s: %s", job.job_id, job.stakeholder, job.status, job.metrics())
+
+    def _release(self, job: ReportJob) -> None:
+        with self._lock:
+            if self._in_flight.get(job.key) == job.job_id:
+                del self._in_flight[job.key]
+
+    def _prune(self) -> None:
+        """Forget the oldest finished jobs beyond the retention limit"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(self._jobs) - self._retention)]:
+            del self._jobs[job_id]
+            if self.directory:
+                for path in (self._path(job_id), f"{self._path(job_id)}.cancel"):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        """A job of this process, or one another server worker shares; None if it is unknown"""
+        job = self._jobs.get(job_id)
+        if job is not None or not self.directory or not JOB_ID_PATTERN.match(job_id or ''):
+            return job
+        state = _read_state(self._path(job_id))
+        return SharedReportJob(self._path(job_id), self.sync_s, state) if state else None
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job; a running stream is closed at its next chunk and the partial file removed"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            # The worker running it stops at its next sync
+            shared = self.get(job_id)
+            if shared is None or shared.finished:
+                return False
+            with open(f"{self._path(job_id)}.cancel", 'w'):
+                pass
+            return True
+        if job.finished:
+            return False
+        job.finish(CANCELLED)
+        if job.future is not None:
+            job.future.cancel()
+        self._release(job)
+        self._sync(job)
+        return True
@@ -0,0 +1,80 @@
+"""
+Persistent SQLite cache of generated LLM reports with TTL and LRU eviction
+"""
+import sqlite3
+import threading
+import time
+from typing import Optional
+from config import REPORT_CACHE_DB, REPORT_CACHE_TTL_S, REPORT_CACHE_MAX_ENTRIES
+
+
+class ReportStore:
+    """Key/value store of report texts, evicting expired and least recently used entries"""
+
+    def __init__(self, path: str = REPORT_CACHE_DB, ttl_s: float = REPORT_CACHE_TTL_S,
+                 max_entries: int = REPORT_CACHE_MAX_ENTRIES):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS reports (
+                key TEXT PRIMARY KEY,
+                stakeholder TEXT NOT NULL,
+                model TEXT NOT NULL,
+                report TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS reports_last_access ON reports(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached report, or None if it is missing or older than the TTL"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT report, created_at FROM reports WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            report, created_at = row
+            if now - created_at > self.ttl_s:
+                self._conn.execute("DELETE FROM reports WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE reports SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            return report
+
+    def put(self, key: str, report: str, stakeholder: str, model: str) -> None:
+        """Store a report and evict expired and least recently used entries"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reports (key, stakeholder, model, report, created_at, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, stakeholder, model, report, now, now),
+            )
+            self._conn.execute("DELETE FROM reports WHERE created_at < ?", (now - self.ttl_s,))
+            self._conn.execute(
+                "DELETE FROM reports WHERE key NOT IN "
+                "(SELECT key FROM reports ORDER BY last_access DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def invalidate(self, key: str) -> None:
+        """Drop one cached report"""
+        with self._lock:
+            self._conn.execute("DELETE FROM reports WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
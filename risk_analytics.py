@@ -0,0 +1,245 @@
+"""
+Vectorized anomaly and risk scoring: baseline z-scores, rolling per-camera trends, classifier
+stability counts and a ranked table of the riskiest locations
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import numpy as np
+from config import (CLASSIFICATION, RISK_CELL_DEG, RISK_MIN_BASELINE_FRAMES, RISK_SCALE_FLOORS,
+                    RISK_TOP_LOCATIONS, RISK_TREND_WINDOW, RISK_WEIGHTS, RISK_Z_CAP)
+from sensor_store import SensorStore
+
+# Sensor signals compared against their baselines
+SIGNALS = ('temperature', 'humidity', 'pressure')
+
+FLAG_COLUMNS = ('flapping', 'drift', 'conflict')
+
+
+@dataclass
+class RiskScores:
+    """Per-row scores in store order, plus each camera's latest frame"""
+    zscores: Dict[str, np.ndarray]
+    anomaly: np.ndarray
+    rolling_score: np.ndarray
+    trend: np.ndarray
+    changed: np.ndarray
+    risk: np.ndarray
+    # Row index of each camera's latest frame, -1 for cameras without rows
+    latest: np.ndarray
+
+
+def baseline_deltas(sensors: SensorStore, signal: str) -> np.ndarray:
+    """Reading minus baseline: the edge's delta column, computed from the readings where it is missing"""
+    deltas = sensors[f'delta_{signal}']
+    computed = sensors[signal] - sensors[f'{signal}_baseline']
+    return np.where(np.isnan(deltas), computed, deltas)
+
+
+def _group_std(codes: np.ndarray, values: np.ndarray, groups: int):
+    """Per-group count and standard deviation of values, ignoring NaN"""
+    valid = ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+    count = np.bincount(codes, minlength=groups)
+    total = np.bincount(codes, weights=values, minlength=groups)
+    squares = np.bincount(codes, weights=values * values, minlength=groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance = np.maximum(squares / count - mean * mean, 0)
+    return count, np.sqrt(variance)
+
+
+def baseline_zscores(sensors: SensorStore) -> Dict[str, np.ndarray]:
+    """Each frame's distance from its baseline in units of the camera's usual spread
+
+    The spread is that of the camera's normal (level 0) frames when it has enough of them, of all
+    its frames otherwise, and never below RISK_SCALE_FLOORS.
+    """
+    codes = sensors['camera_id_code'].astype(np.intp)
+    groups = max(len(sensors.tables['camera_id']), 1)
+    normal = sensors['prediction'] == 0
+    zscores = {}
+    for signal in SIGNALS:
+        deltas = baseline_deltas(sensors, signal)
+        normal_count, normal_std = _group_std(codes[normal], deltas[normal], groups)
+        _, all_std = _group_std(codes, deltas, groups)
+        spread = np.where(normal_count >= RISK_MIN_BASELINE_FRAMES, normal_std, all_std)
+        scale = np.fmax(spread, RISK_SCALE_FLOORS[signal])
+        zscores[signal] = deltas / scale[codes]
+    return zscores
+
+
+def _camera_order(sensors: SensorStore) -> np.ndarray:
+    """Rows grouped by camera, each camera's frames in capture order (untimed frames last)"""
+    times = np.full(len(sensors), np.nan)
+    index = sensors.time_index()
+    times[index.rows] = index.times
+    return np.lexsort((sensors['id'], times, sensors['camera_id_code']))
+
+
+def _rolling_trend(values: np.ndarray, starts: np.ndarray, window: int):
+    """Mean and least-squares slope per frame over the last `window` frames of the same group
+
+    starts marks the first frame of each group. window - 1 blank frames are put in front of every
+    group so no window reaches into the previous one; each windowed sum is then one convolution.
+    """
+    n = len(values)
+    positions = np.arange(n) + np.cumsum(starts) * (window - 1)
+    padded = np.full(n + int(starts.sum()) * (window - 1), np.nan)
+    padded[positions] = values
+    valid = ~np.isnan(padded)
+    counted = valid.astype(float)
+    filled = np.where(valid, padded, 0.0)
+
+    # np.convolve flips the kernel, so position j in the window is weighted by x[j]
+    x = np.arange(window, dtype=float)[::-1]
+    ones = np.ones(window)
+    index = positions - (window - 1)
+    count, sum_y, sum_x, sum_xy, sum_xx = (
+        np.convolve(series, kernel, mode='valid')[index]
+        for series, kernel in ((counted, ones), (filled, ones), (counted, x), (filled, x), (counted, x * x)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sum_y / count
+        slope = (count * sum_xy - sum_x * sum_y) / (count * sum_xx - sum_x * sum_x)
+    return mean, np.where(count >= 2, slope, np.nan)
+
+
+def score_risk(sensors: SensorStore, window: int = RISK_TREND_WINDOW) -> RiskScores:
+    """Z-scores, anomaly magnitude, rolling score trend and a 0-1 risk score for every row
+
+    risk weighs (RISK_WEIGHTS) the edge's combined score, the classification level, the RMS
+    baseline z-score capped at RISK_Z_CAP and the rise of the camera's score over the window.
+    """
+    n = len(sensors)
+    cameras = max(len(sensors.tables['camera_id']), 1)
+    zscores = baseline_zscores(sensors)
+
+    stacked = np.stack([zscores[signal] for signal in SIGNALS])
+    measured = (~np.isnan(stacked)).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        anomaly = np.sqrt(np.nansum(stacked * stacked, axis=0) / measured)
+
+    rolling_score, trend = np.full(n, np.nan), np.full(n, np.nan)
+    changed = np.zeros(n, dtype=bool)
+    latest = np.full(cameras, -1, dtype=np.intp)
+    if n:
+        order = _camera_order(sensors)
+        codes = sensors['camera_id_code'][order]
+        starts = np.ones(n, dtype=bool)
+        starts[1:] = codes[1:] != codes[:-1]
+        rolling_score[order], trend[order] = _rolling_trend(sensors['combined_score'][order], starts, window)
+
+        prediction = sensors['prediction'][order]
+        changed[order[1:]] = (prediction[1:] != prediction[:-1]) & ~starts[1:]
+        ends = np.append(starts[1:], True)
+        latest[codes[ends]] = order[ends]
+
+    top_level = max(len(CLASSIFICATION) - 1, 1)
+    risk = (RISK_WEIGHTS['score'] * np.clip(np.nan_to_num(sensors['combined_score']), 0, 1)
+            + RISK_WEIGHTS['level'] * sensors['prediction'] / top_level
+            + RISK_WEIGHTS['anomaly'] * np.clip(np.nan_to_num(anomaly) / RISK_Z_CAP, 0, 1)
+            + RISK_WEIGHTS['trend'] * np.clip(np.nan_to_num(trend) * window, 0, 1))
+    return RiskScores(zscores=zscores, anomaly=anomaly, rolling_score=rolling_score, trend=trend,
+                      changed=changed, risk=risk, latest=latest)
+
+
+def _optional(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+def dominant_signals(scores: RiskScores, rows: np.ndarray) -> List[Optional[str]]:
+    """The signal furthest from its baseline at each row, None where nothing was measured"""
+    magnitude = np.abs(np.stack([scores.zscores[signal][rows] for signal in SIGNALS]))
+    strongest = np.argmax(np.nan_to_num(magnitude, nan=-1.0), axis=0)
+    measured = ~np.isnan(magnitude).all(axis=0)
+    return [SIGNALS[s] if ok else None for s, ok in zip(strongest.tolist(), measured.tolist())]
+
+
+def top_risk_locations(sensors: SensorStore, k: int = RISK_TOP_LOCATIONS,
+                       cell_deg: float = RISK_CELL_DEG) -> List[Dict]:
+    """Grid cells ranked by their highest frame risk (then mean risk), with the peak frame's details"""
+    located = np.flatnonzero(sensors.has_location())
+    if not len(located):
+        return []
+    scores = sensors.risk()
+    lat, lon, risk = sensors['lat'][located], sensors['lon'][located], scores.risk[located]
+
+    # One int64 key per cell is much cheaper to group than unique rows of a 2-D array
+    cell_lat = np.floor(lat / cell_deg).astype(np.int64)
+    cell_lon = np.floor(lon / cell_deg).astype(np.int64)
+    keys = cell_lat * (1 << 32) + (cell_lon - cell_lon.min())
+    _, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    groups = int(inverse.max()) + 1
+
+    frames = np.bincount(inverse, minlength=groups)
+    floods = np.bincount(inverse, weights=sensors['prediction'][located] == 2, minlength=groups).astype(int)
+    mean_risk = np.bincount(inverse, weights=risk, minlength=groups) / frames
+    center_lat = np.bincount(inverse, weights=lat, minlength=groups) / frames
+    center_lon = np.bincount(inverse, weights=lon, minlength=groups) / frames
+    # The first row of each cell once sorted by cell, then by descending risk, is its peak
+    by_cell = np.lexsort((-risk, inverse))
+    firsts = by_cell[np.r_[True, inverse[by_cell][1:] != inverse[by_cell][:-1]]]
+    max_risk = risk[firsts]
+    peaks = located[firsts]
+
+    ranked = np.lexsort((-mean_risk, -max_risk))[:k]
+    cameras = sensors.labels('camera_id')
+    signals = dominant_signals(scores, peaks[ranked])
+    rows = []
+    for c, signal in zip(ranked.tolist(), signals):
+        peak = peaks[c]
+        rows.append({
+            'lat': float(center_lat[c]),
+            'lon': float(center_lon[c]),
+            'frames': int(frames[c]),
+            'floods': int(floods[c]),
+            'max_risk': float(max_risk[c]),
+            'mean_risk': float(mean_risk[c]),
+            'peak_id': int(sensors['id'][peak]),
+            'camera': cameras[peak],
+            'signal': signal,
+            'zscore': _optional(scores.zscores[signal][peak]) if signal else None,
+            'trend': _optional(scores.trend[peak]),
+        })
+    return rows
+
+
+def camera_stability(sensors: SensorStore) -> List[Dict]:
+    """Per camera: prediction changes between consecutive frames, edge stability flags, mean
+    anomaly, peak risk and the latest rolling score and trend; least stable cameras first"""
+    scores = sensors.risk()
+    codes = sensors['camera_id_code'].astype(np.intp)
+    cameras = sensors.tables['camera_id'] or ['Unknown']
+    groups = len(cameras)
+    frames = np.bincount(codes, minlength=groups)
+    floods = np.bincount(codes, weights=sensors['prediction'] == 2, minlength=groups).astype(int)
+    changes = np.bincount(codes, weights=scores.changed, minlength=groups).astype(int)
+    flags = {name: np.bincount(codes, weights=np.nan_to_num(sensors[name]) > 0, minlength=groups).astype(int)
+             for name in FLAG_COLUMNS}
+    anomaly = np.nan_to_num(scores.anomaly)
+    measured = np.bincount(codes, weights=~np.isnan(scores.anomaly), minlength=groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_anomaly = np.bincount(codes, weights=anomaly, minlength=groups) / measured
+    max_risk = np.zeros(groups)
+    np.maximum.at(max_risk, codes, scores.risk)
+
+    rows = []
+    for c in np.flatnonzero(frames).tolist():
+        latest = scores.latest[c] if c < len(scores.latest) else -1
+        rows.append({
+            'camera': cameras[c],
+            'frames': int(frames[c]),
+            'floods': int(floods[c]),
+            'changes': int(changes[c]),
+            **{name: int(flags[name][c]) for name in FLAG_COLUMNS},
+            'mean_anomaly': _optional(mean_anomaly[c]),
+            'max_risk': float(max_risk[c]),
+            'rolling_score': _optional(scores.rolling_score[latest]) if latest >= 0 else None,
+            'trend': _optional(scores.trend[latest]) if latest >= 0 else None,
+        })
+    return sorted(rows, key=lambda row: (-(row['changes'] + row['flapping'] + row['drift']), -row['frames']))
+
+
+def high_risk_count(sensors: SensorStore, threshold: float) -> int:
+    """Frames whose risk score reaches the threshold"""
+    return int((sensors.risk().risk >= threshold).sum())
@@ -0,0 +1,282 @@
+"""
+Registry of every detection run on disk: per-run summaries precomputed into an index file, and run
+payloads loaded on demand into a size-bounded LRU
+"""
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from config import (CLASSIFICATION, RISK_HIGH_THRESHOLD, RUN_CACHE_ENTRIES, RUN_CACHE_MAX_MB, RUN_INDEX_FILE,
+                    SNAPSHOT_DIR)
+from data_loader import default_data_roots, discover_sensor_files, iter_sensors
+from sensor_store import SensorStore
+from snapshot import current_snapshot_key, load_snapshot, write_snapshot
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever summarize_runs changes so stored summaries are recomputed
+RUN_INDEX_VERSION = 1
+
+# Rows of a run loaded on demand get ids number * RUN_ID_STRIDE + position, clear of the live ids
+RUN_ID_STRIDE = 10 ** 9
+
+
+def summarize_runs(sensors: SensorStore) -> Dict[str, Dict]:
+    """Frame and level counts, time span, cameras, run directories, score and risk per run_id"""
+    if not len(sensors):
+        return {}
+    codes = sensors['run_id_code'].astype(np.intp)
+    runs = sensors.tables['run_id']
+    groups, levels = len(runs), len(CLASSIFICATION)
+
+    frames = np.bincount(codes, minlength=groups)
+    by_level = np.bincount(codes * levels + sensors['prediction'].astype(np.intp),
+                           minlength=groups * levels).reshape(groups, levels)
+    index = sensors.time_index()
+    first, last = np.full(groups, np.inf), np.full(groups, -np.inf)
+    np.minimum.at(first, codes[index.rows], index.times)
+    np.maximum.at(last, codes[index.rows], index.times)
+
+    score = sensors['combined_score']
+    scored = ~np.isnan(score)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_score = (np.bincount(codes[scored], weights=score[scored], minlength=groups)
+                      / np.bincount(codes[scored], minlength=groups))
+    risk = sensors.risk().risk
+    max_risk = np.zeros(groups)
+    np.maximum.at(max_risk, codes, risk)
+    high_risk = np.bincount(codes, weights=risk >= RISK_HIGH_THRESHOLD, minlength=groups).astype(int)
+
+    # Distinct (run, camera) and (run, directory) pairs
+    cameras = len(sensors.tables['camera_id']) or 1
+    camera_counts = np.bincount(np.unique(codes * cameras + sensors['camera_id_code']) // cameras,
+                                minlength=groups)
+    dir_tables = len(sensors.tables['run_dir']) or 1
+    run_dirs: Dict[int, List[str]] = {}
+    for pair in np.unique(codes * dir_tables + sensors['run_dir_code']).tolist():
+        run_dirs.setdefault(pair // dir_tables, []).append(sensors.tables['run_dir'][pair % dir_tables])
+
+    summaries = {}
+    for c in np.flatnonzero(frames).tolist():
+        summaries[runs[c]] = {
+            'run_id': runs[c],
+            'run_dirs': sorted(run_dirs.get(c, [])),
+            'frames': int(frames[c]),
+            'levels': {str(level): int(count) for level, count in enumerate(by_level[c])},
+            'start': float(first[c]) if np.isfinite(first[c]) else None,
+            'end': float(last[c]) if np.isfinite(last[c]) else None,
+            'cameras': int(camera_counts[c]),
+            'mean_score': None if np.isnan(mean_score[c]) else float(mean_score[c]),
+            'max_risk': float(max_risk[c]),
+            'high_risk': int(high_risk[c]),
+        }
+    return summaries
+
+
+def _store_bytes(store: SensorStore) -> int:
+    return sum(column.nbytes for column in store.columns.values())
+
+
+class RunRegistry:
+    """Index of every run keyed by metadata.run_id, shared by all server processes through a JSON file
+
+    Runs in the live sensor set are summarized from it on every update. Other run directories are
+    summarized once from their snapshot (written on first scan if missing) and loaded only when
+    selected; loaded runs and live-run selections are kept in an LRU bounded by RUN_CACHE_ENTRIES
+    and RUN_CACHE_MAX_MB.
+    """
+
+    def __init__(self, index_path: str = RUN_INDEX_FILE, roots: Optional[Sequence[str]] = None,
+                 snapshot_dir: str = SNAPSHOT_DIR, cache_entries: int = RUN_CACHE_ENTRIES,
+                 cache_mb: float = RUN_CACHE_MAX_MB):
+        self.index_path = index_path
+        self.roots = roots
+        self.snapshot_dir = snapshot_dir
+        self.cache_entries = cache_entries
+        self.cache_bytes = int(cache_mb * 1024 * 1024)
+        self.entries: Dict[str, Dict] = self._read_index()
+        self.live_runs: set = set()
+        # Bumped whenever the index changes, so views of it can be cached until then
+        self.revision = 0
+        # (run ids) -> (store, whether it was sliced from the live set)
+        self._cache: 'OrderedDict[Tuple[str, ...], Tuple[SensorStore, bool]]' = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _current_roots(self) -> List[str]:
+        return list(self.roots) if self.roots else default_data_roots()
+
+    def _read_index(self) -> Dict[str, Dict]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable run index %s: %s", self.index_path, e)
+            return {}
+        return index.get('runs', {}) if index.get('version') == RUN_INDEX_VERSION else {}
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.index_path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _merge(self, summaries: Dict[str, Dict]) -> None:
+        """Merge summaries into the index on disk, numbering new runs, and adopt the result"""
+        with self._file_lock():
+            entries = self._read_index()
+            numbers = [entry['number'] for entry in entries.values()]
+            next_number = max(numbers, default=0) + 1
+            for run_id, summary in summaries.items():
+                entry = entries.get(run_id)
+                if entry is None:
+                    entry = entries[run_id] = {'number': next_number, 'roots': [], 'keys': {}}
+                    next_number += 1
+                entry.update(summary)
+            tmp_path = f"{self.index_path}.tmp{os.getpid()}"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': RUN_INDEX_VERSION, 'runs': entries}, f)
+            os.replace(tmp_path, self.index_path)
+        with self._lock:
+            self.entries = entries
+            self.revision += 1
+
+    def update_live(self, sensors: SensorStore) -> None:
+        """Re-summarize the runs of the live sensor set and drop cached selections sliced from it"""
+        summaries = summarize_runs(sensors)
+        roots = {os.path.basename(root): root for root in self._current_roots()}
+        for summary in summaries.values():
+            summary['roots'] = [roots[name] for name in summary['run_dirs'] if name in roots]
+        with self._lock:
+            self.live_runs = set(summaries)
+            for key in [key for key, (_, live) in self._cache.items() if live]:
+                del self._cache[key]
+        if summaries:
+            self._merge(summaries)
+
+    def _load_root(self, root: str) -> SensorStore:
+        """A run directory's rows from its snapshot, parsing it (and writing the snapshot) if it has none"""
+        loaded = load_snapshot(root, self.snapshot_dir)
+        if loaded:
+            return loaded[0]
+        store = SensorStore.from_records(iter_sensors(files=discover_sensor_files([root])))
+        if len(store):
+            # Imported here so the app can be built before the watcher module is loaded
+            from sensor_watcher import file_digest
+            hashes = {path: file_digest(path) for path in store['source_file']}
+            write_snapshot(root, store, hashes, self.snapshot_dir)
+        return store
+
+    def scan(self, roots: Optional[Sequence[str]] = None) -> int:
+        """Summarize run directories not indexed at their current snapshot; returns how many were"""
+        scanned = 0
+        try:
+            for root in roots or self._current_roots():
+                key = current_snapshot_key(root, self.snapshot_dir)
+                with self._lock:
+                    covered = [entry for run_id, entry in self.entries.items()
+                               if root in entry.get('roots', [])]
+                    live = any(entry['run_id'] in self.live_runs for entry in covered)
+                if live or (key and covered and all(entry['keys'].get(root) == key for entry in covered)):
+                    continue
+                summaries = summarize_runs(self._load_root(root))
+                key = current_snapshot_key(root, self.snapshot_dir)
+                for run_id, summary in summaries.items():
+                    previous = self.entries.get(run_id, {})
+                    summary['roots'] = sorted(set(previous.get('roots', [])) | {root})
+                    summary['keys'] = {**previous.get('keys', {}), root: key}
+                self._merge(summaries)
+                scanned += 1
+        except Exception:
+            logger.exception("Run index scan failed")
+        if scanned:
+            logger.info("Indexed %d run directories", scanned)
+        return scanned
+
+    def runs(self) -> List[Dict]:
+        """Every indexed run, newest first, marked live when it is in the live sensor set"""
+        with self._lock:
+            runs = [{**entry, 'live': run_id in self.live_runs} for run_id, entry in self.entries.items()]
+        return sorted(runs, key=lambda run: run.get('start') or 0, reverse=True)
+
+    def _cached(self, key: Tuple[str, ...]) -> Optional[SensorStore]:
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is None:
+                return None
+            self._cache.move_to_end(key)
+            return hit[0]
+
+    def _remember(self, key: Tuple[str, ...], store: SensorStore, live: bool) -> None:
+        with self._lock:
+            self._cache[key] = (store, live)
+            self._cache.move_to_end(key)
+            total = sum(_store_bytes(cached) for cached, _ in self._cache.values())
+            while len(self._cache) > 1 and (len(self._cache) > self.cache_entries or total > self.cache_bytes):
+                _, (evicted, _) = self._cache.popitem(last=False)
+                total -= _store_bytes(evicted)
+
+    def load(self, run_id: str) -> SensorStore:
+        """Rows of a run outside the live set, renumbered to ids that cannot collide with live ones"""
+        key = (run_id,)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            entry = self.entries.get(run_id)
+        if entry is None:
+            return SensorStore.empty()
+
+        store = SensorStore.concat([self._load_root(root) for root in entry['roots']])
+        if run_id not in store.tables['run_id']:
+            return SensorStore.empty()
+        store = store.take(store['run_id_code'] == store.tables['run_id'].index(run_id))
+        columns = dict(store.columns)
+        columns['id'] = entry['number'] * RUN_ID_STRIDE + np.arange(1, len(store) + 1, dtype=np.int64)
+        store = SensorStore(columns, store.tables)
+        self._remember(key, store, live=False)
+        return store
+
+    def scope(self, live: SensorStore, run_ids: Sequence[str]) -> SensorStore:
+        """The selected runs: live ones sliced from the live set, the others loaded on demand"""
+        key = tuple(sorted(set(run_id for run_id in run_ids if run_id)))
+        if not key:
+            return live
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        live_codes = [live.tables['run_id'].index(run_id) for run_id in key if run_id in live.tables['run_id']]
+        parts = [live.take(np.isin(live['run_id_code'], live_codes))] if live_codes else []
+        parts += [self.load(run_id) for run_id in key if run_id not in live.tables['run_id']]
+        store = SensorStore.concat(parts) if parts else SensorStore.empty()
+        if len(key) > 1 or live_codes:
+            self._remember(key, store, live=bool(live_codes))
+        return store
+
+    def find(self, sensor_id: int) -> Optional[Tuple[SensorStore, int]]:
+        """(store, row) of a sensor id handed out by load(), or None"""
+        number = sensor_id // RUN_ID_STRIDE
+        with self._lock:
+            run_id = next((run_id for run_id, entry in self.entries.items() if entry['number'] == number), None)
+        if run_id is None:
+            return None
+        store = self.load(run_id)
+        row = store.find(sensor_id)
+        return None if row is None else (store, row)
@@ -0,0 +1,302 @@
+"""
+Columnar in-memory store for sensor records
+"""
+import hashlib
+import json
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Optional
+from config import CLASSIFICATION
+
+# Float columns and the (section, key) path they are read from in a sensor record
+FLOAT_COLUMNS = {
+    'combined_score': ('scores', 'combined_score'),
+    'image_score': ('scores', 'image_score'),
+    'sensor_boost': ('scores', 'sensor_boost'),
+    'temperature': ('sensor_data', 'temperature'),
+    'humidity': ('sensor_data', 'humidity'),
+    'pressure': ('sensor_data', 'pressure'),
+    'temperature_baseline': ('sensor_baseline', 'temperature_baseline'),
+    'humidity_baseline': ('sensor_baseline', 'humidity_baseline'),
+    'pressure_baseline': ('sensor_baseline', 'pressure_baseline'),
+    'delta_temperature': ('sensor_anomalies', 'delta_temperature'),
+    'delta_humidity': ('sensor_anomalies', 'delta_humidity'),
+    'delta_pressure': ('sensor_anomalies', 'delta_pressure'),
+    'capture_ts': (None, 'capture_ts'),
+    'video_timestamp_sec': (None, 'video_timestamp_sec'),
+    'pipeline_latency_s': ('timing', 'total_pipeline_latency_s'),
+    'queue_wait_s': ('timing', 'queue_wait_s'),
+    'infer_dispatch_s': ('timing', 'fsm_infer_dispatch_s'),
+    'backend_inference_s': ('timing', 'backend_inference_s'),
+    'inference_cold_start': ('timing', 'backend_inference_cold_start'),
+    'capture_to_processor_s': ('timing', 'collector_capture_to_processor_receive_s'),
+    'flapping': ('flags', 'flapping'),
+    'drift': ('flags', 'drift'),
+    'conflict': ('flags', 'conflict'),
+}
+
+# Columns holding free-form strings, kept as object arrays
+STRING_COLUMNS = {
+    'timestamp': (None, 'timestamp'),
+    'state': (None, 'state'),
+    'image_file': (None, 'image_file'),
+    'source_file': (None, 'source_file'),
+    'sensor_prediction': ('scores', 'sensor_prediction'),
+}
+
+# Columns interned into small integer codes plus a lookup table
+INTERNED_COLUMNS = ['camera_id', 'run_id', 'run_dir', 'model_tier', 'backend']
+
+# Nested record sections rebuilt by SensorStore.record()
+RECORD_SECTIONS = ['scores', 'sensor_data', 'sensor_baseline', 'sensor_anomalies', 'timing', 'flags']
+
+
+def _read_path(record: Dict, section: Optional[str], key: str):
+    """Read a value from a sensor record, optionally from a nested section"""
+    source = (record.get(section) or {}) if section else record
+    return source.get(key)
+
+
+def _write_path(record: Dict, section: Optional[str], key: str, value) -> None:
+    """Write a value into a sensor record, optionally into a nested section"""
+    if section is None:
+        record[key] = value
+    elif value is not None:
+        record[section][key] = value
+
+
+def _to_float(value) -> float:
+    """Convert a record value to float, using NaN for missing data"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class SensorStore:
+    """Column-oriented collection of sensor records backed by NumPy arrays"""
+
+    def __init__(self, columns: Dict[str, np.ndarray], tables: Dict[str, List[str]]):
+        self.columns = columns
+        self.tables = tables
+        self._prediction_counts = None
+        self._id_order = None
+        self._fingerprint = None
+        self._spatial_index = None
+        self._time_index = None
+        self._risk = None
+
+    @classmethod
+    def empty(cls) -> 'SensorStore':
+        """Create a store with no rows"""
+        return cls.from_records([])
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict]) -> 'SensorStore':
+        """Build a store from sensor records as produced by data_loader"""
+        records = list(records)
+        n = len(records)
+
+        ids = np.empty(n, dtype=np.int64)
+        lat = np.full(n, np.nan)
+        lon = np.full(n, np.nan)
+        prediction = np.zeros(n, dtype=np.int8)
+        floats = {name: np.full(n, np.nan) for name in FLOAT_COLUMNS}
+        strings = {name: np.empty(n, dtype=object) for name in STRING_COLUMNS}
+        codes = {name: np.empty(n, dtype=np.int32) for name in INTERNED_COLUMNS}
+        lookups = {name: {} for name in INTERNED_COLUMNS}
+
+        for i, record in enumerate(records):
+            ids[i] = record.get('id', i + 1)
+            location = record.get('location')
+            if location:
+                lat[i], lon[i] = location
+            prediction[i] = record.get('prediction', 0) or 0
+            for name, (section, key) in FLOAT_COLUMNS.items():
+                floats[name][i] = _to_float(_read_path(record, section, key))
+            for name, (section, key) in STRING_COLUMNS.items():
+                value = _read_path(record, section, key)
+                strings[name][i] = 'N/A' if value is None else value
+            for name in INTERNED_COLUMNS:
+                value = record.get(name) or 'Unknown'
+                codes[name][i] = lookups[name].setdefault(value, len(lookups[name]))
+
+        columns = {'id': ids, 'lat': lat, 'lon': lon, 'prediction': prediction}
+        columns.update(floats)
+        columns.update(strings)
+        columns.update({f'{name}_code': codes[name] for name in INTERNED_COLUMNS})
+        tables = {name: list(lookups[name]) for name in INTERNED_COLUMNS}
+        return cls(columns, tables)
+
+    def __len__(self) -> int:
+        return len(self.columns['id'])
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self.record(i)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def find(self, sensor_id: int) -> Optional[int]:
+        """Row index of a sensor id, or None if it is not in the store"""
+        ids = self.columns['id']
+        if self._id_order is None:
+            self._id_order = np.argsort(ids, kind='stable')
+        pos = np.searchsorted(ids, sensor_id, sorter=self._id_order)
+        if pos < len(ids) and ids[self._id_order[pos]] == sensor_id:
+            return int(self._id_order[pos])
+        return None
+
+    def fingerprint(self) -> str:
+        """Content hash of the whole store, used to key derived artifacts such as rendered maps"""
+        if self._fingerprint is None:
+            digest = hashlib.sha1()
+            for name in sorted(self.columns):
+                column = self.columns[name]
+                digest.update(name.encode())
+                if column.dtype.kind in 'OU':
+                    digest.update('\x1f'.join(map(str, column)).encode())
+                else:
+                    digest.update(np.ascontiguousarray(column).tobytes())
+            digest.update(json.dumps(self.tables, sort_keys=True).encode())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def row_key(self, i: int) -> str:
+        """Content hash of a single row, stable across stores holding the same record"""
+        parts = []
+        for name in sorted(self.columns):
+            value = self.columns[name][i]
+            if name.endswith('_code'):
+                value = self.tables[name[:-len('_code')]][value]
+            parts.append(f"{name}={value}")
+        return hashlib.sha1('\x1f'.join(parts).encode()).hexdigest()
+
+    def labels(self, name: str) -> np.ndarray:
+        """Return an interned column decoded back to its string values"""
+        table = np.asarray(self.tables[name] or ['Unknown'], dtype=object)
+        return table[self.columns[f'{name}_code']]
+
+    def has_location(self) -> np.ndarray:
+        """Boolean mask of rows with a usable location"""
+        return ~(np.isnan(self.columns['lat']) | np.isnan(self.columns['lon']))
+
+    def spatial_index(self):
+        """Grid index over row locations for bounding-box and radius queries, built on first use"""
+        if self._spatial_index is None:
+            from spatial_index import SpatialIndex
+            self._spatial_index = SpatialIndex(self.columns['lat'], self.columns['lon'])
+        return self._spatial_index
+
+    def time_index(self):
+        """Capture-time index with cumulative per-level counts, built on first use"""
+        if self._time_index is None:
+            from time_index import TimeIndex, frame_times
+            times = frame_times(self.columns['capture_ts'], self.columns['timestamp'])
+            self._time_index = TimeIndex(times, self.columns['prediction'])
+        return self._time_index
+
+    def risk(self):
+        """Baseline z-scores, per-camera trends and risk scores of every row, computed on first use"""
+        if self._risk is None:
+            from risk_analytics import score_risk
+            self._risk = score_risk(self)
+        return self._risk
+
+    def window(self, start: Optional[float] = None, end: Optional[float] = None) -> 'SensorStore':
+        """Rows captured between start and end (epoch seconds), in their original order"""
+        if start is None and end is None:
+            return self
+        return self.take(np.sort(self.time_index().rows_between(start, end)))
+
+    def take(self, index) -> 'SensorStore':
+        """Return a new store with the rows selected by a mask or index array"""
+        columns = {name: column[index] for name, column in self.columns.items()}
+        return SensorStore(columns, self.tables)
+
+    def drop_sources(self, source_files: Iterable[str]) -> 'SensorStore':
+        """Return a new store without the rows loaded from the given files"""
+        source_files = list(source_files)
+        if not source_files:
+            return self
+        return self.take(~np.isin(self.columns['source_file'], source_files))
+
+    @classmethod
+    def concat(cls, stores: List['SensorStore']) -> 'SensorStore':
+        """Append stores row-wise, merging their interned lookup tables"""
+        stores = [store for store in stores if len(store)] or stores[:1] or [cls.empty()]
+        if len(stores) == 1:
+            return stores[0]
+
+        tables = {name: [] for name in INTERNED_COLUMNS}
+        remapped = {name: [] for name in INTERNED_COLUMNS}
+        for name in INTERNED_COLUMNS:
+            lookup = {}
+            for store in stores:
+                mapping = np.array([lookup.setdefault(value, len(lookup))
+                                    for value in store.tables[name]], dtype=np.int32)
+                remapped[name].append(mapping[store.columns[f'{name}_code']])
+            tables[name] = list(lookup)
+
+        columns = {}
+        for name in stores[0].columns:
+            columns[name] = np.concatenate([store.columns[name] for store in stores])
+        for name in INTERNED_COLUMNS:
+            columns[f'{name}_code'] = np.concatenate(remapped[name])
+        return cls(columns, tables)
+
+    def filter(self, prediction: Optional[int] = None, camera_id: Optional[str] = None,
+               min_score: Optional[float] = None) -> 'SensorStore':
+        """Filter rows by classification level, camera and minimum combined score"""
+        mask = np.ones(len(self), dtype=bool)
+        if prediction is not None:
+            mask &= self.columns['prediction'] == prediction
+        if camera_id is not None:
+            if camera_id not in self.tables['camera_id']:
+                return self.take(np.zeros(len(self), dtype=bool))
+            mask &= self.columns['camera_id_code'] == self.tables['camera_id'].index(camera_id)
+        if min_score is not None:
+            mask &= self.columns['combined_score'] >= min_score
+        return self.take(mask)
+
+    def prediction_counts(self) -> Dict[int, int]:
+        """Count rows per classification level in a single pass"""
+        if self._prediction_counts is None:
+            counts = np.bincount(self.columns['prediction'].astype(np.intp),
+                                 minlength=len(CLASSIFICATION))
+            self._prediction_counts = {level: int(count) for level, count in enumerate(counts)}
+        return self._prediction_counts
+
+    def count_by_prediction(self, prediction_level: int) -> int:
+        """Count rows with a specific prediction level"""
+        return self.prediction_counts().get(prediction_level, 0)
+
+    def column_stats(self, name: str) -> Dict[str, float]:
+        """Min/mean/max of a numeric column, ignoring missing values"""
+        values = self.columns[name]
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return {'min': np.nan, 'mean': np.nan, 'max': np.nan}
+        return {'min': float(values.min()), 'mean': float(values.mean()), 'max': float(values.max())}
+
+    def record(self, i: int) -> Dict:
+        """Materialize one row as a sensor record dict"""
+        c = self.columns
+        location = None
+        if not (np.isnan(c['lat'][i]) or np.isnan(c['lon'][i])):
+            location = (float(c['lat'][i]), float(c['lon'][i]))
+
+        record = {
+            'id': int(c['id'][i]),
+            'location': location,
+            'prediction': int(c['prediction'][i]),
+            **{section: {} for section in RECORD_SECTIONS},
+        }
+        for name, (section, key) in FLOAT_COLUMNS.items():
+            value = c[name][i]
+            _write_path(record, section, key, None if np.isnan(value) else float(value))
+        for name, (section, key) in STRING_COLUMNS.items():
+            _write_path(record, section, key, c[name][i])
+        for name in INTERNED_COLUMNS:
+            record[name] = self.tables[name][c[f'{name}_code'][i]]
+        return record
@@ -0,0 +1,373 @@
+"""
+Incremental watcher that hot-appends new or changed detection files
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import numpy as np
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from config import (DATA_ROOT, WATCH_MANIFEST_FILE, WATCH_POLL_INTERVAL_S, WATCH_LATEST_RUNS, LOADER_WORKERS,
+                    SNAPSHOT_DIR)
+from data_loader import LoadReport, discover_sensor_files, default_data_roots, iter_sensors
+from sensor_store import SensorStore
+from snapshot import current_snapshot_key, load_snapshot, write_snapshot
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(path: str) -> str:
+    """Content hash of a file"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileManifest:
+    """Persistent mtime/size/hash record of every parsed file
+
+    Files that failed to parse are recorded too, with their error, so they are retried only once
+    they change instead of on every poll.
+    """
+
+    def __init__(self, path: str = WATCH_MANIFEST_FILE):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.dirty = False
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable manifest %s: %s", path, e)
+
+    def save(self) -> None:
+        """Write the manifest atomically"""
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def diff(self, paths: Sequence[str]) -> Tuple[List[str], List[str]]:
+        """Return (new or changed files, removed files) relative to the manifest"""
+        changed = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = self.entries.get(path)
+            if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                continue
+            if entry and entry['sha1'] == file_digest(path):
+                # Touched but unchanged: refresh the stat fields only
+                entry['mtime'], entry['size'] = stat.st_mtime, stat.st_size
+                self.dirty = True
+                continue
+            changed.append(path)
+        present = set(paths)
+        removed = [path for path in self.entries if path not in present]
+        return changed, removed
+
+    def update(self, path: str, error: Optional[str] = None) -> None:
+        """Record a freshly parsed file, or one that failed to parse with its error"""
+        stat = os.stat(path)
+        self.entries[path] = {
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'sha1': file_digest(path),
+        }
+        if error is not None:
+            self.entries[path]['error'] = error
+
+    def remove(self, path: str) -> None:
+        self.entries.pop(path, None)
+
+    def hashes(self, paths: Sequence[str]) -> Dict[str, str]:
+        """Content hashes of the given files as last recorded"""
+        return {path: self.entries[path]['sha1'] for path in paths if path in self.entries}
+
+
+class SensorWatcher:
+    """Watch the data roots and push only new or changed detections into a SensorStore
+
+    Without explicit roots every run directory is watched, or only the newest latest_runs; a run
+    that falls out of that window leaves the live store and stays reachable through the run registry.
+
+    With a lock file only the process holding it parses files and writes the manifest and snapshots;
+    the other server workers reload the snapshots it writes. The lock is retried on every poll and is
+    released when its holder exits.
+
+    With inotify every directory below the roots is watched, and directories created later (new run
+    directories under DATA_ROOT, or nested ones) are watched as they appear; the poll interval remains
+    a fallback for filesystems that do not deliver events.
+    """
+
+    def __init__(self, on_update: Callable[[SensorStore, SensorStore], None],
+                 roots: Optional[Sequence[str]] = None,
+                 manifest_path: str = WATCH_MANIFEST_FILE,
+                 poll_interval: float = WATCH_POLL_INTERVAL_S,
+                 workers: int = LOADER_WORKERS,
+                 snapshot_dir: str = SNAPSHOT_DIR,
+                 latest_runs: Optional[int] = WATCH_LATEST_RUNS,
+                 lock_path: Optional[str] = None):
+        self.on_update = on_update
+        self.roots = roots
+        self.latest_runs = latest_runs
+        self.manifest = FileManifest(manifest_path)
+        self.snapshot_dir = snapshot_dir
+        self.poll_interval = poll_interval
+        self.workers = workers
+        self.lock_path = lock_path
+        self._lock_file = None
+        self.store = SensorStore.empty()
+        self.report = LoadReport()
+        # Content hash of every file in the store, and the snapshot each root pointed at when loaded
+        self._file_hashes: Dict[str, str] = {}
+        self._snapshot_keys: Dict[str, Optional[str]] = {}
+        # Watched directory of each inotify watch descriptor
+        self._watched: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _current_roots(self) -> List[str]:
+        return list(self.roots) if self.roots else default_data_roots(self.latest_runs)
+
+    def _try_lock(self):
+        """The lock file, locked, or None when another process holds it"""
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def holds_lock(self) -> bool:
+        """Whether this process is the one writer, taking over the lock if it is free"""
+        if self.lock_path is None or fcntl is None:
+            return True
+        if self._lock_file is None:
+            lock_file = self._try_lock()
+            if lock_file is None:
+                return False
+            self._lock_file = lock_file
+            # The previous holder kept the manifest and snapshots up to date until now
+            self.manifest = FileManifest(self.manifest.path)
+            self.follow_once()
+        return True
+
+    def _current_snapshot_keys(self) -> Dict[str, Optional[str]]:
+        return {root: current_snapshot_key(root, self.snapshot_dir) for root in self._current_roots()}
+
+    def _parse(self, paths: List[str]) -> SensorStore:
+        """Parse the given files and record them, including those that failed, in the manifest"""
+        records = []
+        for record in iter_sensors(files=paths, workers=self.workers, report=self.report):
+            self.manifest.update(record['source_file'])
+            records.append(record)
+        parsed = {record['source_file'] for record in records}
+        for path in paths:
+            if path not in parsed:
+                try:
+                    self.manifest.update(path, error=self.report.failures.get(path, "no record"))
+                except OSError:
+                    # Removed since it was listed; the next poll drops it
+                    pass
+        return SensorStore.from_records(records)
+
+    def _write_snapshots(self, roots: Sequence[str]) -> None:
+        """Persist the rows of each given run directory as a binary snapshot
+
+        A directory with no rows left (every file removed or failing to parse) gets an empty snapshot,
+        so followers and the next start drop its old rows.
+        """
+        sources = self.store['source_file'].astype(str)
+        for root in roots:
+            prefix = os.path.join(root, '')
+            run = self.store.take(np.char.startswith(sources, prefix))
+            # Files that failed to parse are part of the key, so they are not re-parsed on the next start
+            files = [path for path in self.manifest.entries if path.startswith(prefix)]
+            write_snapshot(root, run, self.manifest.hashes(files), self.snapshot_dir)
+
+    def _roots_of(self, paths: Sequence[str]) -> List[str]:
+        """Run directories containing any of the given files"""
+        return [root for root in self._current_roots()
+                if any(path.startswith(os.path.join(root, '')) for path in paths)]
+
+    def initial_load(self) -> SensorStore:
+        """Memory-map run snapshots and parse JSON only for files missing from them or changed
+
+        The manifest and snapshots are written only when no other process holds the lock. The lock is
+        not kept: a server preloading the app forks its workers afterwards, and one of them takes it.
+        """
+        load_lock = None
+        if self.lock_path is not None and fcntl is not None and self._lock_file is None:
+            load_lock = self._try_lock()
+        writer = load_lock is not None or self.holds_lock()
+        try:
+            return self._initial_load(writer)
+        finally:
+            if load_lock is not None:
+                load_lock.close()
+
+    def _initial_load(self, writer: bool) -> SensorStore:
+        roots = self._current_roots()
+        paths = discover_sensor_files(roots)
+        changed, removed = self.manifest.diff(paths)
+        for path in removed:
+            self.manifest.remove(path)
+
+        snapshots, snapshot_hashes = [], {}
+        for root in roots:
+            loaded = load_snapshot(root, self.snapshot_dir)
+            if loaded:
+                snapshots.append(loaded[0])
+                snapshot_hashes.update(loaded[1])
+
+        # A file is reusable when the manifest vouches it is unchanged and the snapshot holds the same content
+        stale = set(changed)
+        for path in paths:
+            entry = self.manifest.entries.get(path)
+            if not entry or snapshot_hashes.get(path) != entry['sha1']:
+                stale.add(path)
+
+        cached = SensorStore.concat(snapshots)
+        if len(cached):
+            keep = np.isin(cached['source_file'].astype(str), [p for p in paths if p not in stale])
+            if not keep.all():
+                cached = cached.take(keep)
+        self.store = cached
+        parsed = self._parse([path for path in paths if path in stale])
+        self.store = SensorStore.concat([cached, parsed])
+        self._file_hashes = self.manifest.hashes(paths)
+        if writer:
+            self.manifest.save()
+            if stale or removed or len(snapshot_hashes) != len(paths):
+                self._write_snapshots(roots)
+        self._snapshot_keys = self._current_snapshot_keys()
+        logger.info("Loaded %d rows from snapshots and parsed %d sensor files", len(cached), len(parsed))
+        return self.store
+
+    def poll_once(self) -> Optional[SensorStore]:
+        """Rescan the data roots and apply any changes, returning the delta if there was one"""
+        paths = discover_sensor_files(self._current_roots())
+        changed, removed = self.manifest.diff(paths)
+        if not changed and not removed:
+            if self.manifest.dirty:
+                self.manifest.save()
+            return None
+
+        for path in removed:
+            self.manifest.remove(path)
+        base = self.store.drop_sources(changed + removed)
+        self.store = base
+        delta = self._parse(changed)
+        self.store = SensorStore.concat([base, delta])
+        self._file_hashes = self.manifest.hashes(paths)
+        self.manifest.save()
+        self._write_snapshots(self._roots_of(changed + removed))
+        self._snapshot_keys = self._current_snapshot_keys()
+        logger.info("Applied %d new/changed and %d removed sensor files", len(changed), len(removed))
+        self.on_update(self.store, delta)
+        return delta
+
+    def follow_once(self) -> Optional[SensorStore]:
+        """Reload the store from the snapshots the lock holder wrote, if any changed; returns the delta"""
+        keys = self._current_snapshot_keys()
+        if keys == self._snapshot_keys:
+            return None
+        snapshots, hashes = [], {}
+        for root, key in keys.items():
+            loaded = load_snapshot(root, self.snapshot_dir) if key else None
+            if loaded:
+                snapshots.append(loaded[0])
+                hashes.update(loaded[1])
+        self._snapshot_keys = keys
+        changed = [path for path, sha1 in hashes.items() if self._file_hashes.get(path) != sha1]
+        removed = [path for path in self._file_hashes if path not in hashes]
+        if not changed and not removed:
+            return None
+
+        self.store = SensorStore.concat(snapshots)
+        self._file_hashes = hashes
+        delta = self.store.take(np.isin(self.store['source_file'].astype(str), changed))
+        logger.info("Followed %d new/changed and %d removed sensor files", len(changed), len(removed))
+        self.on_update(self.store, delta)
+        return delta
+
+    def _wait_for_changes(self, inotify) -> None:
+        """Block until a filesystem event arrives or the poll interval elapses"""
+        if inotify is None:
+            self._stop.wait(self.poll_interval)
+            return
+        for event in inotify.read(timeout=int(self.poll_interval * 1000)):
+            if event.mask & inotify_flags.IGNORED:
+                self._watched.pop(event.wd, None)
+            elif event.mask & inotify_flags.ISDIR and event.mask & (inotify_flags.CREATE | inotify_flags.MOVED_TO):
+                parent = self._watched.get(event.wd)
+                if parent is not None:
+                    # Files written before the watch was added are found by the poll this event triggers
+                    self._watch_tree(inotify, os.path.join(parent, event.name))
+
+    def _watch_tree(self, inotify, directory: str) -> None:
+        """Watch a directory and every directory below it"""
+        mask = (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.MOVED_FROM |
+                inotify_flags.DELETE | inotify_flags.CREATE)
+        for path, _, _ in os.walk(directory):
+            try:
+                self._watched[inotify.add_watch(path, mask)] = path
+            except OSError as e:
+                logger.warning("Cannot watch %s: %s", path, e)
+
+    def _make_inotify(self):
+        if INotify is None:
+            return None
+        inotify = INotify()
+        self._watched = {}
+        for root in self._current_roots():
+            if os.path.isdir(root):
+                self._watch_tree(inotify, root)
+        if not self.roots and os.path.isdir(DATA_ROOT):
+            # New run directories appear here; the tree of each is watched once it is created
+            mask = inotify_flags.CREATE | inotify_flags.MOVED_TO | inotify_flags.ONLYDIR
+            self._watched[inotify.add_watch(DATA_ROOT, mask)] = DATA_ROOT
+        return inotify
+
+    def _run(self) -> None:
+        inotify = self._make_inotify()
+        logger.info("Watching %s using %s", self._current_roots(), "inotify" if inotify else "polling")
+        while not self._stop.is_set():
+            self._wait_for_changes(inotify)
+            try:
+                if self.holds_lock():
+                    self.poll_once()
+                else:
+                    self.follow_once()
+            except Exception:
+                logger.exception("Sensor watcher poll failed")
+
+    def start(self) -> None:
+        """Start watching in a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sensor-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
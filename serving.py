@@ -0,0 +1,147 @@
+"""
+Production serving: gzip for Dash assets and JSON, and a preloading multi-worker gunicorn server
+"""
+import gzip
+import logging
+import os
+import threading
+from typing import Dict
+import dash
+import flask
+from config import GZIP_MIN_BYTES, GZIP_LEVEL, SERVER_THREADS, SERVER_TIMEOUT_S
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+logger = logging.getLogger(__name__)
+
+# Response types worth compressing; images and precompressed bodies are left alone
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/geo+json',
+    'application/javascript',
+    'text/javascript',
+    'text/css',
+    'text/html',
+    'text/plain',
+    'image/svg+xml',
+}
+
+_background_lock = threading.Lock()
+
+
+def enable_gzip(server: flask.Flask, min_bytes: int = GZIP_MIN_BYTES, level: int = GZIP_LEVEL) -> None:
+    """Gzip compressible responses for clients that accept it
+
+    Server-sent event streams, partial (Range) responses and bodies that already carry a
+    Content-Encoding, such as the precompressed map and density layers, pass through unchanged.
+    """
+    @server.after_request
+    def gzip_response(response: flask.Response) -> flask.Response:
+        if (response.status_code != 200
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or (response.is_streamed and not response.direct_passthrough)
+                or not flask.request.accept_encodings['gzip']):
+            return response
+        if response.content_length is not None and response.content_length < min_bytes:
+            return response
+        # Files sent with send_file are read into memory; only text assets get this far
+        response.direct_passthrough = False
+        body = response.get_data()
+        if len(body) < min_bytes:
+            return response
+        response.set_data(gzip.compress(body, compresslevel=level))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+def start_background(app: dash.Dash) -> None:
+    """Start the data watcher, pin reports, run indexing and metrics flushing once in the current process
+
+    Threads do not survive a fork, so a preloaded server calls this in every worker after forking.
+    Every worker runs the watcher loop, but only the one holding its lock file parses new files; the
+    others follow the snapshots it writes.
+    An app built for a fast start first loads its data in a thread while the server already answers.
+    """
+    with _background_lock:
+        if getattr(app, 'background_pid', None) == os.getpid():
+            return
+        app.background_pid = os.getpid()
+    if getattr(app, 'metrics_sharing', None) is not None:
+        app.metrics_sharing.start()
+    if getattr(app, 'deferred_load', None) is not None:
+        threading.Thread(target=_load_then_watch, args=(app,), name="startup-load", daemon=True).start()
+    else:
+        _start_watching(app)
+
+
+def _start_watching(app: dash.Dash) -> None:
+    app.watcher.start()
+    app.pin_reports.schedule(app.sensors_data)
+    # Runs outside the live set are summarized from their snapshots, parsing any that have none
+    threading.Thread(target=app.runs.scan, name="run-index", daemon=True).start()
+
+
+def _load_then_watch(app: dash.Dash) -> None:
+    try:
+        loaded = app.deferred_load()
+    except Exception as e:
+        logger.exception("Background startup load failed")
+        app.startup.fail(str(e))
+        return
+    if loaded is not None:
+        _start_watching(app)
+
+
+def start_background_on_first_request(app: dash.Dash) -> None:
+    """Fallback for WSGI servers without a post-fork hook: start background work on the first request"""
+    @app.server.before_request
+    def ensure_background():
+        start_background(app)
+
+
+if BaseApplication is not None:
+    class PreloadedServer(BaseApplication):
+        """Gunicorn server forking workers from an app built once in the master process
+
+        Sensor data, the rendered map and density layers are shared copy-on-write, so adding
+        workers does not re-parse data or re-render the map.
+        """
+
+        def __init__(self, app: dash.Dash, options: Dict):
+            self.dash_app = app
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+            self.cfg.set('preload_app', True)
+            self.cfg.set('post_fork', lambda server, worker: start_background(self.dash_app))
+
+        def load(self):
+            return self.dash_app.server
+else:
+    PreloadedServer = None
+
+
+def run_production(app: dash.Dash, host: str, port: int, workers: int, threads: int = SERVER_THREADS) -> None:
+    """Serve with forked gunicorn workers, or from one threaded process when gunicorn is missing"""
+    if PreloadedServer is None:
+        logger.warning("gunicorn is not installed; serving from a single threaded process")
+        start_background(app)
+        app.run_server(debug=False, host=host, port=port, threaded=True)
+        return
+
+    PreloadedServer(app, {
+        'bind': f"{host}:{port}",
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'timeout': SERVER_TIMEOUT_S,
+        'accesslog': '-',
+    }).run()
@@ -0,0 +1,115 @@
+"""
+Binary per-run snapshots of parsed sensor columns, memory-mapped on load
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from typing import Dict, Optional, Tuple
+import numpy as np
+from config import SNAPSHOT_DIR
+from sensor_store import SensorStore, STRING_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 5
+
+
+def _snapshot_name(root: str) -> str:
+    """Filesystem-safe name for a run directory"""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', os.path.normpath(root)).strip('_')
+
+
+def snapshot_key(file_hashes: Dict[str, str]) -> str:
+    """Key a snapshot by the content hashes of its source files"""
+    digest = hashlib.sha1(f"v{SNAPSHOT_VERSION}".encode())
+    for path in sorted(file_hashes):
+        digest.update(f"{path}\0{file_hashes[path]}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def _pointer_path(root: str, snapshot_dir: str) -> str:
+    return os.path.join(snapshot_dir, f"{_snapshot_name(root)}.current")
+
+
+def write_snapshot(root: str, store: SensorStore, file_hashes: Dict[str, str],
+                   snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    """Write one .npy file per column for a run and point the run at it"""
+    key = snapshot_key(file_hashes)
+    name = _snapshot_name(root)
+    target = os.path.join(snapshot_dir, f"{name}-{key}")
+    pointer = _pointer_path(root, snapshot_dir)
+
+    if not os.path.isdir(target):
+        # Per-process temporary names: several server workers may snapshot the same run at once
+        tmp_target = f"{target}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_target, ignore_errors=True)
+        os.makedirs(tmp_target)
+        for column, values in store.columns.items():
+            if column in STRING_COLUMNS:
+                values = np.asarray([str(value) for value in values], dtype=str)
+            np.save(os.path.join(tmp_target, f"{column}.npy"), values, allow_pickle=False)
+        meta = {
+            'version': SNAPSHOT_VERSION,
+            'key': key,
+            'root': root,
+            'rows': len(store),
+            'columns': list(store.columns),
+            'tables': store.tables,
+            'files': file_hashes,
+        }
+        with open(os.path.join(tmp_target, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        try:
+            os.replace(tmp_target, target)
+        except OSError:
+            # Another process wrote the same snapshot first
+            shutil.rmtree(tmp_target, ignore_errors=True)
+
+    previous = _read_pointer(pointer)
+    tmp_pointer = f"{pointer}.tmp{os.getpid()}"
+    with open(tmp_pointer, 'w', encoding='utf-8') as f:
+        f.write(key)
+    os.replace(tmp_pointer, pointer)
+    if previous and previous != key:
+        shutil.rmtree(os.path.join(snapshot_dir, f"{name}-{previous}"), ignore_errors=True)
+    return target
+
+
+def _read_pointer(pointer: str) -> Optional[str]:
+    try:
+        with open(pointer, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def current_snapshot_key(root: str, snapshot_dir: str = SNAPSHOT_DIR) -> Optional[str]:
+    """Key of the snapshot a run currently points at, or None if it has none"""
+    return _read_pointer(_pointer_path(root, snapshot_dir))
+
+
+def load_snapshot(root: str, snapshot_dir: str = SNAPSHOT_DIR) -> Optional[Tuple[SensorStore, Dict[str, str]]]:
+    """Memory-map the current snapshot of a run, returning (store, file hashes) or None"""
+    key = _read_pointer(_pointer_path(root, snapshot_dir))
+    if key is None:
+        return None
+
+    target = os.path.join(snapshot_dir, f"{_snapshot_name(root)}-{key}")
+    try:
+        with open(os.path.join(target, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != SNAPSHOT_VERSION or set(meta['columns']) != set(SensorStore.empty().columns):
+            logger.info("Discarding outdated snapshot for %s", root)
+            return None
+        columns = {
+            column: np.load(os.path.join(target, f"{column}.npy"), mmap_mode='r', allow_pickle=False)
+            for column in meta['columns']
+        }
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("Ignoring unreadable snapshot for %s: %s", root, e)
+        return None
+
+    return SensorStore(columns, meta['tables']), meta['files']
@@ -0,0 +1,88 @@
+"""
+Uniform-grid spatial index over sensor locations for bounding-box and radius queries
+"""
+from typing import Optional, Tuple
+import numpy as np
+from config import SPATIAL_CELL_DEG
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distance in metres from one point to many"""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+class SpatialIndex:
+    """Rows with a location bucketed into square lat/lon cells and sorted by cell
+
+    A query visits only the cells overlapping its bounding box: one binary search per cell row,
+    then an exact filter over the candidates.
+    """
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, cell_deg: float = SPATIAL_CELL_DEG):
+        self.cell_deg = cell_deg
+        rows = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        cell_y = np.floor(lat[rows] / cell_deg).astype(np.int64)
+        cell_x = np.floor(lon[rows] / cell_deg).astype(np.int64)
+        self.y0 = int(cell_y.min()) if len(rows) else 0
+        self.x0 = int(cell_x.min()) if len(rows) else 0
+        self.ny = int(cell_y.max()) - self.y0 + 1 if len(rows) else 0
+        self.nx = int(cell_x.max()) - self.x0 + 1 if len(rows) else 0
+
+        keys = (cell_y - self.y0) * self.nx + (cell_x - self.x0)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.rows = rows[order]
+        self.lat = lat[self.rows]
+        self.lon = lon[self.rows]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _candidates(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Positions (into the sorted arrays) of points in cells overlapping the box"""
+        if not len(self.rows):
+            return np.empty(0, dtype=np.intp)
+        y_lo = max(int(np.floor(south / self.cell_deg)) - self.y0, 0)
+        y_hi = min(int(np.floor(north / self.cell_deg)) - self.y0, self.ny - 1)
+        x_lo = max(int(np.floor(west / self.cell_deg)) - self.x0, 0)
+        x_hi = min(int(np.floor(east / self.cell_deg)) - self.x0, self.nx - 1)
+        if y_lo > y_hi or x_lo > x_hi:
+            return np.empty(0, dtype=np.intp)
+
+        cell_rows = np.arange(y_lo, y_hi + 1) * self.nx
+        starts = np.searchsorted(self.keys, cell_rows + x_lo, side='left')
+        ends = np.searchsorted(self.keys, cell_rows + x_hi, side='right')
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.empty(0, dtype=np.intp)
+        # Concatenate the [start, end) ranges without a Python loop
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        return np.arange(total) + offsets
+
+    def bbox(self, south: float, west: float, north: float, east: float,
+             limit: Optional[int] = None) -> np.ndarray:
+        """Store rows inside a bounding box, in cell order"""
+        positions = self._candidates(south, west, north, east)
+        lat, lon = self.lat[positions], self.lon[positions]
+        inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        rows = self.rows[positions[inside]]
+        return rows[:limit] if limit is not None else rows
+
+    def radius(self, lat: float, lon: float, radius_m: float,
+               limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Store rows within radius_m of a point and their distances, nearest first"""
+        dlat = np.degrees(radius_m / EARTH_RADIUS_M)
+        dlon = dlat / max(np.cos(np.radians(lat)), 1e-6)
+        positions = self._candidates(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        distances = haversine_m(lat, lon, self.lat[positions], self.lon[positions])
+        inside = distances <= radius_m
+        positions, distances = positions[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')[:limit]
+        return self.rows[positions[order]], distances[order]
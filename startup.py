@@ -0,0 +1,89 @@
+"""
+Startup phase timings and the health/readiness endpoints that report them
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+import flask
+
+logger = logging.getLogger(__name__)
+
+STARTING, READY, FAILED = 'starting', 'ready', 'failed'
+
+
+class StartupPhases:
+    """Wall-clock time of each startup phase, measured from process start"""
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.status = STARTING
+        self.error: Optional[str] = None
+        self.ready_after_s: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def ready(self) -> None:
+        self.ready_after_s = time.perf_counter() - self.started_at
+        self.status = READY
+        logger.info("Ready after %.2fs: %s", self.ready_after_s,
+                    ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items()))
+
+    def fail(self, error: str) -> None:
+        self.error = error
+        self.status = FAILED
+
+    @property
+    def is_ready(self) -> bool:
+        return self.status == READY
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            phases = {name: round(seconds, 4) for name, seconds in self.phases.items()}
+        return {
+            'status': self.status,
+            'uptime_s': round(time.perf_counter() - self.started_at, 3),
+            'ready_after_s': round(self.ready_after_s, 4) if self.ready_after_s is not None else None,
+            'phases': phases,
+            'error': self.error,
+        }
+
+
+def register_health_routes(server: flask.Flask, startup: StartupPhases) -> None:
+    """/healthz answers as soon as the server is bound; /readyz only once data is loaded"""
+
+    @server.route('/healthz')
+    def healthz():
+        return flask.jsonify(startup.to_dict())
+
+    @server.route('/readyz')
+    def readyz():
+        return flask.jsonify(startup.to_dict()), 200 if startup.is_ready else 503
+
+
+LOADING_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><meta http-equiv="refresh" content="2">
+<style>body{font-family:Arial,sans-serif;color:#666;display:flex;align-items:center;
+justify-content:center;height:90vh;margin:0}</style></head>
+<body><p>🗺️ Loading sensor data and map&hellip;</p></body></html>"""
+
+
+def loading_response() -> flask.Response:
+    """Placeholder served instead of the map until the first load finishes; it reloads itself"""
+    response = flask.Response(LOADING_PAGE, mimetype='text/html', status=503)
+    response.headers['Retry-After'] = '2'
+    response.cache_control.no_store = True
+    return response
@@ -0,0 +1,61 @@
+"""
+Sorted time index with cumulative per-level counts for window queries and playback
+"""
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+import numpy as np
+from config import CLASSIFICATION
+
+
+def frame_times(capture_ts: np.ndarray, timestamps: np.ndarray) -> np.ndarray:
+    """Epoch seconds per row: the collector capture time, or the parsed metadata timestamp if missing"""
+    times = np.array(capture_ts, dtype=float)
+    for i in np.flatnonzero(np.isnan(times)):
+        try:
+            times[i] = datetime.fromisoformat(str(timestamps[i])).timestamp()
+        except ValueError:
+            pass
+    return times
+
+
+class TimeIndex:
+    """Timed rows sorted by capture time, with prefix sums of each classification level
+
+    A window is located with two binary searches; its per-level counts are differences of the
+    prefix sums, so stepping a window costs O(log n) regardless of how many rows it holds.
+    """
+
+    def __init__(self, times: np.ndarray, prediction: np.ndarray):
+        timed = np.flatnonzero(~np.isnan(times))
+        order = timed[np.argsort(times[timed], kind='stable')]
+        self.rows = order
+        self.times = times[order]
+        levels = np.arange(len(CLASSIFICATION))
+        self.cumulative = np.zeros((len(levels), len(order) + 1), dtype=np.int64)
+        np.cumsum(prediction[order][None, :] == levels[:, None], axis=1, out=self.cumulative[:, 1:])
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def bounds(self) -> Optional[Tuple[float, float]]:
+        """Earliest and latest capture time, or None when no row is timed"""
+        if not len(self.times):
+            return None
+        return float(self.times[0]), float(self.times[-1])
+
+    def span(self, start: Optional[float] = None, end: Optional[float] = None) -> Tuple[int, int]:
+        """Positions [lo, hi) in sorted order of the rows with start <= time <= end"""
+        lo = 0 if start is None else int(np.searchsorted(self.times, start, side='left'))
+        hi = len(self.times) if end is None else int(np.searchsorted(self.times, end, side='right'))
+        return lo, max(lo, hi)
+
+    def rows_between(self, start: Optional[float] = None, end: Optional[float] = None) -> np.ndarray:
+        """Store rows captured within the window, oldest first"""
+        lo, hi = self.span(start, end)
+        return self.rows[lo:hi]
+
+    def counts(self, start: Optional[float] = None, end: Optional[float] = None) -> Dict[int, int]:
+        """Rows per classification level within the window"""
+        lo, hi = self.span(start, end)
+        window = self.cumulative[:, hi] - self.cumulative[:, lo]
+        return {level: int(count) for level, count in enumerate(window)}
@@ -0,0 +1,16 @@
+"""
+WSGI entry point for external servers
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+    uvicorn --interface wsgi --port 8050 wsgi:application
+"""
+from main import create_app, fast_start_enabled
+from serving import start_background_on_first_request
+
+app = create_app(fast_start=fast_start_enabled())
+if app is None:
+    raise RuntimeError("No sensor data found; nothing to serve")
+
+# Servers without a post-fork hook start the watcher and pin reports on the first request
+start_background_on_first_request(app)
+application = app.server